@@ -0,0 +1,107 @@
+"""
+ذاكرة المشرفين - Admin Cache
+قوائم مشرفي المجموعات في الذاكرة بدلاً من سؤال تليجرام عند كل أمر
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from pyrogram import Client
+from pyrogram.enums import ChatMemberStatus, ChatMembersFilter
+from pyrogram.types import ChatMember, ChatMemberUpdated
+from config import ADMIN_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = (ChatMemberStatus.OWNER, ChatMemberStatus.ADMINISTRATOR)
+
+
+class AdminCache:
+    """قائمة مشرفي كل مجموعة مع مدة صلاحية
+
+    القائمة كاملة تُجلب بطلب واحد (get_chat_members بفلتر المشرفين) وتخدم
+    كل فحوص الصلاحيات في المجموعة حتى تنتهي صلاحيتها أو يتغير مشرف.
+    """
+
+    def __init__(self, client: Client, ttl: float = ADMIN_CACHE_TTL):
+        self.client = client
+        self.ttl = ttl
+        # chat_id -> (وقت الانتهاء، المشرفون أو None إذا تعذر جلبهم)
+        self._admins: Dict[int, Tuple[float, Optional[Set[int]]]] = {}
+        self._refreshing: Dict[int, asyncio.Task] = {}
+        self._versions: Dict[int, int] = {}
+        self.checks = 0
+        self.api_calls = 0
+
+    async def is_admin(self, chat_id: int, user_id: int) -> bool:
+        """هل المستخدم مشرف أو مالك في المجموعة"""
+        self.checks += 1
+        admins = await self.get_admins(chat_id)
+        if admins is not None:
+            return user_id in admins
+
+        # تعذر جلب القائمة (مثلاً البوت ليس مشرفاً): فحص العضو مباشرة
+        self.api_calls += 1
+        member = await self.client.get_chat_member(chat_id, user_id)
+        return member.status in ADMIN_STATUSES
+
+    async def get_admins(self, chat_id: int) -> Optional[Set[int]]:
+        """معرفات مشرفي المجموعة (None إذا تعذر جلبها)"""
+        entry = self._admins.get(chat_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+
+        # طلب واحد فقط لكل مجموعة مهما كان عدد الأوامر المنتظرة
+        task = self._refreshing.get(chat_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(chat_id))
+            self._refreshing[chat_id] = task
+        return await asyncio.shield(task)
+
+    def invalidate(self, chat_id: int):
+        """حذف قائمة المجموعة لتُجلب من جديد عند الفحص التالي"""
+        self._admins.pop(chat_id, None)
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+
+    def member_updated(self, update: ChatMemberUpdated):
+        """تغير عضو في مجموعة: تُحذف القائمة فقط إذا تغيرت صفة الإشراف"""
+        if self._is_admin_member(update.old_chat_member) != self._is_admin_member(update.new_chat_member):
+            self.invalidate(update.chat.id)
+
+    def get_stats(self) -> Dict:
+        """عدد فحوص الصلاحيات مقابل طلبات تليجرام الفعلية"""
+        return {
+            'chats': len(self._admins),
+            'checks': self.checks,
+            'api_calls': self.api_calls,
+            'api_calls_avoided': max(0, self.checks - self.api_calls),
+        }
+
+    @staticmethod
+    def _is_admin_member(member: Optional[ChatMember]) -> bool:
+        return bool(member and member.status in ADMIN_STATUSES)
+
+    async def _refresh(self, chat_id: int) -> Optional[Set[int]]:
+        version = self._versions.get(chat_id, 0)
+        try:
+            self.api_calls += 1
+            admins = {
+                member.user.id
+                async for member in self.client.get_chat_members(
+                    chat_id, filter=ChatMembersFilter.ADMINISTRATORS
+                )
+                if member.user
+            }
+            # تغير مشرف أثناء الجلب: القائمة قد تكون قديمة فلا تُحفظ
+            if self._versions.get(chat_id, 0) == version:
+                self._admins[chat_id] = (time.monotonic() + self.ttl, admins)
+            return admins
+        except Exception as e:
+            logger.warning(f"تعذر جلب مشرفي المجموعة {chat_id}: {e}")
+            # عدم إعادة المحاولة مع كل أمر حتى تنتهي المدة (الفحص المباشر يكفي)
+            self._admins[chat_id] = (time.monotonic() + self.ttl, None)
+            return None
+        finally:
+            self._refreshing.pop(chat_id, None)
@@ -0,0 +1,362 @@
+"""
+الحسابات المساعدة - Assistant Pool
+توزيع المكالمات الصوتية على عدة حسابات مساعدة مع نقل المجموعات عند تعطل أحدها
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from pyrogram.handlers import DisconnectHandler
+from streaming import StreamBackend, PcmPipeline, StationHub
+from config import (
+    ASSISTANT_MAX_CALLS, ASSISTANT_LOAD_FACTOR,
+    ASSISTANT_VIRTUAL_NODES, ASSISTANT_RETRY_AFTER, ASSISTANT_DISCONNECT_GRACE
+)
+
+logger = logging.getLogger(__name__)
+
+
+def ring_hash(key: str) -> int:
+    """موقع ثابت على حلقة التوزيع (لا يتغير بين عمليات التشغيل مثل hash())"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class Assistant:
+    """حساب مساعد واحد: عميل تليجرام ومحرك بث خاص به"""
+
+    def __init__(self, name: str, client: Client, backend: StreamBackend):
+        self.name = name
+        self.client = client
+        self.backend = backend
+        self.user = None
+        self.calls = 0  # عدد المجموعات الموزعة على الحساب
+        self.unavailable_until = 0.0
+        self.flood_waits = 0
+        self._peers: Dict[int, Any] = {}  # chat_id -> InputPeer (يختلف من حساب لآخر)
+        self._disconnect_check: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.unavailable_until
+
+    @property
+    def connected(self) -> bool:
+        """اتصال الحساب قائم (جلسة Pyrogram تعيد الاتصال بنفسها بعد الانقطاعات القصيرة)"""
+        if self.client is None:
+            return True
+        session = getattr(self.client, 'session', None)
+        return bool(self.client.is_connected and session and session.is_started.is_set())
+
+    def suspend(self, seconds: float):
+        """استبعاد الحساب من التوزيع لمدة محددة"""
+        self.unavailable_until = max(self.unavailable_until, time.monotonic() + seconds)
+
+    async def resolve_peer(self, chat_id: int):
+        """InputPeer للمجموعة من الذاكرة، أو حله مرة واحدة عبر هذا الحساب"""
+        peer = self._peers.get(chat_id)
+        if peer is None:
+            peer = await self.client.resolve_peer(chat_id)
+            self._peers[chat_id] = peer
+        return peer
+
+    def forget_peer(self, chat_id: int):
+        self._peers.pop(chat_id, None)
+
+
+class AssistantPool:
+    """محرك بث موزع على عدة حسابات مساعدة
+
+    بنفس واجهة StreamBackend: كل مجموعة تُوجه لحساب واحد يبقى لها ما دامت
+    في المكالمة. الحساب يُختار بالتجزئة المتسقة (consistent hashing) فتبقى
+    المجموعة على نفس الحساب بين التشغيلات، ولا تتغير إلا مجموعات قليلة عند
+    إضافة حساب أو تعطله. الحساب الذي تجاوز حمله ASSISTANT_LOAD_FACTOR من
+    المتوسط يُتخطى لما بعده على الحلقة.
+
+    - FloodWait، أو انقطاع اتصال لم يعد خلال ASSISTANT_DISCONNECT_GRACE: يُستبعد
+      الحساب مؤقتاً، ومجموعاته تنتقل لحساب آخر وتكمل من نفس الموضع. آخر حساب
+      متاح لا يُستبعد أبداً (لا يوجد حساب تنتقل إليه المجموعات).
+    - عند بداية كل أغنية تنتقل المجموعة إذا كان حسابها فوق الحد، فيتساوى
+      الحمل تدريجياً بدون قطع أغنية قيد التشغيل.
+    - المحطات المشتركة واحدة لكل المحركات، فمستمعو نفس المحطة على حسابات
+      مختلفة يقرأون من نفس فك الترميز.
+    """
+
+    def __init__(self, assistants: List[Assistant], max_calls: int = ASSISTANT_MAX_CALLS,
+                 load_factor: float = ASSISTANT_LOAD_FACTOR,
+                 virtual_nodes: int = ASSISTANT_VIRTUAL_NODES):
+        if not assistants:
+            raise ValueError("لا يوجد حساب مساعد")
+        self.assistants = assistants
+        self.max_calls = max_calls
+        self.load_factor = load_factor
+        self.on_stream_end: Optional[Callable[[int], None]] = None
+        self.failovers = 0
+        self.rebalanced = 0
+        self._assigned: Dict[int, Assistant] = {}
+        self._ring = sorted(
+            (ring_hash(f"{assistant.name}#{n}"), index)
+            for index, assistant in enumerate(assistants)
+            for n in range(virtual_nodes)
+        )
+        self._ring_keys = [point for point, _ in self._ring]
+        self.stations = StationHub()
+
+        for assistant in assistants:
+            assistant.backend.on_stream_end = self._stream_ended(assistant)
+            assistant.backend.stations = self.stations
+
+    @property
+    def primary(self) -> Assistant:
+        return self.assistants[0]
+
+    @property
+    def streams(self) -> Dict:
+        """بث كل المجموعات من كل الحسابات"""
+        streams = {}
+        for assistant in self.assistants:
+            streams.update(assistant.backend.streams)
+        return streams
+
+    # ══════════════════════════════════════════════════════════════
+    #                    التوزيع
+    # ══════════════════════════════════════════════════════════════
+
+    def assistant_for(self, chat_id: int) -> Assistant:
+        """حساب المجموعة الحالي، أو الحساب الذي ستُوجه له"""
+        return self._assigned.get(chat_id) or self.choose(chat_id)
+
+    def choose(self, chat_id: int) -> Assistant:
+        """أول حساب متاح وغير ممتلئ على الحلقة بعد موقع المجموعة"""
+        candidates = [assistant for assistant in self.assistants if assistant.available]
+        if not candidates:
+            raise RuntimeError("لا يوجد حساب مساعد متاح حالياً")
+
+        limit = self._load_limit(candidates, chat_id)
+        start = bisect.bisect(self._ring_keys, ring_hash(str(chat_id)))
+        for step in range(len(self._ring)):
+            assistant = self.assistants[self._ring[(start + step) % len(self._ring)][1]]
+            if assistant in candidates and self._load(assistant, chat_id) < limit:
+                return assistant
+
+        # كل الحسابات ممتلئة: الأقل حملاً
+        return min(candidates, key=lambda assistant: self._load(assistant, chat_id))
+
+    def _load(self, assistant: Assistant, chat_id: int) -> int:
+        """حمل الحساب بدون المجموعة نفسها (حتى لا تُحسب مرتين عند إعادة اختيارها)"""
+        return assistant.calls - (self._assigned.get(chat_id) is assistant)
+
+    def _load_limit(self, candidates: List[Assistant], chat_id: int) -> int:
+        calls = sum(assistant.calls for assistant in self.assistants)
+        calls += chat_id not in self._assigned
+        return min(self.max_calls, math.ceil(calls / len(candidates) * self.load_factor))
+
+    def _assign(self, chat_id: int, assistant: Assistant):
+        self._release(chat_id)
+        self._assigned[chat_id] = assistant
+        assistant.calls += 1
+
+    def _release(self, chat_id: int) -> Optional[Assistant]:
+        assistant = self._assigned.pop(chat_id, None)
+        if assistant:
+            assistant.calls -= 1
+        return assistant
+
+    def _should_move(self, chat_id: int) -> bool:
+        """حساب المجموعة معطل أو فوق الحد بينما يوجد حساب أخف"""
+        assistant = self._assigned[chat_id]
+        if not assistant.available:
+            return True
+        candidates = [a for a in self.assistants if a.available]
+        if self._load(assistant, chat_id) < self._load_limit(candidates, chat_id):
+            return False
+        return self.choose(chat_id) is not assistant
+
+    def assistant_stats(self) -> List[Dict]:
+        """حمل وحالة كل حساب"""
+        return [
+            {
+                'name': assistant.name,
+                'calls': assistant.calls,
+                'available': assistant.available,
+                'flood_waits': assistant.flood_waits,
+            }
+            for assistant in self.assistants
+        ]
+
+    # ══════════════════════════════════════════════════════════════
+    #                    واجهة محرك البث
+    # ══════════════════════════════════════════════════════════════
+
+    async def start(self):
+        for assistant in self.assistants:
+            await assistant.backend.start()
+            if assistant.client is not None:
+                assistant.client.add_handler(DisconnectHandler(self._disconnected(assistant)))
+
+    async def join(self, chat_id: int):
+        """الانضمام عبر حساب المجموعة، أو الحساب التالي إذا كان حسابها معطلاً"""
+        failed = None
+        for _ in range(len(self.assistants)):
+            assistant = self._assigned.get(chat_id)
+            if not assistant or not assistant.available:
+                if assistant:
+                    await self._leave(assistant, chat_id)
+                assistant = self.choose(chat_id)
+                self._assign(chat_id, assistant)
+            try:
+                await assistant.backend.join(chat_id)
+                return
+            except FloodWait as e:
+                self._release(chat_id)
+                self._flood(assistant, e.value)
+                failed = e
+            except Exception:
+                self._release(chat_id)
+                raise
+        raise failed
+
+    async def play(self, chat_id: int, source: str, offset: float = 0.0,
+                   pipeline: Optional[PcmPipeline] = None, station: Optional[str] = None):
+        # بداية أغنية جديدة: أفضل وقت لنقل المجموعة لحساب أخف
+        if chat_id in self._assigned and self._should_move(chat_id):
+            old = self._assigned[chat_id]
+            await self._leave(old, chat_id)
+            self.rebalanced += 1
+            logger.info(f"نقل المجموعة {chat_id} من {old.name} لتوزيع الحمل")
+
+        await self.join(chat_id)
+        await self._assigned[chat_id].backend.play(chat_id, source, offset, pipeline, station)
+
+    async def pause(self, chat_id: int):
+        await self._route(chat_id, 'pause')
+
+    async def resume(self, chat_id: int):
+        await self._route(chat_id, 'resume')
+
+    async def seek(self, chat_id: int, offset: float):
+        await self._route(chat_id, 'seek', offset)
+
+    async def leave(self, chat_id: int):
+        assistant = self._release(chat_id)
+        if assistant:
+            await assistant.backend.leave(chat_id)
+
+    def position(self, chat_id: int) -> Optional[float]:
+        assistant = self._assigned.get(chat_id)
+        return assistant.backend.position(chat_id) if assistant else None
+
+    def stats(self, chat_id: int) -> Optional[Dict]:
+        assistant = self._assigned.get(chat_id)
+        return assistant.backend.stats(chat_id) if assistant else None
+
+    async def _route(self, chat_id: int, action: str, *args):
+        """تنفيذ أمر على حساب المجموعة، ونقلها لحساب آخر عند FloodWait"""
+        assistant = self._assigned.get(chat_id)
+        if not assistant:
+            return
+        try:
+            await getattr(assistant.backend, action)(chat_id, *args)
+        except FloodWait as e:
+            self._flood(assistant, e.value)
+            if assistant.available:
+                raise  # آخر حساب متاح: لا يوجد حساب تنتقل إليه
+            await self.move(chat_id)
+            await getattr(self._assigned[chat_id].backend, action)(chat_id, *args)
+
+    def _stream_ended(self, assistant: Assistant) -> Callable[[int], None]:
+        def ended(chat_id: int):
+            # حدث متأخر من حساب نُقلت منه المجموعة: لا يخصها الآن
+            if self._assigned.get(chat_id) is assistant and self.on_stream_end:
+                self.on_stream_end(chat_id)
+        return ended
+
+    # ══════════════════════════════════════════════════════════════
+    #                    نقل المجموعات
+    # ══════════════════════════════════════════════════════════════
+
+    async def move(self, chat_id: int):
+        """نقل مجموعة لحساب آخر مع إكمال الأغنية من نفس الموضع"""
+        old = self._assigned.get(chat_id)
+        if not old:
+            return
+
+        stream = old.backend.streams.get(chat_id)
+        current = stream.pipeline if stream else None
+        position = stream.position if stream else 0.0
+        paused = stream.paused if stream else False
+        station = stream.station if stream else None
+
+        await self._leave(old, chat_id)
+
+        # الحساب القديم مستبعد الآن، فالاختيار يقع على غيره
+        await self.join(chat_id)
+        new = self._assigned[chat_id]
+        if current:
+            pipeline = PcmPipeline(current.source, position, current.headers, current.follow)
+            if not station:
+                await pipeline.start()
+            # مستمع محطة يعود لنفس المحطة (يُفتح pipeline فقط إذا لم تكن مفتوحة هناك)
+            await new.backend.play(chat_id, current.source, position, pipeline, station)
+            if paused:
+                await new.backend.pause(chat_id)
+
+        self.failovers += 1
+        logger.warning(f"نقل المجموعة {chat_id} من {old.name} إلى {new.name}")
+
+    async def failover(self, assistant: Assistant, seconds: float = ASSISTANT_RETRY_AFTER):
+        """استبعاد حساب ونقل كل مجموعاته لباقي الحسابات"""
+        if not self._can_suspend(assistant):
+            logger.warning(f"الحساب {assistant.name} هو آخر حساب متاح، تبقى مجموعاته عليه")
+            return
+        assistant.suspend(seconds)
+        chat_ids = [chat_id for chat_id, owner in self._assigned.items() if owner is assistant]
+        if chat_ids:
+            logger.warning(f"الحساب {assistant.name} غير متاح، نقل {len(chat_ids)} مجموعة")
+
+        for chat_id in chat_ids:
+            try:
+                await self.move(chat_id)
+            except Exception as e:
+                # تبقى بدون حساب حتى انتقالها التالي، فتنضم عندها عبر أي حساب متاح
+                logger.error(f"تعذر نقل المجموعة {chat_id}: {e}")
+
+    async def _leave(self, assistant: Assistant, chat_id: int):
+        """مغادرة الحساب للمكالمة (قد يكون اتصاله منقطعاً، فالفشل لا يوقف النقل)"""
+        if self._assigned.get(chat_id) is assistant:
+            self._release(chat_id)
+        try:
+            await assistant.backend.leave(chat_id)
+        except Exception as e:
+            logger.debug(f"خطأ في مغادرة {chat_id} عبر {assistant.name}: {e}")
+
+    def _can_suspend(self, assistant: Assistant) -> bool:
+        """يوجد حساب متاح غيره تنتقل إليه المجموعات"""
+        return any(other.available for other in self.assistants if other is not assistant)
+
+    def _flood(self, assistant: Assistant, seconds: float):
+        assistant.flood_waits += 1
+        logger.warning(f"FloodWait على الحساب {assistant.name} لمدة {seconds} ثانية")
+        if self._can_suspend(assistant):
+            assistant.suspend(seconds)
+
+    def _disconnected(self, assistant: Assistant):
+        async def on_disconnect(client: Client):
+            # Pyrogram يستدعي هذا مع كل إعادة تشغيل للجلسة، حتى انقطاع الشبكة
+            # القصير: النقل فقط إذا لم يعد الاتصال خلال المهلة
+            check = assistant._disconnect_check
+            if check is None or check.done():
+                assistant._disconnect_check = asyncio.create_task(self._check_disconnect(assistant))
+        return on_disconnect
+
+    async def _check_disconnect(self, assistant: Assistant,
+                                grace: float = ASSISTANT_DISCONNECT_GRACE):
+        await asyncio.sleep(grace)
+        if not assistant.connected:
+            await self.failover(assistant)
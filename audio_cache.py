@@ -0,0 +1,315 @@
+"""
+ذاكرة الصوت المؤقتة - Audio Cache
+ملف واحد مشترك لكل محتوى يُحمّل عند الحاجة، مع حذف الأقدم تشغيلاً عند امتلاء المساحة
+"""
+
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from database import AsyncDatabase
+from downloader import DownloadJob, DownloadManager
+from telegram_download import TelegramDownloader
+from config import CACHE_MAX_SIZE, MAX_FILE_SIZE, TELEGRAM_PLAYBACK_BUFFER
+
+logger = logging.getLogger(__name__)
+
+
+class FileTooLarge(Exception):
+    """حجم الملف أكبر من الحد المسموح"""
+
+    def __init__(self, size_mb: float):
+        super().__init__(f"{size_mb:.1f}MB")
+        self.size_mb = size_mb
+
+
+class PlaylistUrl(Exception):
+    """الرابط قائمة تشغيل وليس مقطعاً واحداً"""
+
+    def __init__(self, info: Dict):
+        super().__init__(info.get('title') or info.get('id'))
+        self.info = info
+
+
+def make_cache_key(info: Dict) -> str:
+    """مفتاح المحتوى: اسم المصدر + معرف المقطع فيه (مثل youtube:dQw4w9WgXcQ)
+
+    يعمل مع المعلومات الكاملة (extractor_key) ومع عناصر القوائم المسطحة (ie_key).
+    """
+    extractor = info.get('extractor_key') or info['ie_key']
+    return f"{extractor.lower()}:{info['id']}"
+
+
+class AudioCache:
+    """ذاكرة مؤقتة للملفات الصوتية مشتركة بين جميع المجموعات"""
+
+    def __init__(self, db: AsyncDatabase, downloader: DownloadManager,
+                 max_bytes: int = CACHE_MAX_SIZE * 1024 * 1024,
+                 is_protected: Optional[Callable[[str], bool]] = None,
+                 telegram: Optional[TelegramDownloader] = None):
+        self.db = db
+        self.downloader = downloader
+        self.telegram = telegram
+        self.max_bytes = max_bytes
+        # ملفات لا يجوز حذفها الآن (مثل الأغاني قيد التشغيل)
+        self.is_protected = is_protected or (lambda cache_key: False)
+        self._evicting = asyncio.Lock()
+        self._fetching: Dict[str, asyncio.Task] = {}  # cache_key -> مهمة التحميل الجارية
+        self._waiters: Dict[str, Set[int]] = {}  # cache_key -> المجموعات التي تنتظر التحميل
+        self._jobs: Dict[str, DownloadJob] = {}  # cache_key -> مهمة تحميل الرابط
+
+    # ══════════════════════════════════════════════════════════════
+    #                    جلب الملفات
+    # ══════════════════════════════════════════════════════════════
+
+    async def resolve_url(self, url: str) -> Dict:
+        """معلومات رابط بدون تحميله (file_path موجود فقط إذا كان الملف في الذاكرة)"""
+        # نفس الرابط سبق تحميله: لا حاجة لأي طلب شبكة
+        entry = await self.db.get_cached_media_by_url(url)
+        if entry and os.path.exists(entry['file_path']):
+            return self._from_entry(entry)
+
+        # رابط مختلف لنفس المحتوى: يُعرف من معرف المصدر
+        info = await self.downloader.extract(url)
+        if info.get('_type') == 'playlist':
+            raise PlaylistUrl(info)
+
+        # الحجم المعلن من المصدر: المقطع الكبير يُرفض قبل إضافته
+        size_mb = (info.get('filesize') or info.get('filesize_approx') or 0) / (1024 * 1024)
+        if size_mb > MAX_FILE_SIZE:
+            raise FileTooLarge(size_mb)
+        cache_key = make_cache_key(info)
+
+        entry = await self.db.get_cached_media(cache_key)
+        if entry and entry['present'] and os.path.exists(entry['file_path']):
+            return self._from_entry(entry)
+
+        return {
+            'title': info.get('title', 'Unknown'),
+            'duration': int(info.get('duration') or 0),
+            'artist': info.get('artist') or info.get('uploader', 'Unknown'),
+            'file_path': None,
+            'cache_key': cache_key,
+        }
+
+    async def local_path(self, song: Dict) -> Optional[str]:
+        """مسار ملف الأغنية إذا كان على القرص الآن (بدون تحميل)"""
+        file_path = song.get('file_path')
+        if file_path and os.path.exists(file_path):
+            return file_path
+
+        if not song.get('cache_key'):
+            return None
+
+        # المحتوى حُمّل لأغنية أخرى (أو لنفس الأغنية بعد إضافتها كمعلومات فقط)
+        entry = await self.db.get_cached_media(song['cache_key'])
+        if entry and entry['present'] and os.path.exists(entry['file_path']):
+            return entry['file_path']
+        return None
+
+    async def stream_url(self, song: Dict) -> Optional[Dict]:
+        """رابط البث المباشر للأغنية من مصدرها (None إذا تعذر)"""
+        if not song.get('source_url'):
+            return None
+        try:
+            return await self.downloader.extract_stream(song['source_url'])
+        except Exception as e:
+            logger.warning(f"تعذر الحصول على رابط البث المباشر لـ {song['title']}: {e}")
+            return None
+
+    async def ensure(self, song: Dict) -> Optional[str]:
+        """التأكد من وجود ملف الأغنية على القرص وتحميله إذا لم يكن موجوداً
+
+        طلبات نفس المحتوى في نفس الوقت (التجهيز المسبق والتشغيل، أو عدة
+        مجموعات) تنتظر تحميلاً واحداً.
+        """
+        file_path = await self.local_path(song)
+        if file_path:
+            return file_path
+
+        task = self._fetch_task(song)
+        if task is None:
+            return None
+        return await asyncio.shield(task)
+
+    def prefetch(self, song: Dict):
+        """بدء تحميل ملف الأغنية في الخلفية دون انتظاره (مهمته محفوظة في _fetching)"""
+        self._fetch_task(song)
+
+    async def fetch_progressive(self, song: Dict,
+                                min_bytes: int = TELEGRAM_PLAYBACK_BUFFER * 1024 * 1024
+                                ) -> Tuple[Optional[str], bool]:
+        """ملف تليجرام للتشغيل أثناء تحميله
+
+        ينتظر حتى تصل أول min_bytes من الملف ثم يعيد (المسار، هل ما زال يُحمّل)؛
+        الملف الناقص يُقرأ بمتابعة نموه حتى يكتمل.
+        """
+        task = self._fetch_task(song)
+        if task is None or not self.telegram:
+            return None, False
+
+        file_path = self.telegram.file_path(song['cache_key'])
+        while not task.done() and self._file_size(file_path) < min_bytes:
+            await asyncio.wait({task}, timeout=0.2)
+
+        if task.done():
+            return task.result(), False
+        return file_path, True
+
+    def _fetch_task(self, song: Dict) -> Optional[asyncio.Task]:
+        """مهمة تحميل المحتوى (واحدة لكل cache_key مهما تعددت الطلبات)"""
+        cache_key = song.get('cache_key')
+        if not cache_key:
+            return None
+        if not song.get('source_url') and not (song.get('file_id') and self.telegram):
+            return None
+
+        task = self._fetching.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(song))
+            self._fetching[cache_key] = task
+            self._waiters[cache_key] = set()
+            task.add_done_callback(lambda _: self._fetch_done(cache_key))
+        if song.get('chat_id') is not None:
+            self._waiters[cache_key].add(song['chat_id'])
+        return task
+
+    def _fetch_done(self, cache_key: str):
+        self._fetching.pop(cache_key, None)
+        self._waiters.pop(cache_key, None)
+
+    def cancel_chat(self, chat_id: int) -> int:
+        """إلغاء تحميلات الروابط التي لا تنتظرها إلا هذه المجموعة
+
+        التحميل المشترك مع مجموعات أخرى (نفس المحتوى) يستمر لها.
+        """
+        cancelled = 0
+        for cache_key, waiters in self._waiters.items():
+            job = self._jobs.get(cache_key)
+            if job and waiters == {chat_id} and not job.cancelled:
+                job.cancel()
+                cancelled += 1
+        return cancelled
+
+    async def _fetch(self, song: Dict) -> Optional[str]:
+        """تحميل ملف أغنية غير موجود مع تحديث حالة أغانيه (لا يرفع أخطاء: None عند الفشل)"""
+        cache_key = song['cache_key']
+        try:
+            # طلب بدون ensure (prefetch): المحتوى قد يكون على القرص مسبقاً
+            file_path = await self.local_path(song)
+            if file_path:
+                return file_path
+
+            logger.info(f"تحميل ملف الأغنية عند الحاجة: {song['title']}")
+            await self.db.set_media_fetching(cache_key)
+            if song.get('source_url'):
+                job = self.downloader.submit(song['chat_id'], song['source_url'])
+                self._jobs[cache_key] = job
+                try:
+                    result = await job.wait()
+                finally:
+                    self._jobs.pop(cache_key, None)
+            else:
+                result = await self.telegram.download(song)
+                duplicate = await self._find_duplicate(cache_key, result)
+                if duplicate:
+                    return duplicate
+            entry = await self._register(cache_key, song.get('source_url'), result)
+            return entry['file_path']
+        except Exception as e:
+            await self.db.reset_media_fetching(cache_key)
+            logger.warning(f"تعذر تحميل {song['title']}: {e}")
+            return None
+
+    async def _find_duplicate(self, cache_key: str, result: Dict) -> Optional[str]:
+        """نفس المحتوى موجود بمفتاح آخر: حذف النسخة الجديدة وربط المفتاح بالأصلية
+
+        النسخة الجديدة التي تُشغل أثناء تحميلها لا تُحذف، فتُسجل بمفتاحها.
+        """
+        if self.is_protected(cache_key):
+            return None
+
+        entry = await self.db.get_cached_media_by_hash(result['content_hash'])
+        if not entry or entry['cache_key'] == cache_key or not os.path.exists(entry['file_path']):
+            return None
+
+        await asyncio.to_thread(self._remove_file, result['file_path'])
+        await self.db.alias_cached_media(cache_key, entry['cache_key'])
+        logger.info(f"♻️ الملف مطابق لمحتوى موجود: {cache_key} → {entry['cache_key']}")
+        return entry['file_path']
+
+    async def _register(self, cache_key: str, url: str, result: Dict) -> Dict:
+        """تسجيل ملف محمل حديثاً ثم تطبيق حد المساحة"""
+        size_mb = result['file_size'] / (1024 * 1024)
+        if size_mb > MAX_FILE_SIZE:
+            await asyncio.to_thread(self._remove_file, result['file_path'])
+            raise FileTooLarge(size_mb)
+
+        await self.db.add_cached_media(
+            cache_key, result['file_path'], result['file_size'],
+            source_url=url,
+            title=result['title'],
+            artist=result['artist'],
+            duration=result['duration'],
+            content_hash=result.get('content_hash')
+        )
+
+        await self.enforce_budget(keep=cache_key)
+        return dict(result, cache_key=cache_key)
+
+    def _from_entry(self, entry: Dict) -> Dict:
+        return {
+            'title': entry['title'],
+            'duration': entry['duration'],
+            'artist': entry['artist'],
+            'file_path': entry['file_path'],
+            'file_size': entry['file_size'],
+            'cache_key': entry['cache_key'],
+        }
+
+    # ══════════════════════════════════════════════════════════════
+    #                    حذف الملفات (LRU)
+    # ══════════════════════════════════════════════════════════════
+
+    async def enforce_budget(self, keep: Optional[str] = None) -> int:
+        """حذف الملفات الأقل استخداماً حتى يعود الحجم تحت الحد"""
+        async with self._evicting:
+            usage = await self.db.get_cache_usage()
+            evicted = 0
+
+            # صفحات متتالية بالترتيب: الملفات المحمية لا تُعاد قراءتها ولا تحجب ما بعدها
+            after = None
+            while usage > self.max_bytes:
+                candidates = await self.db.get_eviction_candidates(exclude=keep, after=after)
+                if not candidates:
+                    break
+                last = candidates[-1]
+                after = (last['in_use'], last['last_played'], last['cache_key'])
+
+                for entry in candidates:
+                    if self.is_protected(entry['cache_key']):
+                        continue
+                    await asyncio.to_thread(self._remove_file, entry['file_path'])
+                    await self.db.evict_cached_media(entry['cache_key'])
+                    usage -= entry['file_size'] or 0
+                    evicted += 1
+                    if usage <= self.max_bytes:
+                        break
+
+            if evicted:
+                logger.info(f"🧹 تم حذف {evicted} ملف من الذاكرة المؤقتة")
+            return evicted
+
+    @staticmethod
+    def _file_size(file_path: str) -> int:
+        try:
+            return os.path.getsize(file_path)
+        except FileNotFoundError:
+            return 0
+
+    def _remove_file(self, file_path: str):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+قياس الأداء - Benchmarks
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import wave
+from typing import Dict
+
+from database import Database, AsyncDatabase
+from radio_manager import RadioManager
+from streaming import NullBackend
+from workers import WorkerPool
+from config import RESUME_CONCURRENCY
+
+
+# ══════════════════════════════════════════════════════════════
+#                    أدوات مساعدة
+# ══════════════════════════════════════════════════════════════
+
+class ConnectPerCallDatabase(Database):
+    """قاعدة بيانات بالسلوك القديم: اتصال جديد في كل استدعاء"""
+
+    def get_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+def populate(db: Database, chats: int, songs_per_chat: int):
+    """ملء قاعدة البيانات ببيانات تجريبية"""
+    for chat_id in range(1, chats + 1):
+        db.add_chat(chat_id, f"مجموعة {chat_id}")
+        for n in range(songs_per_chat):
+            db.add_song(chat_id=chat_id, title=f"أغنية {n}", duration=180)
+
+
+def time_calls(name: str, func, chat_ids, repeat: int) -> float:
+    """قياس متوسط زمن الاستدعاء بالميكروثانية"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for chat_id in chat_ids:
+            func(chat_id)
+    elapsed = time.perf_counter() - started
+    per_call = elapsed / (repeat * len(chat_ids)) * 1_000_000
+    print(f"  {name:<22} {per_call:10.1f} µs/call")
+    return per_call
+
+
+# ══════════════════════════════════════════════════════════════
+#                    اتصالات قاعدة البيانات
+# ══════════════════════════════════════════════════════════════
+
+def bench_connections(chats: int = 1000, songs_per_chat: int = 3, repeat: int = 3):
+    """مقارنة الاتصال لكل استدعاء مع الاتصال الدائم"""
+    print(f"🗄️ اتصالات قاعدة البيانات ({chats} مجموعة)")
+
+    with tempfile.TemporaryDirectory() as folder:
+        db_file = os.path.join(folder, "bench.db")
+
+        pooled = Database(db_file)
+        populate(pooled, chats, songs_per_chat)
+        pooled.close()
+
+        # إرجاع ملف قاعدة البيانات لوضع journal الافتراضي كما كان سابقاً
+        conn = sqlite3.connect(db_file)
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.close()
+        legacy = ConnectPerCallDatabase(db_file)
+
+        chat_ids = random.sample(range(1, chats + 1), min(chats, 200))
+
+        def set_playing(db):
+            return lambda chat_id: db.set_playing(chat_id, chat_id * songs_per_chat, True)
+
+        def run(label: str, db: Database):
+            print(f" {label}:")
+            timings = [
+                time_calls("is_chat_active", db.is_chat_active, chat_ids, repeat),
+                time_calls("get_playback_state", db.get_playback_state, chat_ids, repeat),
+                time_calls("get_next_song", db.get_next_song, chat_ids, repeat),
+                time_calls("set_playing", set_playing(db), chat_ids, repeat),
+            ]
+            db.close()
+            return timings
+
+        before = run("قبل (اتصال لكل استدعاء)", legacy)
+        after = run("بعد (اتصال دائم + WAL)", Database(db_file))
+
+        speedups = ", ".join(f"{b / a:.1f}x" for b, a in zip(before, after))
+        print(f" التسريع: {speedups}")
+    print()
+
+
+# ══════════════════════════════════════════════════════════════
+#                    ذاكرة حالة المجموعات
+# ══════════════════════════════════════════════════════════════
+
+def bench_chat_state(chats: int = 1000, songs_per_chat: int = 3, repeat: int = 5):
+    """قراءات أمر /status: من قاعدة البيانات مقابل ذاكرة الحالة"""
+    print(f"🧠 ذاكرة حالة المجموعات ({chats} مجموعة)")
+
+    async def status_from_db(adb: AsyncDatabase, chat_id: int):
+        await adb._read(adb.db.is_chat_active, chat_id)
+        await adb._read(adb.db.get_playback_state, chat_id)
+        await adb._read(adb.db.get_autoplay_status, chat_id)
+        await adb._read(adb.db.get_playlist, chat_id)
+
+    async def status_from_cache(adb: AsyncDatabase, chat_id: int):
+        await adb.is_chat_active(chat_id)
+        await adb.get_playback_state(chat_id)
+        await adb.get_autoplay_status(chat_id)
+        await adb.get_song_count(chat_id)
+
+    async def time_status(name: str, func, adb: AsyncDatabase, chat_ids) -> float:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for chat_id in chat_ids:
+                await func(adb, chat_id)
+        per_call = (time.perf_counter() - started) / (repeat * len(chat_ids)) * 1_000_000
+        print(f"  {name:<22} {per_call:10.1f} µs/status")
+        return per_call
+
+    async def run(db_file: str):
+        adb = AsyncDatabase(Database(db_file))
+        chat_ids = random.sample(range(1, chats + 1), min(chats, 200))
+        before = await time_status("قاعدة البيانات", status_from_db, adb, chat_ids)
+        after = await time_status("ذاكرة الحالة", status_from_cache, adb, chat_ids)
+        stats = adb.get_state_cache_stats()
+        adb.close()
+        print(f" التسريع: {before / after:.1f}x "
+              f"(إصابات {stats['hits']}، إخفاقات {stats['misses']})")
+
+    with tempfile.TemporaryDirectory() as folder:
+        db_file = os.path.join(folder, "bench.db")
+        db = Database(db_file)
+        populate(db, chats, songs_per_chat)
+        db.close()
+        asyncio.run(run(db_file))
+    print()
+
+
+# ══════════════════════════════════════════════════════════════
+#                    استكمال التشغيل بعد إعادة التشغيل
+# ══════════════════════════════════════════════════════════════
+
+class SlowJoinBackend(NullBackend):
+    """بث بدون مخرج مع تأخير ثابت للانضمام (يحاكي زمن الانضمام للمكالمة عبر الشبكة)"""
+
+    def __init__(self, join_delay: float):
+        super().__init__()
+        self.join_delay = join_delay
+
+    async def _connect(self, chat_id: int, sink):
+        await asyncio.sleep(self.join_delay)
+
+
+def write_silence(file_path: str, seconds: int, rate: int = 8000):
+    """ملف WAV صامت لتجربة فك الترميز بدون تحميل"""
+    with wave.open(file_path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b'\0\0' * rate * seconds)
+
+
+def bench_resume(chats: int = 500, join_delay: float = 0.2, concurrency: int = RESUME_CONCURRENCY):
+    """الزمن حتى استكمال كل المجموعات قيد التشغيل: واحدة تلو الأخرى مقابل بالتوازي"""
+    print(f"♻️ استكمال التشغيل بعد إعادة التشغيل ({chats} مجموعة، انضمام {join_delay * 1000:.0f}ms)")
+
+    async def resume_all(db_file: str, limit: int) -> Dict:
+        adb = AsyncDatabase(Database(db_file))
+        radio = RadioManager(None, adb, backend=SlowJoinBackend(join_delay))
+        radio.prefetcher.count = 0  # قياس الاستكمال فقط بدون تجهيز الأغاني القادمة
+        try:
+            return await radio.recover_playback(limit)
+        finally:
+            for chat_id in list(radio.backend.streams):
+                await radio.backend.leave(chat_id)
+            radio.downloader.shutdown()
+            adb.close()
+
+    with tempfile.TemporaryDirectory() as folder:
+        audio = os.path.join(folder, "silence.wav")
+        write_silence(audio, 200)
+
+        db_file = os.path.join(folder, "bench.db")
+        db = Database(db_file)
+        for chat_id in range(1, chats + 1):
+            db.add_chat(chat_id, f"مجموعة {chat_id}")
+            song_id = db.add_song(chat_id=chat_id, title="أغنية", file_path=audio, duration=180)
+            db.set_playing(chat_id, song_id, True)
+            if chat_id % 10 == 0:
+                db.set_paused(chat_id, True)
+        db.save_positions([(chat_id, random.uniform(0, 170)) for chat_id in range(1, chats + 1)])
+        db.close()
+
+        results = []
+        for label, limit in (("واحدة تلو الأخرى", 1), ("بالتوازي", concurrency)):
+            result = asyncio.run(resume_all(db_file, limit))
+            results.append(result)
+            print(f"  {label:<22} {result['seconds']:8.2f} s "
+                  f"(استُكملت {result['resumed']}/{result['chats']})")
+
+        print(f" التسريع: {results[0]['seconds'] / results[1]['seconds']:.1f}x")
+    print()
+
+
+# ══════════════════════════════════════════════════════════════
+#                    عمليات البث المنفصلة
+# ══════════════════════════════════════════════════════════════
+
+def bench_workers(streams: int = 200, workers: int = 2, seconds: float = 5.0,
+                  clients: int = 20):
+    """أوامر في الثانية أثناء بث {streams} مجموعة: في عملية واحدة مقابل عمليات بث منفصلة"""
+    print(f"🧵 الأوامر أثناء البث ({streams} بث متزامن، {workers} عملية بث)")
+
+    async def commands_per_second(db_file: str, folder: str, worker_count: int) -> Dict:
+        adb = AsyncDatabase(Database(db_file))
+        pool = None
+        if worker_count:
+            pool = WorkerPool(worker_count, kind="null",
+                              socket_path=os.path.join(folder, "workers.sock"))
+            radio = RadioManager(None, adb, workers=pool)
+        else:
+            radio = RadioManager(None, adb, backend=NullBackend())
+        radio.prefetcher.count = 0
+        try:
+            await radio.backend.start()
+            resumed = await radio.recover_playback(50)
+            chat_ids = list(radio.active_calls)
+
+            # أوامر قراءة (/status) وتحكم (/pause ثم /resume) من عدة مستخدمين معاً
+            done = 0
+            deadline = time.perf_counter() + seconds
+
+            async def user(offset: int):
+                nonlocal done
+                n = offset
+                while time.perf_counter() < deadline:
+                    chat_id = chat_ids[n % len(chat_ids)]
+                    await radio.get_status(chat_id)
+                    await radio.pause(chat_id)
+                    await radio.resume(chat_id)
+                    done += 3
+                    n += clients
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user(offset) for offset in range(clients)))
+            return {'resumed': resumed['resumed'], 'rate': done / (time.perf_counter() - started)}
+        finally:
+            for chat_id in list(radio.backend.streams):
+                await radio.backend.leave(chat_id)
+            if pool:
+                await pool.close()
+            radio.downloader.shutdown()
+            adb.close()
+
+    with tempfile.TemporaryDirectory() as folder:
+        audio = os.path.join(folder, "silence.wav")
+        write_silence(audio, 200)
+
+        db_file = os.path.join(folder, "bench.db")
+        db = Database(db_file)
+        for chat_id in range(1, streams + 1):
+            db.add_chat(chat_id, f"مجموعة {chat_id}")
+            song_id = db.add_song(chat_id=chat_id, title="أغنية", file_path=audio, duration=180)
+            db.set_playing(chat_id, song_id, True)
+        db.close()
+
+        results = []
+        for label, worker_count in (("عملية واحدة", 0), (f"{workers} عملية بث", workers)):
+            result = asyncio.run(commands_per_second(db_file, folder, worker_count))
+            results.append(result)
+            print(f"  {label:<22} {result['rate']:10.0f} أمر/ثانية "
+                  f"(يبث {result['resumed']})")
+
+        print(f" التسريع: {results[1]['rate'] / results[0]['rate']:.1f}x")
+    print()
+
+
+# ══════════════════════════════════════════════════════════════
+#                    البث المشترك
+# ══════════════════════════════════════════════════════════════
+
+def bench_stations(chats: int = 200, stations: int = 4, seconds: float = 5.0):
+    """وقت المعالج لبث {chats} مجموعة: فك ترميز لكل مجموعة مقابل محطات مشتركة"""
+    print(f"📡 البث المشترك ({chats} مجموعة على {stations} محطة، {seconds:.0f} ثانية)")
+
+    async def cpu_cost(audio: str, shared: bool) -> Dict:
+        backend = NullBackend()
+        chat_ids = range(1, chats + 1)
+        started = time.process_time()
+        try:
+            for chat_id in chat_ids:
+                station = f"station{chat_id % stations}" if shared else None
+                await backend.play(chat_id, audio, station=station)
+            await asyncio.sleep(seconds)
+
+            decoders = len(backend.stations.stations) if shared else chats
+            decoder_cpu = backend.stations.stats()['decoder_cpu'] + sum(
+                backend.stats(chat_id)['decoder_cpu'] for chat_id in chat_ids
+            )
+            return {
+                'decoders': decoders,
+                'decoder_cpu': decoder_cpu,
+                'total_cpu': decoder_cpu + time.process_time() - started,
+            }
+        finally:
+            for chat_id in chat_ids:
+                await backend.leave(chat_id)
+
+    with tempfile.TemporaryDirectory() as folder:
+        audio = os.path.join(folder, "silence.wav")
+        write_silence(audio, 200)
+
+        results = []
+        for label, shared in (("فك ترميز لكل مجموعة", False), ("محطات مشتركة", True)):
+            result = asyncio.run(cpu_cost(audio, shared))
+            results.append(result)
+            print(f"  {label:<22} {result['decoders']:5d} FFmpeg "
+                  f"{result['decoder_cpu']:8.2f} s فك ترميز {result['total_cpu']:8.2f} s إجمالي")
+
+        if results[1]['total_cpu']:
+            print(f" التوفير: {results[0]['total_cpu'] / results[1]['total_cpu']:.1f}x")
+    print()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("           ⏱️ قياس أداء مكونات البوت")
+    print("=" * 60)
+    print()
+
+    bench_connections()
+    bench_chat_state()
+    bench_resume()
+    bench_workers()
+    bench_stations()
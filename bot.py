@@ -7,11 +7,15 @@ Telegram Radio Bot - Main File
 
 import logging
 from pyrogram import Client, filters
-from pyrogram.types import Message
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import Message, CallbackQuery, ChatMemberUpdated
 from config import *
-from database import Database
+from database import Database, AsyncDatabase
 from radio_manager import RadioManager
+from workers import WorkerPool
+from admin_cache import AdminCache
 import asyncio
+import signal
 
 # إعداد السجلات
 logging.basicConfig(
@@ -36,9 +40,36 @@ userbot = Client(
     session_string=SESSION_STRING
 )
 
+# حسابات مساعدة إضافية (المكالمات تتوزع على كل الحسابات)
+extra_userbots = [
+    Client(
+        f"radio_userbot_{number}",
+        api_id=API_ID,
+        api_hash=API_HASH,
+        session_string=session_string
+    )
+    for number, session_string in enumerate(EXTRA_SESSION_STRINGS, 2)
+]
+
 # قاعدة البيانات ومدير الراديو
-db = Database()
-radio = RadioManager(userbot, db)
+db = AsyncDatabase(Database())
+radio = RadioManager(userbot, db, assistants=extra_userbots,
+                     workers=WorkerPool() if WORKER_PROCESSES else None)
+admins = AdminCache(app)
+
+# هوية البوت والحساب المساعد (تُجلب مرة واحدة عند التشغيل في main)
+bot_user = None
+assistant_user = None
+
+
+async def is_admin(message: Message) -> bool:
+    """التحقق من أن المرسل مشرف (من ذاكرة المشرفين بدون طلب لكل أمر)"""
+    # مشرف مجهول أو منشور القناة نفسها
+    if message.sender_chat and message.sender_chat.id == message.chat.id:
+        return True
+    if not message.from_user:
+        return False
+    return await admins.is_admin(message.chat.id, message.from_user.id)
 
 
 # ══════════════════════════════════════════════════════════════
@@ -58,17 +89,24 @@ async def start_command(client: Client, message: Message):
 • `/pause` - إيقاف مؤقت
 • `/resume` - استئناف التشغيل
 • `/skip` - تخطي الأغنية الحالية
+• `/seek` - الانتقال لوقت في الأغنية (مثل 1:30 أو +30)
 • `/stop` - إيقاف الراديو
+• `/listen` - بث محطة مجموعة أخرى هنا (بمعرفها)
+• `/unlisten` - إيقاف الاستماع للمحطة
+• `/station` - السماح للمجموعات الأخرى بالاستماع لهذه المجموعة (on/off)
 
 🎵 **إدارة الأغاني:**
 • `/add` - إضافة أغنية (رد على ملف أو أرسل رابط)
 • `/playlist` - عرض قائمة التشغيل
 • `/remove` - حذف أغنية
+• `/move` - نقل أغنية لمكان آخر في القائمة
 • `/shuffle` - خلط قائمة التشغيل
+• `/cancel` - إلغاء التحميلات الجارية
 
 ⚙️ **الإعدادات:**
 • `/settings` - إعدادات الراديو
 • `/status` - حالة التشغيل الحالية
+• `/stats` - إحصائيات التشغيل
 • `/autoplay` - تفعيل/تعطيل التشغيل التلقائي
 
 👥 **للإضافة في مجموعة:**
@@ -90,14 +128,14 @@ async def activate_radio(client: Client, message: Message):
         return
     
     # التحقق من الصلاحيات
-    member = await message.chat.get_member(message.from_user.id)
-    if member.status not in ["creator", "administrator"]:
+    if not await is_admin(message):
         await message.reply_text("⚠️ هذا الأمر للمشرفين فقط!")
         return
     
     # تفعيل الراديو
     chat_id = message.chat.id
-    db.add_chat(chat_id, message.chat.title)
+    await db.add_chat(chat_id, message.chat.title)
+    radio.wake(chat_id)
     
     await message.reply_text(
         f"✅ **تم تفعيل الراديو!**\n\n"
@@ -113,7 +151,7 @@ async def play_command(client: Client, message: Message):
     chat_id = message.chat.id
     
     # التحقق من تفعيل المجموعة
-    if not db.is_chat_active(chat_id):
+    if not await db.is_chat_active(chat_id):
         await message.reply_text("⚠️ الرجاء تفعيل الراديو أولاً بإرسال `/activate`")
         return
     
@@ -171,6 +209,39 @@ async def stop_command(client: Client, message: Message):
     await message.reply_text(f"⏹️ {result['message']}")
 
 
+@app.on_message(filters.command("seek"))
+async def seek_command(client: Client, message: Message):
+    """الانتقال لوقت في الأغنية الحالية"""
+    if len(message.command) < 2:
+        await message.reply_text(
+            "📝 **الاستخدام:** `/seek [الوقت]`\n\n"
+            "`/seek 1:30` - الانتقال للدقيقة 1:30\n"
+            "`/seek +30` - تقديم 30 ثانية\n"
+            "`/seek -10` - إرجاع 10 ثوانٍ"
+        )
+        return
+    
+    arg = message.command[1]
+    relative = arg[0] in "+-"
+    try:
+        # ثوانٍ، أو دقائق:ثوانٍ، أو ساعات:دقائق:ثوانٍ
+        seconds = 0
+        for part in arg.lstrip("+-").split(":"):
+            seconds = seconds * 60 + int(part)
+    except ValueError:
+        await message.reply_text("❌ الرجاء إدخال وقت صحيح (مثل 90 أو 1:30)")
+        return
+    if arg.startswith("-"):
+        seconds = -seconds
+    
+    result = await radio.seek(message.chat.id, seconds, relative)
+    
+    if result["success"]:
+        await message.reply_text(f"⏩ **الموضع:** {result['position']} / {result['duration']}")
+    else:
+        await message.reply_text(f"❌ {result['message']}")
+
+
 @app.on_message(filters.command("add"))
 async def add_song_command(client: Client, message: Message):
     """إضافة أغنية"""
@@ -178,19 +249,27 @@ async def add_song_command(client: Client, message: Message):
     
     # التحقق من الصلاحيات
     if message.chat.type != "private":
-        member = await message.chat.get_member(message.from_user.id)
-        if member.status not in ["creator", "administrator"]:
+        if not await is_admin(message):
             await message.reply_text("⚠️ هذا الأمر للمشرفين فقط!")
             return
     
     # إضافة من رابط
     if len(message.command) > 1:
         url = message.command[1]
-        status_msg = await message.reply_text("⏳ جاري تحميل الأغنية...")
+        status_msg = await message.reply_text("⏳ جاري جلب معلومات الأغنية...")
         
         result = await radio.add_song_from_url(chat_id, url)
         
-        if result["success"]:
+        if result["success"] and result.get("playlist"):
+            text = (
+                f"✅ **تم استيراد قائمة التشغيل!**\n\n"
+                f"📂 {result['title']}\n"
+                f"🎵 أضيفت: {result['added']} أغنية"
+            )
+            if result['skipped']:
+                text += f"\n⚠️ تم تجاهل: {result['skipped']} (غير متاحة أو تجاوزت الحد الأقصى)"
+            await status_msg.edit_text(text)
+        elif result["success"]:
             await status_msg.edit_text(
                 f"✅ **تمت الإضافة!**\n\n"
                 f"🎵 {result['title']}\n"
@@ -218,30 +297,130 @@ async def add_song_command(client: Client, message: Message):
     else:
         await message.reply_text(
             "📝 **طريقة الاستخدام:**\n\n"
-            "1️⃣ `/add [رابط]` - إضافة من يوتيوب/ساوند كلاود\n"
+            "1️⃣ `/add [رابط]` - إضافة من يوتيوب/ساوند كلاود (أغنية أو قائمة تشغيل)\n"
             "2️⃣ رد على ملف صوتي بـ `/add` - إضافة ملف مباشر"
         )
 
 
+@app.on_message(filters.command("cancel"))
+async def cancel_command(client: Client, message: Message):
+    """إلغاء التحميلات الجارية"""
+    chat_id = message.chat.id
+    
+    # التحقق من الصلاحيات
+    if message.chat.type != "private":
+        if not await is_admin(message):
+            await message.reply_text("⚠️ هذا الأمر للمشرفين فقط!")
+            return
+    
+    cancelled = radio.cancel_downloads(chat_id)
+    
+    if cancelled:
+        await message.reply_text(f"🛑 **تم إلغاء {cancelled} تحميل**")
+    else:
+        await message.reply_text("❌ لا توجد تحميلات جارية")
+
+
 @app.on_message(filters.command("playlist"))
 async def playlist_command(client: Client, message: Message):
     """عرض قائمة التشغيل"""
     chat_id = message.chat.id
-    songs = db.get_playlist(chat_id)
+    page = await radio.playlist.get(chat_id)
     
-    if not songs:
+    if not page:
         await message.reply_text("📋 قائمة التشغيل فارغة!\n\nأضف أغاني باستخدام `/add`")
         return
     
-    playlist_text = "📋 **قائمة التشغيل:**\n\n"
+    playlist_text, keyboard = page.render(radio.current_song_id(chat_id))
+    await message.reply_text(playlist_text, reply_markup=keyboard)
+
+
+@app.on_callback_query(filters.regex(r"^playlist:"))
+async def playlist_page_callback(client: Client, callback_query: CallbackQuery):
+    """التنقل بين صفحات قائمة التشغيل (تعديل نفس الرسالة)"""
+    cursor = callback_query.data.split(":", 1)[1]
+    if cursor == "noop":
+        await callback_query.answer()
+        return
     
-    for i, song in enumerate(songs, 1):
-        status = "▶️" if song['is_playing'] else ""
-        playlist_text += f"{i}. {status} {song['title']} - `{song['duration']}`\n"
+    chat_id = callback_query.message.chat.id
+    page = await radio.playlist.get(chat_id, cursor)
     
-    playlist_text += f"\n📊 الإجمالي: {len(songs)} أغنية"
+    try:
+        if page:
+            playlist_text, keyboard = page.render(radio.current_song_id(chat_id))
+            await callback_query.message.edit_text(playlist_text, reply_markup=keyboard)
+        else:
+            await callback_query.message.edit_text("📋 قائمة التشغيل فارغة!")
+    except MessageNotModified:
+        pass
     
-    await message.reply_text(playlist_text)
+    await callback_query.answer()
+
+
+@app.on_message(filters.command("listen"))
+async def listen_command(client: Client, message: Message):
+    """الاستماع لمحطة مجموعة أخرى"""
+    if len(message.command) < 2:
+        await message.reply_text(
+            "📝 **الاستخدام:** `/listen [معرف المجموعة]`\n\n"
+            "يبث هنا ما تشغله المجموعة الأخرى (معرفها يظهر عند `/activate`)، "
+            "بعد أن يسمح مشرفوها بذلك بـ `/station on`"
+        )
+        return
+    
+    if not await is_admin(message):
+        await message.reply_text("⚠️ هذا الأمر للمشرفين فقط!")
+        return
+    
+    try:
+        station_id = int(message.command[1])
+    except ValueError:
+        await message.reply_text("❌ الرجاء إدخال معرف صحيح")
+        return
+    
+    result = await radio.listen(message.chat.id, station_id)
+    
+    if result["success"]:
+        now_playing = result['current_song'] or "المحطة متوقفة حالياً"
+        await message.reply_text(
+            f"📡 **تم الاستماع للمحطة!**\n\n"
+            f"🆔 المحطة: `{station_id}`\n"
+            f"🎵 الآن: {now_playing}"
+        )
+    else:
+        await message.reply_text(f"❌ {result['message']}")
+
+
+@app.on_message(filters.command("unlisten"))
+async def unlisten_command(client: Client, message: Message):
+    """إيقاف الاستماع للمحطة"""
+    if not await is_admin(message):
+        await message.reply_text("⚠️ هذا الأمر للمشرفين فقط!")
+        return
+    
+    result = await radio.unlisten(message.chat.id)
+    await message.reply_text(f"📡 {result['message']}")
+
+
+@app.on_message(filters.command("station"))
+async def station_command(client: Client, message: Message):
+    """السماح للمجموعات الأخرى بالاستماع لمحطة هذه المجموعة"""
+    if len(message.command) < 2 or message.command[1].lower() not in ("on", "off"):
+        public = await db.is_public_station(message.chat.id)
+        await message.reply_text(
+            f"📡 **المحطة:** {'عامة' if public else 'خاصة'}\n\n"
+            "📝 **الاستخدام:** `/station on` أو `/station off`\n"
+            f"المجموعات الأخرى تستمع لها بـ `/listen {message.chat.id}`"
+        )
+        return
+    
+    if not await is_admin(message):
+        await message.reply_text("⚠️ هذا الأمر للمشرفين فقط!")
+        return
+    
+    result = await radio.set_public_station(message.chat.id, message.command[1].lower() == "on")
+    await message.reply_text(f"📡 {result['message']}")
 
 
 @app.on_message(filters.command("status"))
@@ -258,21 +437,81 @@ async def status_command(client: Client, message: Message):
             f"📋 في القائمة: {status['queue_size']} أغنية\n"
             f"🔄 التكرار: {'مفعل' if status['autoplay'] else 'معطل'}"
         )
+        if status.get("station"):
+            status_text += f"\n📡 من المحطة: `{status['station']}`"
     else:
         status_text = "⏹️ **الراديو متوقف حالياً**"
     
     await message.reply_text(status_text)
 
 
+@app.on_message(filters.command("stats"))
+async def stats_command(client: Client, message: Message):
+    """إحصائيات التشغيل (والإحصائيات العامة للمطورين)"""
+    chat_id = message.chat.id
+    user_id = message.from_user.id if message.from_user else None
+    
+    # المطور في الخاص أو مع `/stats global`: إحصائيات كل المجموعات
+    is_global = user_id in SUDO_USERS and (
+        chat_id == user_id or message.command[1:2] == ["global"]
+    )
+    
+    # حفظ أحداث التشغيل المنتظرة حتى تظهر في الأرقام
+    await radio.stats.flush()
+    stats = await db.get_statistics(None if is_global else chat_id)
+    
+    if is_global:
+        stats_text = (
+            f"📊 **الإحصائيات العامة**\n\n"
+            f"👥 المجموعات: {stats['total_chats']}\n"
+        )
+    else:
+        stats_text = (
+            f"📊 **إحصائيات الراديو**\n\n"
+            f"🎵 الأغاني: {stats['total_songs']}\n"
+        )
+    stats_text += (
+        f"▶️ التشغيلات: {stats['total_plays']}\n"
+        f"⏱️ ساعات الاستماع: {stats['total_hours']:.1f}\n"
+    )
+    
+    if stats['top_songs']:
+        stats_text += "\n🏆 **الأكثر تشغيلاً:**\n"
+        for i, song in enumerate(stats['top_songs'], 1):
+            stats_text += f"{i}. {song['title']} - {song['plays']} مرة\n"
+    
+    if stats['top_artists']:
+        stats_text += "\n🎤 **أكثر الفنانين:**\n"
+        for i, artist in enumerate(stats['top_artists'], 1):
+            stats_text += f"{i}. {artist['artist']} - {artist['plays']} مرة\n"
+    
+    if stats['daily']:
+        stats_text += "\n📅 **آخر 7 أيام:**\n"
+        for day in stats['daily']:
+            stats_text += f"`{day['day']}` - {day['hours']:.1f} ساعة ({day['plays']} تشغيل)\n"
+    
+    if is_global:
+        state_cache = db.get_state_cache_stats()
+        admin_cache = admins.get_stats()
+        stats_text += (
+            f"\n🧠 ذاكرة الحالة: {state_cache['hit_rate']:.0%} من القراءات بدون قاعدة البيانات\n"
+            f"👮 طلبات المشرفين الموفرة: {admin_cache['api_calls_avoided']}"
+        )
+    
+    await message.reply_text(stats_text)
+
+
 @app.on_message(filters.command("autoplay"))
 async def autoplay_command(client: Client, message: Message):
     """تفعيل/تعطيل التشغيل التلقائي"""
     chat_id = message.chat.id
     
     # التبديل بين التفعيل والتعطيل
-    current_status = db.get_autoplay_status(chat_id)
+    current_status = await db.get_autoplay_status(chat_id)
     new_status = not current_status
-    db.set_autoplay(chat_id, new_status)
+    await db.set_autoplay(chat_id, new_status)
+    if new_status:
+        radio.wake(chat_id)
     
     status_emoji = "✅" if new_status else "❌"
     status_text = "مفعل" if new_status else "معطل"
@@ -287,9 +526,10 @@ async def autoplay_command(client: Client, message: Message):
 async def shuffle_command(client: Client, message: Message):
     """خلط قائمة التشغيل"""
     chat_id = message.chat.id
-    result = db.shuffle_playlist(chat_id)
+    result = await db.shuffle_playlist(chat_id)
     
     if result:
+        radio.refresh_queue(chat_id)
         await message.reply_text("🔀 **تم خلط قائمة التشغيل!**")
     else:
         await message.reply_text("❌ لا توجد أغاني لخلطها")
@@ -306,9 +546,10 @@ async def remove_command(client: Client, message: Message):
         song_index = int(message.command[1]) - 1
         chat_id = message.chat.id
         
-        result = db.remove_song(chat_id, song_index)
+        result = await db.remove_song(chat_id, song_index)
         
         if result:
+            radio.refresh_queue(chat_id)
             await message.reply_text("✅ **تم حذف الأغنية!**")
         else:
             await message.reply_text("❌ رقم أغنية غير صحيح")
@@ -316,15 +557,46 @@ async def remove_command(client: Client, message: Message):
         await message.reply_text("❌ الرجاء إدخال رقم صحيح")
 
 
+@app.on_message(filters.command("move"))
+async def move_command(client: Client, message: Message):
+    """نقل أغنية لمكان آخر في القائمة"""
+    if len(message.command) < 3:
+        await message.reply_text("📝 **الاستخدام:** `/move [رقم الأغنية] [المكان الجديد]`")
+        return
+    
+    try:
+        from_index = int(message.command[1]) - 1
+        to_index = int(message.command[2]) - 1
+        chat_id = message.chat.id
+        
+        result = await db.move_song(chat_id, from_index, to_index)
+        
+        if result:
+            radio.refresh_queue(chat_id)
+            await message.reply_text("✅ **تم نقل الأغنية!**")
+        else:
+            await message.reply_text("❌ رقم أغنية غير صحيح")
+    except ValueError:
+        await message.reply_text("❌ الرجاء إدخال رقم صحيح")
+
+
 # ══════════════════════════════════════════════════════════════
 #                    معالج انضمام البوت للمجموعات
 # ══════════════════════════════════════════════════════════════
 
+@app.on_chat_member_updated()
+async def chat_member_updated(client: Client, update: ChatMemberUpdated):
+    """ترقية أو تنزيل مشرف: تحديث ذاكرة المشرفين"""
+    admins.member_updated(update)
+
+
 @app.on_message(filters.new_chat_members)
 async def bot_added_to_group(client: Client, message: Message):
     """عند إضافة البوت لمجموعة"""
+    me = bot_user or await client.get_me()
+    
     for member in message.new_chat_members:
-        if member.id == (await client.get_me()).id:
+        if member.id == me.id:
             # البوت تمت إضافته
             welcome = (
                 f"👋 **شكراً لإضافتي!**\n\n"
@@ -338,6 +610,7 @@ async def bot_added_to_group(client: Client, message: Message):
                 f"📖 استخدم `/start` لعرض كل الأوامر"
             )
             await message.reply_text(welcome)
+            break
 
 
 # ══════════════════════════════════════════════════════════════
@@ -346,28 +619,62 @@ async def bot_added_to_group(client: Client, message: Message):
 
 async def main():
     """تشغيل البوت والحساب المساعد"""
+    global bot_user, assistant_user
     logger.info("🚀 جاري بدء تشغيل البوت...")
     
-    # بدء الحساب المساعد
-    await userbot.start()
-    logger.info("✅ الحساب المساعد جاهز")
-    
-    # بدء البوت
-    await app.start()
-    logger.info("✅ البوت جاهز")
-    
-    # بدء مدير الراديو
-    asyncio.create_task(radio.auto_player_loop())
-    logger.info("✅ نظام التشغيل التلقائي جاهز")
-    
-    logger.info("🎵 الراديو يعمل الآن!")
+    try:
+        # بدء الحسابات المساعدة
+        for assistant in radio.backend.assistants:
+            await assistant.client.start()
+            assistant.user = await assistant.client.get_me()
+            logger.info(f"✅ الحساب المساعد {assistant.name} جاهز "
+                        f"(@{assistant.user.username or assistant.user.id})")
+        assistant_user = radio.backend.primary.user
+        
+        # بدء البوت
+        await app.start()
+        bot_user = await app.get_me()
+        logger.info(f"✅ البوت جاهز (@{bot_user.username})")
+        
+        # بدء محرك البث ومدير الراديو
+        await radio.backend.start()
+        asyncio.create_task(radio.stats.run())
+        asyncio.create_task(radio.positions.run())
+        asyncio.create_task(radio.auto_player_loop())
+        logger.info("✅ نظام التشغيل التلقائي جاهز")
+        
+        logger.info("🎵 الراديو يعمل الآن!")
+        
+        # إبقاء البوت قيد التشغيل حتى إشارة الإيقاف
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        await shutdown()
+
+
+async def shutdown():
+    """حفظ ما في الذاكرة وإيقاف عمليات البث وقاعدة البيانات قبل خروج البوت
     
-    # إبقاء البوت قيد التشغيل
-    await asyncio.Event().wait()
+    أحداث التشغيل ومواضع المجموعات تُحفظ على فترات، فما لم يُحفظ منها بعد
+    يُحفظ هنا حتى لا يضيع عند الإيقاف.
+    """
+    logger.info("⏹️ جاري إيقاف البوت...")
+    try:
+        await radio.stats.flush()
+        await radio.positions.checkpoint()
+    except Exception as e:
+        logger.error(f"تعذر حفظ الإحصائيات ومواضع التشغيل: {e}")
+    if radio.workers:
+        await radio.workers.close()
+    db.close()
+    logger.info("⏹️ تم إيقاف البوت")
 
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        logger.info("⏹️ تم إيقاف البوت")
+        pass  # الإيقاف قبل تسجيل معالج الإشارة (shutdown نُفذت في main)
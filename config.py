@@ -16,6 +16,10 @@ BOT_TOKEN = "your_bot_token_here"
 # Session String للحساب المساعد (سيتم إنشاؤه)
 SESSION_STRING = "your_session_string_here"
 
+# Session String لحسابات مساعدة إضافية (اختياري): المكالمات تتوزع على كل الحسابات
+# كل حساب يجب أن يكون عضواً في المجموعات التي قد يُشغل فيها
+EXTRA_SESSION_STRINGS = []
+
 
 # ════════════════════════════════════════════════════════════
 #                    إعدادات قاعدة البيانات
@@ -23,6 +27,18 @@ SESSION_STRING = "your_session_string_here"
 
 DATABASE_URL = "sqlite:///radio_bot.db"  # أو استخدم PostgreSQL/MySQL
 
+# مستوى المزامنة مع القرص (NORMAL آمن مع وضع WAL وأسرع من FULL)
+DB_SYNCHRONOUS = "NORMAL"
+
+# عدد الاستعلامات المجهزة المحفوظة لكل اتصال
+DB_CACHED_STATEMENTS = 256
+
+# مدة انتظار القفل قبل الفشل (بالثواني)
+DB_BUSY_TIMEOUT = 30
+
+# عدد خيوط القراءة في الواجهة غير المتزامنة (الكتابة دائماً على خيط واحد)
+DB_READER_THREADS = 4
+
 
 # ════════════════════════════════════════════════════════════
 #                    إعدادات الراديو
@@ -34,15 +50,113 @@ DOWNLOAD_FOLDER = "downloads"
 # الحد الأقصى لحجم الملف (بالميجابايت)
 MAX_FILE_SIZE = 200
 
+# الحد الأقصى لمساحة الأغاني المحملة على القرص (بالميجابايت)
+# عند تجاوزه تُحذف الملفات الأقدم تشغيلاً ويُعاد تحميلها عند الحاجة
+CACHE_MAX_SIZE = 5000
+
 # جودة الصوت
 AUDIO_QUALITY = "192"  # kbps
 
+# عدد عمال التحميل والتحويل المتزامنين
+DOWNLOAD_WORKERS = 3
+
+# نوع العمال: "thread" (خيوط) أو "process" (عمليات منفصلة)
+DOWNLOAD_EXECUTOR = "thread"
+
+# الحد الأقصى للتحميلات المتزامنة لكل مجموعة
+DOWNLOAD_PER_CHAT_LIMIT = 1
+
+# عدد محاولات استكمال تحميل ملف تليجرام بعد انقطاعه
+TELEGRAM_DOWNLOAD_RETRIES = 3
+
+# حجم أول جزء من ملف تليجرام قبل بدء تشغيله أثناء التحميل (بالميجابايت)
+TELEGRAM_PLAYBACK_BUFFER = 1
+
+# محرك البث: "pytgcalls" للمكالمات الصوتية، أو "file"/"null" للاختبار
+STREAM_BACKEND = "pytgcalls"
+
+# مجلد الأنابيب وملفات البث المحلية
+STREAM_SINK_FOLDER = "streams"
+
+# عدد عمليات البث المنفصلة عن عملية الأوامر (0: كل شيء في عملية واحدة)
+# كل عملية تبث جزءاً من المجموعات، فلا ينافس فك الترميز أوامر البوت على المعالج
+WORKER_PROCESSES = 0
+
+# مقبس يونكس للاتصال بين عملية الأوامر وعمليات البث
+WORKER_SOCKET = "streams/workers.sock"
+
+# مهلة انتظار جاهزية عمليات البث عند التشغيل (بالثواني)
+WORKER_START_TIMEOUT = 60
+
+# مدة الصوت المرسل مسبقاً لتجنب التقطيع (بالمللي ثانية)
+STREAM_PREBUFFER_MS = 100
+
+# مدة الصوت المحفوظ لكل محطة مشتركة ليلحق بها المستمع المتأخر (بالمللي ثانية)
+STATION_BUFFER_MS = 1000
+
+# مهلة انتظار بيانات جديدة عند تشغيل ملف ما زال قيد التحميل (بالثواني)
+STREAM_FOLLOW_TIMEOUT = 10
+
+# الفترة بين حفظ موضع التشغيل في قاعدة البيانات (بالثواني)
+POSITION_CHECKPOINT_INTERVAL = 15
+
+# عدد المجموعات التي يُستكمل تشغيلها في نفس الوقت بعد إعادة تشغيل البوت
+RESUME_CONCURRENCY = 10
+
+# بث أغاني الروابط مباشرة من المصدر بدلاً من تحميلها وتحويلها إلى MP3 أولاً
+# (الملف يُحمّل فقط إذا تعذر البث المباشر)
+STREAM_FROM_SOURCE = True
+
+# مهلة إضافية بعد مدة الأغنية قبل الانتقال إذا لم يصل حدث انتهاء البث (بالثواني)
+STREAM_END_GRACE = 2
+
+# عدد الأغاني القادمة التي تُجهز مسبقاً لكل مجموعة
+PREFETCH_COUNT = 3
+
+# مدة الصوت المفكوك مسبقاً من بداية الأغنية التالية (بالمللي ثانية)
+PREFETCH_PREROLL_MS = 500
+
+# أقصى مدة بقاء أحداث التشغيل في الذاكرة قبل حفظها (بالثواني)
+STATS_FLUSH_INTERVAL = 5
+
+# عدد الأحداث الذي يُحفظ عنده فوراً دون انتظار المدة
+STATS_BATCH_SIZE = 200
+
+# عدد الأغاني في كل صفحة من /playlist
+PLAYLIST_PAGE_SIZE = 20
+
+# عدد المجموعات التي تُحفظ صفحات قوائمها المنسقة في الذاكرة
+PLAYLIST_CACHE_CHATS = 500
+
 # التشغيل التلقائي (افتراضي)
 DEFAULT_AUTOPLAY = True
 
 # الحد الأقصى للأغاني في القائمة
 MAX_PLAYLIST_SIZE = 1000
 
+# عدد المقاطع التي تُستكمل معلوماتها بالتوازي بعد استيراد قائمة تشغيل
+IMPORT_RESOLVE_WORKERS = 4
+
+
+# ════════════════════════════════════════════════════════════
+#                    إعدادات الحسابات المساعدة
+# ════════════════════════════════════════════════════════════
+
+# أقصى عدد مكالمات صوتية متزامنة لكل حساب مساعد
+ASSISTANT_MAX_CALLS = 100
+
+# أقصى حمل للحساب نسبة لمتوسط الحمل قبل توجيه مجموعات جديدة لغيره
+ASSISTANT_LOAD_FACTOR = 1.25
+
+# عدد النقاط الوهمية لكل حساب في حلقة التوزيع (توزيع أكثر تساوياً)
+ASSISTANT_VIRTUAL_NODES = 64
+
+# مدة استبعاد الحساب بعد انقطاع اتصاله قبل إعادة استخدامه (بالثواني)
+ASSISTANT_RETRY_AFTER = 60
+
+# مدة انتظار عودة اتصال الحساب بعد انقطاعه قبل نقل مجموعاته (بالثواني)
+ASSISTANT_DISCONNECT_GRACE = 30
+
 
 # ════════════════════════════════════════════════════════════
 #                    إعدادات المشرفين
@@ -53,6 +167,9 @@ SUDO_USERS = [
     123456789,  # ضع معرفك هنا
 ]
 
+# مدة صلاحية قائمة مشرفي المجموعة في الذاكرة (بالثواني)
+ADMIN_CACHE_TTL = 300
+
 
 # ════════════════════════════════════════════════════════════
 #                    رسائل النظام
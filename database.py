@@ -2,11 +2,223 @@
 نظام قاعدة البيانات - Database System
 """
 
+import asyncio
+import functools
 import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
-import random
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from config import (
+    DB_SYNCHRONOUS, DB_CACHED_STATEMENTS, DB_BUSY_TIMEOUT, DB_READER_THREADS
+)
+
+
+# ══════════════════════════════════════════════════════════════
+#                    ترقيات المخطط
+# ══════════════════════════════════════════════════════════════
+
+# المسافة بين مواقع الأغاني المتتالية: الإدراج بين أغنيتين لا يغير غيرهما
+POSITION_GAP = 1024
+
+# معرف المجموعة الوهمي لصفوف الإحصائيات العامة (معرفات تليجرام لا تكون صفراً)
+GLOBAL_STATS_CHAT = 0
+
+# حالات ملف الأغنية: معلومات فقط ← جاري التحميل ← على القرص ← حُذف (يُعاد تحميله عند الحاجة)
+SONG_PENDING = "pending"
+SONG_FETCHING = "fetching"
+SONG_READY = "ready"
+SONG_EVICTED = "evicted"
+
+# (الإصدار، الوصف، التعليمات) - تُطبق مرة واحدة بالترتيب، ولا تُعدل بعد نشرها
+SCHEMA_MIGRATIONS = [
+    (1, "ذاكرة الصوت المؤقتة", [
+        """
+        CREATE TABLE IF NOT EXISTS media_cache (
+            cache_key TEXT PRIMARY KEY,
+            source_url TEXT,
+            title TEXT,
+            artist TEXT,
+            duration INTEGER,
+            file_path TEXT NOT NULL,
+            file_size INTEGER DEFAULT 0,
+            ref_count INTEGER DEFAULT 0,
+            present BOOLEAN DEFAULT 1,
+            last_played REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_media_cache_source_url ON media_cache (source_url)",
+        "ALTER TABLE songs ADD COLUMN cache_key TEXT",
+    ]),
+    (2, "فهارس الاستعلامات الأساسية", [
+        "CREATE INDEX IF NOT EXISTS idx_songs_chat ON songs (chat_id)",
+        "CREATE INDEX IF NOT EXISTS idx_songs_chat_added ON songs (chat_id, added_date)",
+        # get_statistics: الأغنية الأكثر تشغيلاً
+        "CREATE INDEX IF NOT EXISTS idx_songs_chat_play_count ON songs (chat_id, play_count)",
+        "CREATE INDEX IF NOT EXISTS idx_statistics_chat ON statistics (chat_id, played_at)",
+        "CREATE INDEX IF NOT EXISTS idx_statistics_song ON statistics (song_id)",
+        "CREATE INDEX IF NOT EXISTS idx_chats_active ON chats (is_active)",
+    ]),
+    (3, "ترتيب قائمة التشغيل بعمود position", [
+        "ALTER TABLE songs ADD COLUMN position INTEGER",
+        # الترتيب الحالي للتشغيل (حسب id) مع فراغات بين المواقع
+        f"""
+        UPDATE songs SET position = ranked.rank * {POSITION_GAP}
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY id) AS rank
+            FROM songs
+        ) AS ranked
+        WHERE songs.id = ranked.id
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_songs_chat_position ON songs (chat_id, position)",
+        "DROP INDEX IF EXISTS idx_songs_chat_added",
+        # موقع الأغنية الحالية، للمتابعة بعدها حتى لو حُذفت من القائمة
+        "ALTER TABLE playback_state ADD COLUMN queue_position INTEGER",
+        """
+        UPDATE playback_state SET queue_position = (
+            SELECT position FROM songs WHERE songs.id = playback_state.current_song_id
+        )
+        """,
+    ]),
+    (4, "أحداث التشغيل في جدول الإحصائيات", [
+        "ALTER TABLE statistics ADD COLUMN skipped BOOLEAN DEFAULT 0",
+        # المدة المسموعة فعلياً بالثواني
+        "ALTER TABLE statistics ADD COLUMN listened REAL DEFAULT 0",
+    ]),
+    (5, "جداول الإحصائيات المجمعة", [
+        # مفتاح الأغنية: المحتوى المشترك إن وجد، وإلا العنوان
+        """
+        CREATE TABLE IF NOT EXISTS stats_songs (
+            chat_id INTEGER NOT NULL,
+            song_key TEXT NOT NULL,
+            title TEXT,
+            artist TEXT,
+            plays INTEGER DEFAULT 0,
+            listened REAL DEFAULT 0,
+            PRIMARY KEY (chat_id, song_key)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_stats_songs_plays ON stats_songs (chat_id, plays)",
+        """
+        CREATE TABLE IF NOT EXISTS stats_artists (
+            chat_id INTEGER NOT NULL,
+            artist TEXT NOT NULL,
+            plays INTEGER DEFAULT 0,
+            listened REAL DEFAULT 0,
+            PRIMARY KEY (chat_id, artist)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_stats_artists_plays ON stats_artists (chat_id, plays)",
+        """
+        CREATE TABLE IF NOT EXISTS stats_daily (
+            chat_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            plays INTEGER DEFAULT 0,
+            listened REAL DEFAULT 0,
+            PRIMARY KEY (chat_id, day)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS stats_totals (
+            chat_id INTEGER PRIMARY KEY,
+            plays INTEGER DEFAULT 0,
+            listened REAL DEFAULT 0
+        )
+        """,
+        # ملء الجداول من السجل السابق: عدادات الأغاني ثم أحداث التشغيل المحفوظة
+        """
+        INSERT OR IGNORE INTO stats_songs (chat_id, song_key, title, artist, plays)
+        SELECT chat_id, COALESCE(cache_key, title), MAX(title), MAX(artist), SUM(play_count)
+        FROM songs WHERE play_count > 0
+        GROUP BY chat_id, COALESCE(cache_key, title)
+        """,
+        f"""
+        INSERT OR IGNORE INTO stats_songs (chat_id, song_key, title, artist, plays)
+        SELECT {GLOBAL_STATS_CHAT}, COALESCE(cache_key, title), MAX(title), MAX(artist), SUM(play_count)
+        FROM songs WHERE play_count > 0
+        GROUP BY COALESCE(cache_key, title)
+        """,
+        """
+        INSERT OR IGNORE INTO stats_artists (chat_id, artist, plays)
+        SELECT chat_id, COALESCE(artist, 'غير معروف'), SUM(play_count)
+        FROM songs WHERE play_count > 0
+        GROUP BY chat_id, COALESCE(artist, 'غير معروف')
+        """,
+        f"""
+        INSERT OR IGNORE INTO stats_artists (chat_id, artist, plays)
+        SELECT {GLOBAL_STATS_CHAT}, COALESCE(artist, 'غير معروف'), SUM(play_count)
+        FROM songs WHERE play_count > 0
+        GROUP BY COALESCE(artist, 'غير معروف')
+        """,
+        """
+        INSERT OR IGNORE INTO stats_daily (chat_id, day, plays, listened)
+        SELECT chat_id, date(played_at, 'unixepoch', 'localtime'), COUNT(*), SUM(listened)
+        FROM statistics
+        GROUP BY chat_id, date(played_at, 'unixepoch', 'localtime')
+        """,
+        f"""
+        INSERT OR IGNORE INTO stats_daily (chat_id, day, plays, listened)
+        SELECT {GLOBAL_STATS_CHAT}, date(played_at, 'unixepoch', 'localtime'), COUNT(*), SUM(listened)
+        FROM statistics
+        GROUP BY date(played_at, 'unixepoch', 'localtime')
+        """,
+        """
+        INSERT OR IGNORE INTO stats_totals (chat_id, plays, listened)
+        SELECT chat_id, COALESCE(SUM(play_count), 0),
+               (SELECT COALESCE(SUM(listened), 0) FROM statistics st WHERE st.chat_id = songs.chat_id)
+        FROM songs GROUP BY chat_id
+        """,
+        f"""
+        INSERT OR IGNORE INTO stats_totals (chat_id, plays, listened)
+        SELECT {GLOBAL_STATS_CHAT}, COALESCE(SUM(play_count), 0),
+               (SELECT COALESCE(SUM(listened), 0) FROM statistics)
+        FROM songs
+        """,
+    ]),
+    (6, "فهرس الأغاني حسب المحتوى المشترك", [
+        "CREATE INDEX IF NOT EXISTS idx_songs_cache_key ON songs (cache_key)",
+    ]),
+    (7, "حالة ملف الأغنية", [
+        f"ALTER TABLE songs ADD COLUMN state TEXT NOT NULL DEFAULT '{SONG_PENDING}'",
+        # الملفات المرفوعة وملفات الذاكرة الموجودة جاهزة، وما حُذف من الذاكرة محذوف
+        f"""
+        UPDATE songs SET state = CASE
+            WHEN cache_key IS NULL AND file_path IS NOT NULL THEN '{SONG_READY}'
+            WHEN EXISTS (
+                SELECT 1 FROM media_cache m
+                WHERE m.cache_key = songs.cache_key AND m.present = 1
+            ) THEN '{SONG_READY}'
+            WHEN file_path IS NOT NULL THEN '{SONG_EVICTED}'
+            ELSE '{SONG_PENDING}'
+        END
+        """,
+    ]),
+    (8, "فهرس المحتوى بالبصمة", [
+        "ALTER TABLE media_cache ADD COLUMN content_hash TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_media_cache_hash ON media_cache (content_hash)",
+        # مفاتيح مختلفة لنفس المحتوى (مثل ملف أعيد رفعه) تشير للملف الأصلي
+        """
+        CREATE TABLE IF NOT EXISTS media_aliases (
+            alias TEXT PRIMARY KEY,
+            cache_key TEXT NOT NULL
+        )
+        """,
+    ]),
+    (9, "المحطات المشتركة", [
+        # المجموعة المستمعة تبث ما تشغله مجموعة أخرى (المحطة) بدلاً من قائمتها
+        "ALTER TABLE chats ADD COLUMN station_id INTEGER",
+        """
+        CREATE INDEX IF NOT EXISTS idx_chats_station ON chats (station_id)
+        WHERE station_id IS NOT NULL
+        """,
+        # لا يُستمع لمحطة إلا إذا سمح مشرفوها بذلك
+        "ALTER TABLE chats ADD COLUMN public_station BOOLEAN DEFAULT 0",
+    ]),
+]
 
 
 class Database:
@@ -14,14 +226,55 @@ class Database:
     
     def __init__(self, db_file: str = "radio_bot.db"):
         self.db_file = db_file
+        
+        # اتصال دائم لكل خيط بدلاً من فتح اتصال جديد في كل استدعاء
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        
         self.init_database()
     
-    def get_connection(self):
-        """إنشاء اتصال بقاعدة البيانات"""
-        conn = sqlite3.connect(self.db_file)
+    def get_connection(self) -> sqlite3.Connection:
+        """الحصول على الاتصال الدائم الخاص بالخيط الحالي"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """فتح اتصال جديد مع إعدادات الأداء"""
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=DB_BUSY_TIMEOUT,
+            cached_statements=DB_CACHED_STATEMENTS,
+            check_same_thread=False
+        )
         conn.row_factory = sqlite3.Row
+        
+        # وضع WAL: القراءة لا تنتظر الكتابة، والكتابة لا تعيد كتابة الملف كاملاً
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        conn.execute("PRAGMA temp_store = MEMORY")
         return conn
     
+    def close(self):
+        """إغلاق جميع الاتصالات المفتوحة"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        
+        for conn in connections:
+            try:
+                # تحديث إحصائيات المخطط إذا لزم (توصية SQLite قبل الإغلاق)
+                conn.execute("PRAGMA optimize")
+                conn.close()
+            except sqlite3.Error:
+                pass
+        
+        self._local = threading.local()
+    
     def init_database(self):
         """إنشاء جداول قاعدة البيانات"""
         conn = self.get_connection()
@@ -86,7 +339,40 @@ class Database:
         """)
         
         conn.commit()
-        conn.close()
+        
+        self._migrate(conn)
+        
+        # تحميلات انقطعت بإغلاق البوت
+        self.reset_media_fetching()
+    
+    def _migrate(self, conn: sqlite3.Connection):
+        """تطبيق ترقيات المخطط الناقصة بالترتيب (الإصدار محفوظ في user_version)"""
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA user_version")
+        version = cursor.fetchone()[0]
+        
+        for target, description, statements in SCHEMA_MIGRATIONS:
+            if target <= version:
+                continue
+            
+            try:
+                cursor.execute("BEGIN")
+                for statement in statements:
+                    self._apply_migration_statement(cursor, statement)
+                cursor.execute(f"PRAGMA user_version = {target}")
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"خطأ في ترقية قاعدة البيانات ({target}: {description}): {e}")
+                raise
+    
+    def _apply_migration_statement(self, cursor: sqlite3.Cursor, statement: str):
+        try:
+            cursor.execute(statement)
+        except sqlite3.OperationalError as e:
+            # قواعد بيانات أضيف فيها العمود قبل وجود نظام الترقيات
+            if "duplicate column name" not in str(e):
+                raise
     
     # ══════════════════════════════════════════════════════════════
     #                    إدارة المجموعات/القنوات
@@ -112,10 +398,9 @@ class Database:
             conn.commit()
             return True
         except Exception as e:
+            conn.rollback()
             print(f"خطأ في إضافة المجموعة: {e}")
             return False
-        finally:
-            conn.close()
     
     def is_chat_active(self, chat_id: int) -> bool:
         """التحقق من تفعيل المجموعة"""
@@ -127,10 +412,33 @@ class Database:
         """, (chat_id,))
         
         result = cursor.fetchone()
-        conn.close()
         
         return bool(result and result['is_active'])
     
+    def get_chat_state(self, chat_id: int) -> Optional[Dict]:
+        """كل حالة المجموعة في استعلام واحد (لذاكرة الحالة في AsyncDatabase)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT 
+                c.is_active, c.autoplay,
+                ps.chat_id AS state_chat_id, ps.current_song_id, ps.is_playing,
+                ps.is_paused, ps.position, ps.queue_position, ps.last_update,
+                s.title, s.duration,
+                (SELECT COUNT(*) FROM songs WHERE chat_id = c.chat_id) AS song_count
+            FROM chats c
+            LEFT JOIN playback_state ps ON ps.chat_id = c.chat_id
+            LEFT JOIN songs s ON s.id = ps.current_song_id
+            WHERE c.chat_id = ?
+        """, (chat_id,))
+        
+        state = cursor.fetchone()
+        
+        if state:
+            return dict(state)
+        return None
+    
     def get_all_active_chats(self) -> List[int]:
         """الحصول على جميع المجموعات النشطة"""
         conn = self.get_connection()
@@ -141,10 +449,107 @@ class Database:
         """)
         
         chats = [row['chat_id'] for row in cursor.fetchall()]
-        conn.close()
         
         return chats
     
+    def get_autoplay_candidates(self) -> List[int]:
+        """المجموعات المتوقفة التي يجب أن يبدأ فيها التشغيل التلقائي"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT c.chat_id FROM chats c
+            JOIN playback_state ps ON ps.chat_id = c.chat_id
+            WHERE c.is_active = 1 AND c.autoplay = 1
+              AND ps.is_playing = 0 AND ps.is_paused = 0
+              AND EXISTS (SELECT 1 FROM songs s WHERE s.chat_id = c.chat_id)
+        """)
+        
+        return [row['chat_id'] for row in cursor.fetchall()]
+    
+    def get_resumable_chats(self) -> List[Dict]:
+        """المجموعات التي كانت قيد التشغيل عند توقف البوت (لاستكمالها بعد إعادة التشغيل)
+        
+        كل عنصر: chat_id، الموضع المحفوظ، هل كانت متوقفة مؤقتاً، والأغنية
+        الحالية كاملة (None إذا حُذفت من القائمة)، ووقت بدء تشغيلها المسجل
+        في الإحصائيات (None إذا لم يُحفظ بعد).
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT c.chat_id AS resume_chat_id, ps.position AS resume_position,
+                   ps.is_paused AS resume_paused,
+                   (SELECT MAX(st.played_at) FROM statistics st
+                    WHERE st.chat_id = c.chat_id AND st.song_id = ps.current_song_id
+                   ) AS resume_played_at,
+                   s.*
+            FROM chats c
+            JOIN playback_state ps ON ps.chat_id = c.chat_id
+            LEFT JOIN songs s ON s.id = ps.current_song_id
+            WHERE c.is_active = 1 AND ps.is_playing = 1
+        """)
+        
+        chats = []
+        for row in cursor.fetchall():
+            song = dict(row)
+            chats.append({
+                'chat_id': song.pop('resume_chat_id'),
+                'position': song.pop('resume_position') or 0,
+                'is_paused': bool(song.pop('resume_paused')),
+                'played_at': song.pop('resume_played_at'),
+                'song': song if song['id'] is not None else None,
+            })
+        
+        return chats
+    
+    def set_station(self, chat_id: int, station_id: Optional[int]):
+        """الاستماع لمحطة مجموعة أخرى (None لإيقاف الاستماع)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE chats SET station_id = ? WHERE chat_id = ?
+        """, (station_id, chat_id))
+        
+        conn.commit()
+    
+    def set_public_station(self, chat_id: int, public: bool):
+        """السماح للمجموعات الأخرى بالاستماع لمحطة المجموعة (أو منعه)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE chats SET public_station = ? WHERE chat_id = ?
+        """, (public, chat_id))
+        
+        conn.commit()
+    
+    def is_public_station(self, chat_id: int) -> bool:
+        """هل تسمح المجموعة بالاستماع لمحطتها"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT public_station FROM chats WHERE chat_id = ?
+        """, (chat_id,))
+        
+        result = cursor.fetchone()
+        
+        return bool(result and result['public_station'])
+    
+    def get_station_listeners(self) -> List[Dict]:
+        """كل المجموعات المستمعة لمحطات: [{chat_id, station_id}]"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT chat_id, station_id FROM chats
+            WHERE station_id IS NOT NULL AND is_active = 1
+        """)
+        
+        return [dict(row) for row in cursor.fetchall()]
+    
     # ══════════════════════════════════════════════════════════════
     #                    إدارة الأغاني
     # ══════════════════════════════════════════════════════════════
@@ -152,31 +557,136 @@ class Database:
     def add_song(self, chat_id: int, title: str, file_id: str = None,
                  file_path: str = None, duration: int = 0, artist: str = None,
                  source_type: str = "file", source_url: str = None,
-                 added_by: int = None) -> Optional[int]:
-        """إضافة أغنية جديدة"""
+                 added_by: int = None, cache_key: str = None,
+                 index: int = None) -> Optional[int]:
+        """إضافة أغنية جديدة (في نهاية القائمة، أو لتصبح رقم index فيها)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
+            position = self._position_for_insert(cursor, chat_id, index)
+            cache_key = self._canonical_key(cursor, cache_key)
+            file_path, state = self._song_file_state(cursor, file_path, cache_key)
+            
             cursor.execute("""
                 INSERT INTO songs (
-                    chat_id, title, file_id, file_path, duration,
-                    artist, source_type, source_url, added_by
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (chat_id, title, file_id, file_path, duration,
-                  artist, source_type, source_url, added_by))
+                    chat_id, title, file_id, file_path, duration, artist,
+                    source_type, source_url, added_by, cache_key, position, state
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (chat_id, title, file_id, file_path, duration, artist,
+                  source_type, source_url, added_by, cache_key, position, state))
             
             song_id = cursor.lastrowid
+            
+            # الأغنية تشير لملف مشترك في الذاكرة المؤقتة
+            if cache_key:
+                cursor.execute("""
+                    UPDATE media_cache SET ref_count = ref_count + 1
+                    WHERE cache_key = ?
+                """, (cache_key,))
+            
             conn.commit()
             return song_id
         except Exception as e:
+            conn.rollback()
             print(f"خطأ في إضافة الأغنية: {e}")
             return None
-        finally:
-            conn.close()
+    
+    def add_songs_bulk(self, chat_id: int, songs: List[Dict], max_size: int,
+                       added_by: int = None) -> List[int]:
+        """إضافة عدة أغاني في نهاية القائمة بمعاملة واحدة
+        
+        تُضاف الأغاني بالترتيب حتى يصل حجم القائمة إلى max_size، والباقي يُهمل.
+        كل أغنية قاموس بمفاتيح add_song (title, duration, artist, source_url, cache_key...).
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("""
+                SELECT COUNT(*), MAX(position) FROM songs WHERE chat_id = ?
+            """, (chat_id,))
+            count, last_position = cursor.fetchone()
+            songs = songs[:max(0, max_size - count)]
+            position = last_position or 0
+            
+            song_ids = []
+            references = Counter()
+            for song in songs:
+                position += POSITION_GAP
+                cache_key = self._canonical_key(cursor, song.get('cache_key'))
+                file_path, state = self._song_file_state(cursor, song.get('file_path'), cache_key)
+                if cache_key:
+                    references[cache_key] += 1
+                cursor.execute("""
+                    INSERT INTO songs (
+                        chat_id, title, file_id, file_path, duration, artist,
+                        source_type, source_url, added_by, cache_key, position, state
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (chat_id, song['title'], song.get('file_id'), file_path,
+                      song.get('duration') or 0, song.get('artist'),
+                      song.get('source_type', 'url'), song.get('source_url'),
+                      added_by, cache_key, position, state))
+                song_ids.append(cursor.lastrowid)
+            
+            # المراجع على الملفات المشتركة الموجودة مسبقاً
+            cursor.executemany("""
+                UPDATE media_cache SET ref_count = ref_count + ?
+                WHERE cache_key = ?
+            """, [(n, cache_key) for cache_key, n in references.items()])
+            
+            conn.commit()
+            return song_ids
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في إضافة الأغاني: {e}")
+            return []
+    
+    def _canonical_key(self, cursor: sqlite3.Cursor, cache_key: Optional[str]) -> Optional[str]:
+        """المفتاح الأصلي للمحتوى إذا كان cache_key اسماً بديلاً له"""
+        if not cache_key:
+            return cache_key
+        
+        cursor.execute("""
+            SELECT cache_key FROM media_aliases WHERE alias = ?
+        """, (cache_key,))
+        alias = cursor.fetchone()
+        return alias['cache_key'] if alias else cache_key
+    
+    def _song_file_state(self, cursor: sqlite3.Cursor, file_path: Optional[str],
+                         cache_key: Optional[str]) -> Tuple[Optional[str], str]:
+        """مسار الملف وحالته لأغنية جديدة (الملف المشترك الموجود يُستخدم مباشرة)"""
+        if file_path:
+            return file_path, SONG_READY
+        
+        if cache_key:
+            cursor.execute("""
+                SELECT file_path FROM media_cache WHERE cache_key = ? AND present = 1
+            """, (cache_key,))
+            entry = cursor.fetchone()
+            if entry:
+                return entry['file_path'], SONG_READY
+        
+        return None, SONG_PENDING
+    
+    def update_song_metadata(self, song_id: int, title: str = None,
+                             artist: str = None, duration: int = None):
+        """استكمال معلومات أغنية أضيفت بمعلومات ناقصة"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            UPDATE songs SET
+                title = COALESCE(?, title),
+                artist = COALESCE(?, artist),
+                duration = COALESCE(?, duration)
+            WHERE id = ?
+        """, (title, artist, duration, song_id))
+        
+        conn.commit()
     
     def get_playlist(self, chat_id: int) -> List[Dict]:
-        """الحصول على قائمة التشغيل"""
+        """الحصول على قائمة التشغيل (بترتيب التشغيل)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -188,7 +698,7 @@ class Database:
             FROM songs s
             LEFT JOIN playback_state ps ON ps.chat_id = s.chat_id
             WHERE s.chat_id = ?
-            ORDER BY s.added_date DESC
+            ORDER BY s.position ASC
         """, (chat_id,))
         
         songs = []
@@ -202,14 +712,62 @@ class Database:
                 'file_path': row['file_path'],
                 'source_type': row['source_type'],
                 'play_count': row['play_count'],
+                'state': row['state'],
                 'is_playing': bool(row['is_playing'])
             })
         
-        conn.close()
         return songs
     
-    def get_next_song(self, chat_id: int) -> Optional[Dict]:
-        """الحصول على الأغنية التالية"""
+    def get_playlist_page(self, chat_id: int, limit: int,
+                          after: int = None, before: int = None) -> Dict:
+        """صفحة من قائمة التشغيل بدون OFFSET (ترقيم بالمفتاح)
+        
+        after: بعد الموقع المعطى (الصفحة التالية)، before: قبله (الصفحة السابقة)،
+        وبدونهما الصفحة الأولى. offset هو عدد الأغاني قبل أول أغنية في الصفحة.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        if before is not None:
+            cursor.execute("""
+                SELECT id, title, duration, position FROM songs
+                WHERE chat_id = ? AND position < ?
+                ORDER BY position DESC LIMIT ?
+            """, (chat_id, before, limit))
+            rows = cursor.fetchall()[::-1]
+        else:
+            cursor.execute("""
+                SELECT id, title, duration, position FROM songs
+                WHERE chat_id = ? AND position > ?
+                ORDER BY position ASC LIMIT ?
+            """, (chat_id, after if after is not None else -2**63, limit))
+            rows = cursor.fetchall()
+        
+        cursor.execute("""
+            SELECT COUNT(*) FROM songs WHERE chat_id = ?
+        """, (chat_id,))
+        total = cursor.fetchone()[0]
+        
+        offset = 0
+        if rows:
+            cursor.execute("""
+                SELECT COUNT(*) FROM songs WHERE chat_id = ? AND position < ?
+            """, (chat_id, rows[0]['position']))
+            offset = cursor.fetchone()[0]
+        
+        return {
+            'songs': [{
+                'id': row['id'],
+                'title': row['title'],
+                'duration': self._format_duration(row['duration']),
+                'position': row['position'],
+            } for row in rows],
+            'offset': offset,
+            'total': total,
+        }
+    
+    def get_next_song(self, chat_id: int, wrap: bool = True) -> Optional[Dict]:
+        """الحصول على الأغنية التالية (wrap: العودة للأولى عند نهاية القائمة)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -220,49 +778,85 @@ class Database:
         
         current = cursor.fetchone()
         current_id = current['current_song_id'] if current else None
+        position = self._song_position(cursor, chat_id, current_id) if current_id else None
         
         # الحصول على الأغنية التالية
-        if current_id:
+        if position is not None:
             cursor.execute("""
                 SELECT * FROM songs 
-                WHERE chat_id = ? AND id > ?
-                ORDER BY id ASC LIMIT 1
-            """, (chat_id, current_id))
+                WHERE chat_id = ? AND position > ?
+                ORDER BY position ASC LIMIT 1
+            """, (chat_id, position))
         else:
             cursor.execute("""
                 SELECT * FROM songs 
                 WHERE chat_id = ?
-                ORDER BY id ASC LIMIT 1
+                ORDER BY position ASC LIMIT 1
             """, (chat_id,))
         
         song = cursor.fetchone()
         
         # إذا لم توجد، ارجع للأولى (التشغيل التلقائي)
-        if not song:
+        if not song and wrap:
             cursor.execute("""
                 SELECT * FROM songs 
                 WHERE chat_id = ?
-                ORDER BY id ASC LIMIT 1
+                ORDER BY position ASC LIMIT 1
             """, (chat_id,))
             song = cursor.fetchone()
         
-        conn.close()
-        
         if song:
             return dict(song)
         return None
     
+    def get_upcoming_songs(self, chat_id: int, after_id: int, limit: int,
+                           wrap: bool = True) -> List[Dict]:
+        """الأغاني التي تلي after_id بنفس ترتيب get_next_song"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        position = self._song_position(cursor, chat_id, after_id) if after_id else None
+        
+        if position is None:
+            cursor.execute("""
+                SELECT * FROM songs 
+                WHERE chat_id = ?
+                ORDER BY position ASC LIMIT ?
+            """, (chat_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        
+        cursor.execute("""
+            SELECT * FROM songs 
+            WHERE chat_id = ? AND position > ?
+            ORDER BY position ASC LIMIT ?
+        """, (chat_id, position, limit))
+        
+        songs = [dict(row) for row in cursor.fetchall()]
+        
+        # إكمال العدد من بداية القائمة (التشغيل التلقائي)
+        if len(songs) < limit and wrap:
+            cursor.execute("""
+                SELECT * FROM songs 
+                WHERE chat_id = ? AND position < ?
+                ORDER BY position ASC LIMIT ?
+            """, (chat_id, position, limit - len(songs)))
+            songs.extend(dict(row) for row in cursor.fetchall())
+        
+        return songs
+    
     def remove_song(self, chat_id: int, song_index: int) -> bool:
         """حذف أغنية"""
+        if song_index < 0:
+            return False
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             # الحصول على ID الأغنية
             cursor.execute("""
-                SELECT id FROM songs 
+                SELECT id, cache_key FROM songs 
                 WHERE chat_id = ?
-                ORDER BY added_date DESC
+                ORDER BY position ASC
                 LIMIT 1 OFFSET ?
             """, (chat_id, song_index))
             
@@ -275,40 +869,119 @@ class Database:
                 DELETE FROM songs WHERE id = ?
             """, (song['id'],))
             
+            # تحرير المرجع على الملف المشترك
+            if song['cache_key']:
+                cursor.execute("""
+                    UPDATE media_cache SET ref_count = MAX(ref_count - 1, 0)
+                    WHERE cache_key = ?
+                """, (song['cache_key'],))
+            
             conn.commit()
             return True
         except Exception as e:
+            conn.rollback()
             print(f"خطأ في حذف الأغنية: {e}")
             return False
-        finally:
-            conn.close()
     
-    def shuffle_playlist(self, chat_id: int) -> bool:
-        """خلط قائمة التشغيل"""
-        songs = self.get_playlist(chat_id)
-        if not songs:
+    def move_song(self, chat_id: int, from_index: int, to_index: int) -> bool:
+        """نقل أغنية من رقم لآخر في القائمة (تتغير أغنية واحدة فقط)"""
+        if from_index < 0 or to_index < 0:
             return False
         
-        random.shuffle(songs)
-        
-        # إعادة ترتيب الأغاني
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            for i, song in enumerate(songs):
-                cursor.execute("""
-                    UPDATE songs SET added_date = datetime('now', '-{} seconds')
-                    WHERE id = ?
-                """.format(i), (song['id'],))
+            cursor.execute("""
+                SELECT id FROM songs 
+                WHERE chat_id = ?
+                ORDER BY position ASC
+                LIMIT 1 OFFSET ?
+            """, (chat_id, from_index))
+            
+            song = cursor.fetchone()
+            if not song:
+                return False
+            
+            position = self._position_for_insert(cursor, chat_id, to_index, exclude_id=song['id'])
+            cursor.execute("""
+                UPDATE songs SET position = ? WHERE id = ?
+            """, (position, song['id']))
             
             conn.commit()
             return True
         except Exception as e:
+            conn.rollback()
+            print(f"خطأ في نقل الأغنية: {e}")
+            return False
+    
+    def shuffle_playlist(self, chat_id: int) -> bool:
+        """خلط قائمة التشغيل (تعليمة واحدة مهما كان حجم القائمة)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            shuffled = self._rank_positions(cursor, chat_id, "random()")
+            conn.commit()
+            return shuffled > 0
+        except Exception as e:
+            conn.rollback()
             print(f"خطأ في خلط القائمة: {e}")
             return False
-        finally:
-            conn.close()
+    
+    def _song_position(self, cursor: sqlite3.Cursor, chat_id: int, song_id: int) -> Optional[int]:
+        """موقع الأغنية في القائمة، أو موقعها المحفوظ إذا كانت الحالية وحُذفت"""
+        cursor.execute("""
+            SELECT COALESCE(
+                (SELECT position FROM songs WHERE id = ?),
+                (SELECT queue_position FROM playback_state
+                 WHERE chat_id = ? AND current_song_id = ?)
+            )
+        """, (song_id, chat_id, song_id))
+        return cursor.fetchone()[0]
+    
+    def _position_for_insert(self, cursor: sqlite3.Cursor, chat_id: int,
+                             index: Optional[int] = None, exclude_id: int = 0) -> int:
+        """موقع يجعل الأغنية رقم index في القائمة (None = في النهاية)"""
+        for _ in range(2):
+            if index is not None:
+                # الأغنيتان المحيطتان بالمكان المطلوب
+                cursor.execute("""
+                    SELECT position FROM songs 
+                    WHERE chat_id = ? AND id != ?
+                    ORDER BY position ASC
+                    LIMIT 2 OFFSET ?
+                """, (chat_id, exclude_id, max(index - 1, 0)))
+                neighbours = [row['position'] for row in cursor.fetchall()]
+                
+                if index == 0 and neighbours:
+                    return neighbours[0] - POSITION_GAP
+                if len(neighbours) == 2:
+                    before, after = neighbours
+                    if after - before > 1:
+                        return (before + after) // 2
+                    # لا مكان بين الأغنيتين: إعادة توزيع المواقع ثم المحاولة مجدداً
+                    self._rank_positions(cursor, chat_id, "position, id")
+                    continue
+            
+            cursor.execute("""
+                SELECT MAX(position) FROM songs WHERE chat_id = ? AND id != ?
+            """, (chat_id, exclude_id))
+            return (cursor.fetchone()[0] or 0) + POSITION_GAP
+        
+        raise RuntimeError("تعذر إيجاد موقع للأغنية في القائمة")
+    
+    def _rank_positions(self, cursor: sqlite3.Cursor, chat_id: int, order_by: str) -> int:
+        """إعادة ترقيم مواقع أغاني المجموعة بفراغات متساوية حسب order_by"""
+        cursor.execute(f"""
+            UPDATE songs SET position = ranked.rank * ?
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY {order_by}) AS rank
+                FROM songs WHERE chat_id = ?
+            ) AS ranked
+            WHERE songs.id = ranked.id
+        """, (POSITION_GAP, chat_id))
+        return cursor.rowcount
     
     # ══════════════════════════════════════════════════════════════
     #                    إدارة حالة التشغيل
@@ -321,20 +994,21 @@ class Database:
         
         cursor.execute("""
             UPDATE playback_state 
-            SET current_song_id = ?, is_playing = ?, is_paused = 0,
+            SET current_song_id = ?, is_playing = ?, is_paused = 0, position = 0,
+                queue_position = (SELECT position FROM songs WHERE id = ?),
                 last_update = CURRENT_TIMESTAMP
             WHERE chat_id = ?
-        """, (song_id, is_playing, chat_id))
+        """, (song_id, is_playing, song_id, chat_id))
         
-        # تحديث عداد التشغيل
+        # عداد التشغيل يُحدث مع دفعات الإحصائيات (record_statistics)
         if is_playing:
+            # آخر تشغيل للملف المشترك (لترتيب الحذف LRU)
             cursor.execute("""
-                UPDATE songs SET play_count = play_count + 1
-                WHERE id = ?
-            """, (song_id,))
+                UPDATE media_cache SET last_played = ?
+                WHERE cache_key = (SELECT cache_key FROM songs WHERE id = ?)
+            """, (time.time(), song_id))
         
         conn.commit()
-        conn.close()
     
     def set_paused(self, chat_id: int, is_paused: bool):
         """إيقاف مؤقت"""
@@ -348,7 +1022,17 @@ class Database:
         """, (is_paused, chat_id))
         
         conn.commit()
-        conn.close()
+    
+    def save_positions(self, positions: List[Tuple[int, float]]):
+        """حفظ موضع التشغيل لعدة مجموعات دفعة واحدة (chat_id, الموضع بالثواني)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany("""
+            UPDATE playback_state SET position = ? WHERE chat_id = ?
+        """, [(position, chat_id) for chat_id, position in positions])
+        
+        conn.commit()
     
     def get_playback_state(self, chat_id: int) -> Optional[Dict]:
         """الحصول على حالة التشغيل"""
@@ -363,7 +1047,6 @@ class Database:
         """, (chat_id,))
         
         state = cursor.fetchone()
-        conn.close()
         
         if state:
             return dict(state)
@@ -376,12 +1059,206 @@ class Database:
         
         cursor.execute("""
             UPDATE playback_state 
-            SET is_playing = 0, is_paused = 0, current_song_id = NULL
+            SET is_playing = 0, is_paused = 0, current_song_id = NULL,
+                queue_position = NULL
             WHERE chat_id = ?
         """, (chat_id,))
         
         conn.commit()
-        conn.close()
+    
+    # ══════════════════════════════════════════════════════════════
+    #                    ذاكرة الصوت المؤقتة
+    # ══════════════════════════════════════════════════════════════
+    
+    def get_cached_media(self, cache_key: str) -> Optional[Dict]:
+        """الحصول على ملف من الذاكرة المؤقتة بمفتاحه (أو باسم بديل له)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT * FROM media_cache WHERE cache_key = ?
+        """, (self._canonical_key(cursor, cache_key),))
+        
+        entry = cursor.fetchone()
+        return dict(entry) if entry else None
+    
+    def get_cached_media_by_hash(self, content_hash: str) -> Optional[Dict]:
+        """البحث عن ملف موجود بنفس المحتوى (بصمة SHA-256)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT * FROM media_cache WHERE content_hash = ? AND present = 1
+            LIMIT 1
+        """, (content_hash,))
+        
+        entry = cursor.fetchone()
+        return dict(entry) if entry else None
+    
+    def get_cached_media_by_url(self, source_url: str) -> Optional[Dict]:
+        """البحث في الذاكرة المؤقتة برابط المصدر (بدون طلب شبكة)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT * FROM media_cache WHERE source_url = ? AND present = 1
+            LIMIT 1
+        """, (source_url,))
+        
+        entry = cursor.fetchone()
+        return dict(entry) if entry else None
+    
+    def add_cached_media(self, cache_key: str, file_path: str, file_size: int,
+                         source_url: str = None, title: str = None,
+                         artist: str = None, duration: int = 0,
+                         content_hash: str = None):
+        """تسجيل ملف في الذاكرة المؤقتة (أو إعادة تسجيله بعد حذفه)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        # أغاني أضيفت كمعلومات فقط قبل تحميل ملفها تُحسب في المراجع من البداية
+        cursor.execute("""
+            INSERT INTO media_cache (
+                cache_key, source_url, title, artist, duration,
+                file_path, file_size, content_hash, ref_count, present, last_played
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?,
+                      (SELECT COUNT(*) FROM songs WHERE cache_key = ?), 1, ?)
+            ON CONFLICT (cache_key) DO UPDATE SET
+                file_path = excluded.file_path,
+                file_size = excluded.file_size,
+                content_hash = COALESCE(excluded.content_hash, content_hash),
+                present = 1,
+                last_played = excluded.last_played
+        """, (cache_key, source_url, title, artist, duration,
+              file_path, file_size, content_hash, cache_key, time.time()))
+        
+        # كل الأغاني التي تشير لهذا المحتوى أصبحت جاهزة
+        cursor.execute(f"""
+            UPDATE songs SET state = '{SONG_READY}', file_path = ?
+            WHERE cache_key = ?
+        """, (file_path, cache_key))
+        
+        conn.commit()
+    
+    def alias_cached_media(self, alias: str, cache_key: str):
+        """ربط مفتاح بمحتوى موجود مسبقاً (نفس البصمة)
+        
+        أغاني المفتاح البديل تنتقل للملف الأصلي وتصبح جاهزة، والإضافات
+        القادمة بنفس المفتاح تشير للملف الأصلي مباشرة.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("""
+                INSERT OR REPLACE INTO media_aliases (alias, cache_key) VALUES (?, ?)
+            """, (alias, cache_key))
+            cursor.execute(f"""
+                UPDATE songs SET
+                    cache_key = ?,
+                    state = '{SONG_READY}',
+                    file_path = (SELECT file_path FROM media_cache WHERE cache_key = ?)
+                WHERE cache_key = ?
+            """, (cache_key, cache_key, alias))
+            cursor.execute("""
+                UPDATE media_cache SET ref_count = ref_count + ?
+                WHERE cache_key = ?
+            """, (cursor.rowcount, cache_key))
+            cursor.execute("""
+                DELETE FROM media_cache WHERE cache_key = ?
+            """, (alias,))
+            
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في ربط المحتوى: {e}")
+    
+    def get_cache_usage(self) -> int:
+        """الحجم الكلي للملفات الموجودة في الذاكرة المؤقتة (بالبايت)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT COALESCE(SUM(file_size), 0) AS total
+            FROM media_cache WHERE present = 1
+        """)
+        
+        return cursor.fetchone()['total']
+    
+    def get_eviction_candidates(self, limit: int = 50, exclude: str = None,
+                                after: Tuple = None) -> List[Dict]:
+        """الملفات المرشحة للحذف: غير المستخدمة أولاً ثم الأقدم تشغيلاً
+        
+        صفحة واحدة بدون الملف exclude، تبدأ بعد المفتاح after
+        (in_use, last_played, cache_key) لآخر ملف في الصفحة السابقة.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT cache_key, file_path, file_size, ref_count,
+                   ref_count > 0 AS in_use, COALESCE(last_played, 0) AS last_played
+            FROM media_cache
+            WHERE present = 1
+              AND cache_key IS NOT ?
+              AND (ref_count > 0, COALESCE(last_played, 0), cache_key) > (?, ?, ?)
+            ORDER BY in_use, last_played, cache_key
+            LIMIT ?
+        """, (exclude, *(after or (-1, -1, '')), limit))
+        
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def evict_cached_media(self, cache_key: str):
+        """تسجيل حذف ملف من القرص
+        
+        الملفات غير المستخدمة تُحذف نهائياً، أما المستخدمة في قوائم التشغيل
+        فيبقى سجلها ليُعاد تحميلها عند الحاجة.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            DELETE FROM media_cache WHERE cache_key = ? AND ref_count = 0
+        """, (cache_key,))
+        cursor.execute("""
+            UPDATE media_cache SET present = 0 WHERE cache_key = ?
+        """, (cache_key,))
+        cursor.execute(f"""
+            UPDATE songs SET state = '{SONG_EVICTED}' WHERE cache_key = ?
+        """, (cache_key,))
+        
+        conn.commit()
+    
+    def set_media_fetching(self, cache_key: str):
+        """بدء تحميل محتوى: أغانيه غير الجاهزة تصبح قيد التحميل"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            UPDATE songs SET state = '{SONG_FETCHING}'
+            WHERE cache_key = ? AND state IN ('{SONG_PENDING}', '{SONG_EVICTED}')
+        """, (cache_key,))
+        
+        conn.commit()
+    
+    def reset_media_fetching(self, cache_key: str = None):
+        """فشل التحميل (أو انقطع): العودة للحالة السابقة للتحميل
+        
+        الأغنية التي لم يُحمّل ملفها أبداً ليس لها مسار، فتعود معلومات فقط؛
+        وما سبق تحميله يعود محذوفاً. بدون cache_key تُعاد كل التحميلات.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            UPDATE songs SET state = CASE
+                WHEN file_path IS NULL THEN '{SONG_PENDING}'
+                ELSE '{SONG_EVICTED}'
+            END
+            WHERE state = '{SONG_FETCHING}' AND (? IS NULL OR cache_key = ?)
+        """, (cache_key, cache_key))
+        
+        conn.commit()
     
     # ══════════════════════════════════════════════════════════════
     #                    إعدادات التشغيل التلقائي
@@ -397,7 +1274,6 @@ class Database:
         """, (chat_id,))
         
         result = cursor.fetchone()
-        conn.close()
         
         return bool(result and result['autoplay'])
     
@@ -411,7 +1287,6 @@ class Database:
         """, (enabled, chat_id))
         
         conn.commit()
-        conn.close()
     
     # ══════════════════════════════════════════════════════════════
     #                    دوال مساعدة
@@ -432,35 +1307,441 @@ class Database:
         
         return f"{minutes:02d}:{secs:02d}"
     
-    def get_statistics(self, chat_id: int) -> Dict:
-        """الحصول على الإحصائيات"""
+    def record_statistics(self, events: List[Tuple]) -> bool:
+        """حفظ دفعة من أحداث التشغيل في معاملة واحدة
+        
+        كل حدث: (النوع، chat_id، song_id، played_at، المدة المسموعة)
+        والنوع play أو complete أو skip أو stop. أحداث النهاية تُحدث سطر
+        التشغيل المطابق لـ played_at، لذا تُطبق بعد إدراج أحداث play.
+        الجداول المجمعة (stats_*) تُحدث بنفس المعاملة للمجموعة وللإحصائيات العامة.
+        """
+        plays = [
+            (chat_id, song_id, played_at)
+            for kind, chat_id, song_id, played_at, *_ in events if kind == 'play'
+        ]
+        endings = [
+            (listened, kind == 'complete', kind == 'skip', chat_id, song_id, played_at)
+            for kind, chat_id, song_id, played_at, listened, *_ in events if kind != 'play'
+        ]
+        song_plays = Counter(song_id for _, song_id, _ in plays)
+        chat_plays = Counter(chat_id for chat_id, _, _ in plays)
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany("""
+                INSERT INTO statistics (chat_id, song_id, played_at)
+                VALUES (?, ?, ?)
+            """, plays)
+            
+            cursor.executemany("""
+                UPDATE statistics SET listened = ?, completed = ?, skipped = ?
+                WHERE chat_id = ? AND song_id = ? AND played_at = ?
+            """, endings)
+            
+            # العدادات المجمعة
+            cursor.executemany("""
+                UPDATE songs SET play_count = play_count + ? WHERE id = ?
+            """, [(count, song_id) for song_id, count in song_plays.items()])
+            
+            cursor.executemany("""
+                UPDATE chats SET total_plays = total_plays + ? WHERE chat_id = ?
+            """, [(count, chat_id) for chat_id, count in chat_plays.items()])
+            
+            self._update_stats_aggregates(cursor, events)
+            
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"خطأ في حفظ الإحصائيات: {e}")
+            return False
+    
+    def _update_stats_aggregates(self, cursor: sqlite3.Cursor, events: List[Tuple]):
+        """إضافة الأحداث للجداول المجمعة (تكلفتها بعدد الأحداث وليس بطول السجل)"""
+        songs = defaultdict(lambda: [0, 0.0])   # (chat_id, song_key, title, artist) -> [تشغيلات، ثوان]
+        artists = defaultdict(lambda: [0, 0.0]) # (chat_id, artist) -> [تشغيلات، ثوان]
+        daily = defaultdict(lambda: [0, 0.0])   # (chat_id, day) -> [تشغيلات، ثوان]
+        totals = defaultdict(lambda: [0, 0.0])  # chat_id -> [تشغيلات، ثوان]
+        
+        # بيانات الأغنية محفوظة في الحدث نفسه (لا قراءة من songs، فقد تُحذف قبل الحفظ)
+        for kind, chat_id, _, played_at, listened, song_key, title, artist in events:
+            plays = 1 if kind == 'play' else 0
+            day = time.strftime('%Y-%m-%d', time.localtime(played_at))
+            for scope in (chat_id, GLOBAL_STATS_CHAT):
+                for counter in (songs[(scope, song_key, title, artist)], artists[(scope, artist)],
+                                daily[(scope, day)], totals[scope]):
+                    counter[0] += plays
+                    counter[1] += listened
+        
+        cursor.executemany("""
+            INSERT INTO stats_songs (chat_id, song_key, title, artist, plays, listened)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (chat_id, song_key) DO UPDATE SET
+                plays = plays + excluded.plays, listened = listened + excluded.listened
+        """, [(scope, song_key, title, artist, plays, listened)
+              for (scope, song_key, title, artist), (plays, listened) in songs.items()])
+        
+        cursor.executemany("""
+            INSERT INTO stats_artists (chat_id, artist, plays, listened) VALUES (?, ?, ?, ?)
+            ON CONFLICT (chat_id, artist) DO UPDATE SET
+                plays = plays + excluded.plays, listened = listened + excluded.listened
+        """, [(scope, artist, plays, listened)
+              for (scope, artist), (plays, listened) in artists.items()])
+        
+        cursor.executemany("""
+            INSERT INTO stats_daily (chat_id, day, plays, listened) VALUES (?, ?, ?, ?)
+            ON CONFLICT (chat_id, day) DO UPDATE SET
+                plays = plays + excluded.plays, listened = listened + excluded.listened
+        """, [(scope, day, plays, listened)
+              for (scope, day), (plays, listened) in daily.items()])
+        
+        cursor.executemany("""
+            INSERT INTO stats_totals (chat_id, plays, listened) VALUES (?, ?, ?)
+            ON CONFLICT (chat_id) DO UPDATE SET
+                plays = plays + excluded.plays, listened = listened + excluded.listened
+        """, [(scope, plays, listened) for scope, (plays, listened) in totals.items()])
+    
+    def get_statistics(self, chat_id: Optional[int], days: int = 7, limit: int = 5) -> Dict:
+        """الحصول على الإحصائيات من الجداول المجمعة (chat_id=None للإحصائيات العامة)"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        scope = GLOBAL_STATS_CHAT if chat_id is None else chat_id
+        
+        # إجمالي الأغاني (أو المجموعات في الإحصائيات العامة)
+        if chat_id is None:
+            cursor.execute("SELECT COUNT(*) as total FROM chats")
+        else:
+            cursor.execute("""
+                SELECT COUNT(*) as total FROM songs WHERE chat_id = ?
+            """, (chat_id,))
+        total = cursor.fetchone()['total']
         
-        # إجمالي الأغاني
         cursor.execute("""
-            SELECT COUNT(*) as total FROM songs WHERE chat_id = ?
-        """, (chat_id,))
-        total_songs = cursor.fetchone()['total']
+            SELECT plays, listened FROM stats_totals WHERE chat_id = ?
+        """, (scope,))
+        totals = cursor.fetchone()
         
-        # إجمالي التشغيلات
         cursor.execute("""
-            SELECT SUM(play_count) as total FROM songs WHERE chat_id = ?
-        """, (chat_id,))
-        total_plays = cursor.fetchone()['total'] or 0
+            SELECT title, artist, plays, listened FROM stats_songs
+            WHERE chat_id = ?
+            ORDER BY plays DESC LIMIT ?
+        """, (scope, limit))
+        top_songs = [dict(row) for row in cursor.fetchall()]
         
-        # الأغنية الأكثر تشغيلاً
         cursor.execute("""
-            SELECT title, play_count FROM songs 
-            WHERE chat_id = ? 
-            ORDER BY play_count DESC LIMIT 1
-        """, (chat_id,))
-        most_played = cursor.fetchone()
+            SELECT artist, plays, listened FROM stats_artists
+            WHERE chat_id = ?
+            ORDER BY plays DESC LIMIT ?
+        """, (scope, limit))
+        top_artists = [dict(row) for row in cursor.fetchall()]
         
-        conn.close()
+        cursor.execute("""
+            SELECT day, plays, listened FROM stats_daily
+            WHERE chat_id = ? AND day >= date('now', 'localtime', ?)
+            ORDER BY day ASC
+        """, (scope, f'-{days - 1} days'))
+        daily = [
+            {'day': row['day'], 'plays': row['plays'], 'hours': (row['listened'] or 0) / 3600}
+            for row in cursor.fetchall()
+        ]
         
         return {
-            'total_songs': total_songs,
-            'total_plays': total_plays,
-            'most_played': dict(most_played) if most_played else None
+            'total_songs': total if chat_id is not None else None,
+            'total_chats': total if chat_id is None else None,
+            'total_plays': totals['plays'] if totals else 0,
+            'total_hours': (totals['listened'] or 0) / 3600 if totals else 0.0,
+            'most_played': {
+                'title': top_songs[0]['title'], 'play_count': top_songs[0]['plays']
+            } if top_songs else None,
+            'top_songs': top_songs,
+            'top_artists': top_artists,
+            'daily': daily,
         }
+
+
+class ChatState:
+    """سجل مضغوط لحالة مجموعة في الذاكرة"""
+    
+    __slots__ = (
+        'is_active', 'autoplay', 'has_playback', 'current_song_id', 'is_playing',
+        'is_paused', 'position', 'queue_position', 'last_update',
+        'title', 'duration', 'song_count'
+    )
+    
+    def __init__(self, row: Dict):
+        self.is_active = bool(row['is_active'])
+        self.autoplay = bool(row['autoplay'])
+        self.has_playback = row['state_chat_id'] is not None
+        self.current_song_id = row['current_song_id']
+        self.is_playing = row['is_playing']
+        self.is_paused = row['is_paused']
+        self.position = row['position']
+        self.queue_position = row['queue_position']
+        self.last_update = row['last_update']
+        self.title = row['title']
+        self.duration = row['duration']
+        self.song_count = row['song_count']
+    
+    def playback_state(self, chat_id: int) -> Optional[Dict]:
+        """نفس شكل نتيجة Database.get_playback_state"""
+        if not self.has_playback:
+            return None
+        return {
+            'chat_id': chat_id,
+            'current_song_id': self.current_song_id,
+            'is_playing': self.is_playing,
+            'is_paused': self.is_paused,
+            'position': self.position,
+            'queue_position': self.queue_position,
+            'last_update': self.last_update,
+            'title': self.title,
+            'duration': self.duration,
+        }
+
+
+class AsyncDatabase:
+    """واجهة غير متزامنة لقاعدة البيانات
+    
+    الكتابة تتم بالتسلسل على خيط كاتب مخصص، والقراءة على مجموعة صغيرة
+    من خيوط القراءة (ممكنة بالتوازي بفضل وضع WAL)، فلا تتوقف حلقة
+    الأحداث أثناء انتظار القرص.
+    
+    حالة كل مجموعة (التفعيل، التشغيل التلقائي، حالة التشغيل، عدد الأغاني)
+    محفوظة في الذاكرة وتُقرأ منها مباشرة. أي كتابة تغيرها تُعيد تحميل سجل
+    المجموعة من نفس خيط الكتابة بعد الحفظ، فتبقى SQLite هي المرجع الدائم.
+    """
+    
+    def __init__(self, db: Database, reader_threads: int = DB_READER_THREADS):
+        self.db = db
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(
+            max_workers=reader_threads, thread_name_prefix="db-reader"
+        )
+        self._chat_states: Dict[int, Optional[ChatState]] = {}
+        self._chat_versions: Dict[int, int] = {}
+        self.state_hits = 0
+        self.state_misses = 0
+    
+    async def _read(self, func, *args, **kwargs):
+        """تنفيذ استعلام قراءة على خيوط القراءة"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._readers, functools.partial(func, *args, **kwargs)
+        )
+    
+    async def _write(self, func, *args, **kwargs):
+        """تنفيذ عملية كتابة على الخيط الكاتب"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._writer, functools.partial(func, *args, **kwargs)
+        )
+    
+    def close(self):
+        """إيقاف الخيوط وإغلاق الاتصالات"""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.db.close()
+    
+    # ══════════════════════════════════════════════════════════════
+    #                    ذاكرة حالة المجموعات
+    # ══════════════════════════════════════════════════════════════
+    
+    async def _chat_state(self, chat_id: int) -> Optional[ChatState]:
+        """سجل المجموعة من الذاكرة، أو تحميله من قاعدة البيانات أول مرة"""
+        if chat_id in self._chat_states:
+            self.state_hits += 1
+            return self._chat_states[chat_id]
+        
+        self.state_misses += 1
+        version = self._chat_versions.get(chat_id, 0)
+        row = await self._read(self.db.get_chat_state, chat_id)
+        state = ChatState(row) if row else None
+        
+        # كتابة انتهت أثناء القراءة: سجلها هو الأحدث
+        if self._chat_versions.get(chat_id, 0) == version:
+            self._chat_states[chat_id] = state
+        return state
+    
+    async def _write_chat(self, chat_id: int, func, *args, **kwargs):
+        """كتابة تغير حالة مجموعة ثم تحديث سجلها في الذاكرة"""
+        def write_and_reload():
+            result = func(*args, **kwargs)
+            return result, self.db.get_chat_state(chat_id)
+        
+        self._chat_versions[chat_id] = self._chat_versions.get(chat_id, 0) + 1
+        try:
+            result, row = await self._write(write_and_reload)
+        except BaseException:
+            self._chat_states.pop(chat_id, None)
+            raise
+        
+        self._chat_states[chat_id] = ChatState(row) if row else None
+        return result
+    
+    def get_state_cache_stats(self) -> Dict:
+        """إحصائيات ذاكرة الحالة"""
+        total = self.state_hits + self.state_misses
+        return {
+            'chats': len(self._chat_states),
+            'hits': self.state_hits,
+            'misses': self.state_misses,
+            'hit_rate': self.state_hits / total if total else 0.0,
+        }
+    
+    # ══════════════════════════════════════════════════════════════
+    #                    إدارة المجموعات/القنوات
+    # ══════════════════════════════════════════════════════════════
+    
+    async def add_chat(self, chat_id: int, chat_title: str) -> bool:
+        return await self._write_chat(chat_id, self.db.add_chat, chat_id, chat_title)
+    
+    async def is_chat_active(self, chat_id: int) -> bool:
+        state = await self._chat_state(chat_id)
+        return bool(state and state.is_active)
+    
+    async def get_song_count(self, chat_id: int) -> int:
+        state = await self._chat_state(chat_id)
+        return state.song_count if state else 0
+    
+    async def get_all_active_chats(self) -> List[int]:
+        return await self._read(self.db.get_all_active_chats)
+    
+    async def get_autoplay_candidates(self) -> List[int]:
+        return await self._read(self.db.get_autoplay_candidates)
+    
+    async def get_resumable_chats(self) -> List[Dict]:
+        return await self._read(self.db.get_resumable_chats)
+    
+    async def set_station(self, chat_id: int, station_id: Optional[int]):
+        return await self._write(self.db.set_station, chat_id, station_id)
+    
+    async def set_public_station(self, chat_id: int, public: bool):
+        return await self._write(self.db.set_public_station, chat_id, public)
+    
+    async def is_public_station(self, chat_id: int) -> bool:
+        return await self._read(self.db.is_public_station, chat_id)
+    
+    async def get_station_listeners(self) -> List[Dict]:
+        return await self._read(self.db.get_station_listeners)
+    
+    # ══════════════════════════════════════════════════════════════
+    #                    إدارة الأغاني
+    # ══════════════════════════════════════════════════════════════
+    
+    async def add_song(self, chat_id: int, title: str, **kwargs) -> Optional[int]:
+        return await self._write_chat(chat_id, self.db.add_song, chat_id, title, **kwargs)
+    
+    async def add_songs_bulk(self, chat_id: int, songs: List[Dict], max_size: int,
+                             added_by: int = None) -> List[int]:
+        return await self._write_chat(chat_id, self.db.add_songs_bulk,
+                                      chat_id, songs, max_size, added_by)
+    
+    async def update_song_metadata(self, chat_id: int, song_id: int, **kwargs):
+        return await self._write_chat(chat_id, self.db.update_song_metadata, song_id, **kwargs)
+    
+    async def get_playlist(self, chat_id: int) -> List[Dict]:
+        return await self._read(self.db.get_playlist, chat_id)
+    
+    async def get_playlist_page(self, chat_id: int, limit: int,
+                                after: int = None, before: int = None) -> Dict:
+        return await self._read(self.db.get_playlist_page, chat_id, limit, after, before)
+    
+    async def get_next_song(self, chat_id: int, wrap: bool = True) -> Optional[Dict]:
+        return await self._read(self.db.get_next_song, chat_id, wrap)
+    
+    async def get_upcoming_songs(self, chat_id: int, after_id: int, limit: int,
+                                 wrap: bool = True) -> List[Dict]:
+        return await self._read(self.db.get_upcoming_songs, chat_id, after_id, limit, wrap)
+    
+    async def remove_song(self, chat_id: int, song_index: int) -> bool:
+        return await self._write_chat(chat_id, self.db.remove_song, chat_id, song_index)
+    
+    async def move_song(self, chat_id: int, from_index: int, to_index: int) -> bool:
+        return await self._write(self.db.move_song, chat_id, from_index, to_index)
+    
+    async def shuffle_playlist(self, chat_id: int) -> bool:
+        return await self._write(self.db.shuffle_playlist, chat_id)
+    
+    # ══════════════════════════════════════════════════════════════
+    #                    إدارة حالة التشغيل
+    # ══════════════════════════════════════════════════════════════
+    
+    async def set_playing(self, chat_id: int, song_id: int, is_playing: bool = True):
+        return await self._write_chat(chat_id, self.db.set_playing, chat_id, song_id, is_playing)
+    
+    async def set_paused(self, chat_id: int, is_paused: bool):
+        return await self._write_chat(chat_id, self.db.set_paused, chat_id, is_paused)
+    
+    async def get_playback_state(self, chat_id: int) -> Optional[Dict]:
+        state = await self._chat_state(chat_id)
+        return state.playback_state(chat_id) if state else None
+    
+    async def stop_playback(self, chat_id: int):
+        return await self._write_chat(chat_id, self.db.stop_playback, chat_id)
+    
+    async def save_positions(self, positions: List[Tuple[int, float]]):
+        """حفظ المواضع مع تحديثها في سجلات المجموعات (بدون إعادة تحميلها)"""
+        for chat_id, _ in positions:
+            self._chat_versions[chat_id] = self._chat_versions.get(chat_id, 0) + 1
+        
+        await self._write(self.db.save_positions, positions)
+        
+        for chat_id, position in positions:
+            state = self._chat_states.get(chat_id)
+            if state:
+                state.position = position
+    
+    # ══════════════════════════════════════════════════════════════
+    #                    ذاكرة الصوت المؤقتة
+    # ══════════════════════════════════════════════════════════════
+    
+    async def get_cached_media(self, cache_key: str) -> Optional[Dict]:
+        return await self._read(self.db.get_cached_media, cache_key)
+    
+    async def get_cached_media_by_url(self, source_url: str) -> Optional[Dict]:
+        return await self._read(self.db.get_cached_media_by_url, source_url)
+    
+    async def get_cached_media_by_hash(self, content_hash: str) -> Optional[Dict]:
+        return await self._read(self.db.get_cached_media_by_hash, content_hash)
+    
+    async def alias_cached_media(self, alias: str, cache_key: str):
+        return await self._write(self.db.alias_cached_media, alias, cache_key)
+    
+    async def add_cached_media(self, cache_key: str, file_path: str, file_size: int, **kwargs):
+        return await self._write(self.db.add_cached_media, cache_key, file_path, file_size, **kwargs)
+    
+    async def get_cache_usage(self) -> int:
+        return await self._read(self.db.get_cache_usage)
+    
+    async def get_eviction_candidates(self, limit: int = 50, exclude: str = None,
+                                      after: Tuple = None) -> List[Dict]:
+        return await self._read(self.db.get_eviction_candidates, limit, exclude, after)
+    
+    async def set_media_fetching(self, cache_key: str):
+        return await self._write(self.db.set_media_fetching, cache_key)
+    
+    async def reset_media_fetching(self, cache_key: str = None):
+        return await self._write(self.db.reset_media_fetching, cache_key)
+    
+    async def evict_cached_media(self, cache_key: str):
+        return await self._write(self.db.evict_cached_media, cache_key)
+    
+    # ══════════════════════════════════════════════════════════════
+    #                    إعدادات التشغيل التلقائي
+    # ══════════════════════════════════════════════════════════════
+    
+    async def get_autoplay_status(self, chat_id: int) -> bool:
+        state = await self._chat_state(chat_id)
+        return bool(state and state.autoplay)
+    
+    async def set_autoplay(self, chat_id: int, enabled: bool):
+        return await self._write_chat(chat_id, self.db.set_autoplay, chat_id, enabled)
+    
+    async def record_statistics(self, events: List[Tuple]) -> bool:
+        return await self._write(self.db.record_statistics, events)
+    
+    async def get_statistics(self, chat_id: Optional[int], days: int = 7,
+                             limit: int = 5) -> Dict:
+        return await self._read(self.db.get_statistics, chat_id, days, limit)
@@ -0,0 +1,270 @@
+"""
+نظام التحميل - Download Manager
+تحميل وتحويل الأغاني خارج حلقة الأحداث
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import yt_dlp
+from config import (
+    DOWNLOAD_FOLDER, AUDIO_QUALITY, DOWNLOAD_WORKERS, DOWNLOAD_EXECUTOR,
+    DOWNLOAD_PER_CHAT_LIMIT
+)
+
+
+class DownloadCancelled(Exception):
+    """تم إلغاء التحميل"""
+
+
+# ══════════════════════════════════════════════════════════════
+#                    دالة العامل (خيط أو عملية منفصلة)
+# ══════════════════════════════════════════════════════════════
+
+def _extract_metadata(url: str) -> Dict:
+    """استخراج معلومات الأغنية فقط بدون تحميل
+    
+    روابط قوائم التشغيل تُستخرج بشكل مسطح (_type = playlist): معلومات
+    مختصرة لكل مقطع من صفحات القائمة نفسها دون طلب لكل مقطع.
+    """
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'noplaylist': True,
+        'extract_flat': 'in_playlist',
+        'quiet': True,
+        'no_warnings': True,
+    }
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        # معلومات قابلة للتسلسل لتمريرها بين العمليات وإعادة استخدامها في التحميل
+        return ydl.sanitize_info(info)
+
+
+def _extract_stream(url: str) -> Dict:
+    """رابط أفضل صيغة صوتية للمقطع (Opus/WebM أو M4A كما هي) لبثها مباشرة"""
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True,
+    }
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    return {
+        'url': info['url'],
+        'http_headers': info.get('http_headers') or {},
+        'acodec': info.get('acodec'),
+    }
+
+
+def _download_audio(source: Union[str, Dict], status, cancel_event) -> Dict:
+    """تحميل وتحويل أغنية واحدة
+
+    تعمل داخل خيط أو عملية العامل، لذا تستقبل وتعيد بيانات بسيطة فقط
+    (status قاموس مشترك لمرحلة التحميل، cancel_event لطلب الإلغاء).
+    المصدر إما رابط أو معلومات مستخرجة مسبقاً (لتجنب استخراجها مرتين).
+    """
+    def progress_hook(d):
+        if cancel_event.is_set():
+            raise yt_dlp.utils.DownloadCancelled("تم إلغاء التحميل")
+
+        if d['status'] == 'finished':
+            status['stage'] = 'converting'
+
+    def postprocessor_hook(d):
+        if cancel_event.is_set():
+            raise yt_dlp.utils.DownloadCancelled("تم إلغاء التحميل")
+        status['stage'] = 'converting'
+
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'noplaylist': True,
+        # اسم الملف حسب المصدر والمعرف: نفس المحتوى = نفس الملف
+        'outtmpl': f'{DOWNLOAD_FOLDER}/%(extractor_key)s-%(id)s.%(ext)s',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': AUDIO_QUALITY,
+        }],
+        'progress_hooks': [progress_hook],
+        'postprocessor_hooks': [postprocessor_hook],
+        'quiet': True,
+        'no_warnings': True,
+    }
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        if isinstance(source, dict):
+            info = ydl.process_ie_result(source, download=True)
+        else:
+            info = ydl.extract_info(source, download=True)
+
+        # مسار الملف المحمل بعد التحويل
+        file_path = ydl.prepare_filename(info)
+        file_path = file_path.rsplit('.', 1)[0] + '.mp3'
+
+    return {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'artist': info.get('artist') or info.get('uploader', 'Unknown'),
+        'extractor_key': info.get('extractor_key'),
+        'id': info.get('id'),
+        'file_path': file_path,
+        'file_size': os.path.getsize(file_path),
+    }
+
+
+# ══════════════════════════════════════════════════════════════
+#                    مهام التحميل
+# ══════════════════════════════════════════════════════════════
+
+class DownloadJob:
+    """مهمة تحميل واحدة في الطابور"""
+
+    def __init__(self, job_id: int, chat_id: int, source: Union[str, Dict],
+                 status, cancel_event):
+        self.id = job_id
+        self.chat_id = chat_id
+        self.source = source
+        self.status = status
+        self.status['stage'] = 'queued'
+        self.cancel_event = cancel_event
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def stage(self) -> str:
+        """المرحلة الحالية: queued / downloading / converting"""
+        return self.status.get('stage', 'queued')
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """طلب إلغاء المهمة (في الطابور أو أثناء التحميل)"""
+        self.cancel_event.set()
+        if self.task and self.stage == 'queued':
+            self.task.cancel()
+
+    async def wait(self) -> Dict:
+        """انتظار انتهاء المهمة"""
+        try:
+            return await self.task
+        except asyncio.CancelledError:
+            if self.cancelled:
+                raise DownloadCancelled()
+            raise
+
+
+class DownloadManager:
+    """مدير التحميلات: طابور مهام مع حدود تزامن عامة ولكل مجموعة"""
+
+    def __init__(self, workers: int = DOWNLOAD_WORKERS, mode: str = DOWNLOAD_EXECUTOR,
+                 per_chat_limit: int = DOWNLOAD_PER_CHAT_LIMIT):
+        self.mode = mode
+        self.per_chat_limit = per_chat_limit
+
+        if mode == "process":
+            # القواميس والأحداث المشتركة بين العمليات تحتاج مديراً
+            self._sync_manager = multiprocessing.Manager()
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._sync_manager = None
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="downloader"
+            )
+
+        # الطابور ينتظر هنا وليس داخل المنفذ، حتى يمكن إلغاء المهام قبل بدئها
+        self._global_slots = asyncio.Semaphore(workers)
+        self._chat_slots: Dict[int, asyncio.Semaphore] = {}
+        self._ids = itertools.count(1)
+        self.jobs: Dict[int, DownloadJob] = {}
+
+    def _new_job(self, chat_id: int, source: Union[str, Dict]) -> DownloadJob:
+        if self._sync_manager:
+            status, cancel_event = self._sync_manager.dict(), self._sync_manager.Event()
+        else:
+            status, cancel_event = {}, threading.Event()
+        return DownloadJob(next(self._ids), chat_id, source, status, cancel_event)
+
+    def submit(self, chat_id: int, source: Union[str, Dict]) -> DownloadJob:
+        """إضافة مهمة تحميل للطابور (رابط أو معلومات مستخرجة)"""
+        job = self._new_job(chat_id, source)
+        job.task = asyncio.create_task(self._run(job))
+        self.jobs[job.id] = job
+        return job
+
+    async def download(self, chat_id: int, source: Union[str, Dict]) -> Dict:
+        """تحميل أغنية وانتظار النتيجة"""
+        return await self.submit(chat_id, source).wait()
+
+    async def extract(self, url: str) -> Dict:
+        """استخراج معلومات رابط دون تحميله"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _extract_metadata, url)
+
+    async def extract_stream(self, url: str) -> Dict:
+        """رابط البث المباشر لمقطع (صالح لفترة محدودة، فيُطلب قبل التشغيل مباشرة)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _extract_stream, url)
+
+    async def _run(self, job: DownloadJob) -> Dict:
+        """تنفيذ المهمة عند توفر مكان في حدود التزامن"""
+        chat_slots = self._chat_slots.setdefault(
+            job.chat_id, asyncio.Semaphore(self.per_chat_limit)
+        )
+
+        try:
+            async with chat_slots, self._global_slots:
+                if job.cancelled:
+                    raise DownloadCancelled()
+
+                job.status['stage'] = 'downloading'
+
+                loop = asyncio.get_running_loop()
+                try:
+                    return await loop.run_in_executor(
+                        self._executor, _download_audio,
+                        job.source, job.status, job.cancel_event
+                    )
+                except yt_dlp.utils.DownloadCancelled:
+                    raise DownloadCancelled()
+                except yt_dlp.utils.DownloadError:
+                    if job.cancelled:
+                        raise DownloadCancelled()
+                    raise
+
+        finally:
+            self.jobs.pop(job.id, None)
+            if not self.get_chat_jobs(job.chat_id):
+                self._chat_slots.pop(job.chat_id, None)
+
+    # ══════════════════════════════════════════════════════════════
+    #                    الإلغاء والإيقاف
+    # ══════════════════════════════════════════════════════════════
+
+    def get_chat_jobs(self, chat_id: int) -> List[DownloadJob]:
+        """مهام التحميل الحالية لمجموعة"""
+        return [job for job in self.jobs.values() if job.chat_id == chat_id]
+
+    def cancel_chat(self, chat_id: int) -> int:
+        """إلغاء جميع تحميلات المجموعة، وإرجاع عدد المهام الملغاة"""
+        jobs = self.get_chat_jobs(chat_id)
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    def shutdown(self):
+        """إلغاء كل المهام وإيقاف العمال"""
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._sync_manager:
+            self._sync_manager.shutdown()
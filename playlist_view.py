@@ -0,0 +1,142 @@
+"""
+عرض قائمة التشغيل - Playlist Pages
+صفحات /playlist المنسقة مع حفظها في الذاكرة حتى تتغير القائمة
+"""
+
+import math
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from database import AsyncDatabase
+from config import PLAYLIST_PAGE_SIZE, PLAYLIST_CACHE_CHATS
+
+# أطول عنوان يُعرض كاملاً (حتى لا تتجاوز الصفحة حد تليجرام 4096 حرف)
+MAX_TITLE_LENGTH = 64
+
+CALLBACK_PREFIX = "playlist:"
+
+
+class PlaylistPage:
+    """صفحة منسقة من قائمة التشغيل
+
+    الأسطر تُنسق مرة واحدة عند القراءة من قاعدة البيانات؛ علامة الأغنية
+    الحالية فقط تضاف عند العرض لأنها تتغير مع كل أغنية.
+    """
+
+    def __init__(self, page: Dict, page_size: int):
+        songs = page['songs']
+        self.offset = page['offset']
+        self.total = page['total']
+        self.page_size = page_size
+        self.first_position = songs[0]['position']
+        self.last_position = songs[-1]['position']
+        self.lines: List[Tuple[int, str, str]] = [
+            (song['id'], f"{number}.", f"{self._short_title(song['title'])} - `{song['duration']}`")
+            for number, song in enumerate(songs, self.offset + 1)
+        ]
+
+    @staticmethod
+    def _short_title(title: str) -> str:
+        if len(title) <= MAX_TITLE_LENGTH:
+            return title
+        return title[:MAX_TITLE_LENGTH - 1] + "…"
+
+    @property
+    def has_prev(self) -> bool:
+        return self.offset > 0
+
+    @property
+    def has_next(self) -> bool:
+        return self.offset + len(self.lines) < self.total
+
+    def render(self, current_song_id: Optional[int] = None) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """نص الصفحة وأزرار التنقل"""
+        text = "📋 **قائمة التشغيل:**\n\n"
+        for song_id, number, line in self.lines:
+            status = "▶️" if song_id == current_song_id else ""
+            text += f"{number} {status} {line}\n"
+        text += f"\n📊 الإجمالي: {self.total} أغنية"
+
+        return text, self._keyboard()
+
+    def _keyboard(self) -> Optional[InlineKeyboardMarkup]:
+        if not self.has_prev and not self.has_next:
+            return None
+
+        pages = math.ceil(self.total / self.page_size)
+        page = min(pages, self.offset // self.page_size + 1)
+
+        buttons = []
+        if self.has_prev:
+            buttons.append(InlineKeyboardButton(
+                "◀️ السابق", callback_data=f"{CALLBACK_PREFIX}b{self.first_position}"
+            ))
+        buttons.append(InlineKeyboardButton(
+            f"{page}/{pages}", callback_data=f"{CALLBACK_PREFIX}noop"
+        ))
+        if self.has_next:
+            buttons.append(InlineKeyboardButton(
+                "التالي ▶️", callback_data=f"{CALLBACK_PREFIX}a{self.last_position}"
+            ))
+        return InlineKeyboardMarkup([buttons])
+
+
+class PlaylistPages:
+    """صفحات قوائم التشغيل المنسقة لكل مجموعة
+
+    مفتاح الصفحة هو موضع المؤشر في القائمة (first / aالموقع / bالموقع)،
+    وكل صفحات المجموعة تُحذف عند أي تعديل على قائمتها.
+    """
+
+    def __init__(self, db: AsyncDatabase, page_size: int = PLAYLIST_PAGE_SIZE,
+                 max_chats: int = PLAYLIST_CACHE_CHATS):
+        self.db = db
+        self.page_size = page_size
+        self.max_chats = max_chats
+        self._pages: "OrderedDict[int, Dict[str, PlaylistPage]]" = OrderedDict()
+        self._versions: Dict[int, int] = {}
+
+    async def get(self, chat_id: int, cursor: str = "first") -> Optional[PlaylistPage]:
+        """الصفحة عند المؤشر (None إذا كانت القائمة فارغة)"""
+        pages = self._pages.get(chat_id)
+        if pages is not None:
+            self._pages.move_to_end(chat_id)
+            if cursor in pages:
+                return pages[cursor]
+
+        version = self._versions.get(chat_id, 0)
+        page = await self._load(chat_id, cursor)
+
+        # القائمة تغيرت أثناء القراءة: لا تُحفظ صفحة قديمة
+        if page and self._versions.get(chat_id, 0) == version:
+            self._store(chat_id, cursor, page)
+        return page
+
+    def invalidate(self, chat_id: int):
+        """حذف صفحات المجموعة بعد تعديل قائمتها"""
+        self._pages.pop(chat_id, None)
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+
+    async def _load(self, chat_id: int, cursor: str) -> Optional[PlaylistPage]:
+        after = before = None
+        if cursor.startswith("a"):
+            after = int(cursor[1:])
+        elif cursor.startswith("b"):
+            before = int(cursor[1:])
+
+        page = await self.db.get_playlist_page(chat_id, self.page_size, after, before)
+
+        # المؤشر أصبح خارج القائمة (حذف أغاني): العودة للصفحة الأولى
+        if not page['songs'] and cursor != "first":
+            page = await self.db.get_playlist_page(chat_id, self.page_size)
+
+        if not page['songs']:
+            return None
+        return PlaylistPage(page, self.page_size)
+
+    def _store(self, chat_id: int, cursor: str, page: PlaylistPage):
+        self._pages.setdefault(chat_id, {})[cursor] = page
+        self._pages.move_to_end(chat_id)
+        while len(self._pages) > self.max_chats:
+            self._pages.popitem(last=False)
@@ -0,0 +1,107 @@
+"""
+موضع التشغيل - Position Tracker
+الوقت المنقضي من الأغنية الحالية لكل مجموعة مع حفظه على فترات
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from database import AsyncDatabase
+from config import POSITION_CHECKPOINT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class PositionTracker:
+    """موضع التشغيل لكل مجموعة من ساعة رتيبة (monotonic)
+
+    الموضع = موضع البداية + الوقت المنقضي منذ آخر تشغيل أو استئناف، ويتجمد
+    أثناء الإيقاف المؤقت. القراءة من الذاكرة مباشرة؛ قاعدة البيانات تُحدث
+    فقط عند نقاط الحفظ (دورياً، وعند الإيقاف المؤقت والتقديم) بدفعة واحدة.
+    """
+
+    def __init__(self, db: AsyncDatabase, interval: float = POSITION_CHECKPOINT_INTERVAL):
+        self.db = db
+        self.interval = interval
+        # chat_id -> (الموضع عند آخر تغيير، وقت الساعة عنده أو None أثناء الإيقاف)
+        self._clocks: Dict[int, Tuple[float, Optional[float]]] = {}
+        self._dirty: Set[int] = set()  # مجموعات متوقفة تغير موضعها منذ آخر حفظ
+        self.checkpoints = 0
+
+    # ══════════════════════════════════════════════════════════════
+    #                    تحديث الساعة
+    # ══════════════════════════════════════════════════════════════
+
+    def start(self, chat_id: int, offset: float = 0.0, paused: bool = False):
+        """بدء أغنية (أو استكمالها) من offset"""
+        self._clocks[chat_id] = (offset, None if paused else time.monotonic())
+        self._dirty.add(chat_id)
+
+    def pause(self, chat_id: int):
+        position = self.position(chat_id)
+        if position is not None:
+            self._clocks[chat_id] = (position, None)
+            self._dirty.add(chat_id)
+
+    def resume(self, chat_id: int):
+        clock = self._clocks.get(chat_id)
+        if clock and clock[1] is None:
+            self._clocks[chat_id] = (clock[0], time.monotonic())
+
+    def seek(self, chat_id: int, offset: float):
+        """الانتقال لموضع جديد مع الحفاظ على حالة الإيقاف المؤقت"""
+        clock = self._clocks.get(chat_id)
+        self.start(chat_id, offset, paused=bool(clock) and clock[1] is None)
+
+    def stop(self, chat_id: int):
+        self._clocks.pop(chat_id, None)
+        self._dirty.discard(chat_id)
+
+    def position(self, chat_id: int) -> Optional[float]:
+        """الموضع الحالي بالثواني (None إذا لم يكن هناك تشغيل)"""
+        clock = self._clocks.get(chat_id)
+        if not clock:
+            return None
+        offset, started = clock
+        if started is None:
+            return offset
+        return offset + time.monotonic() - started
+
+    def is_paused(self, chat_id: int) -> bool:
+        clock = self._clocks.get(chat_id)
+        return bool(clock) and clock[1] is None
+
+    # ══════════════════════════════════════════════════════════════
+    #                    نقاط الحفظ
+    # ══════════════════════════════════════════════════════════════
+
+    async def run(self):
+        """حفظ مواضع المجموعات قيد التشغيل دورياً"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                logger.warning(f"تعذر حفظ مواضع التشغيل: {e}")
+
+    async def checkpoint(self, chat_ids: Optional[Iterable[int]] = None) -> int:
+        """حفظ مواضع المجموعات المحددة، أو كل ما تغير منذ آخر حفظ"""
+        if chat_ids is None:
+            chat_ids = [
+                chat_id for chat_id, (_, started) in self._clocks.items()
+                if started is not None or chat_id in self._dirty
+            ]
+
+        positions = []
+        for chat_id in chat_ids:
+            position = self.position(chat_id)
+            if position is not None:
+                positions.append((chat_id, round(position, 3)))
+                self._dirty.discard(chat_id)
+
+        if positions:
+            await self.db.save_positions(positions)
+            self.checkpoints += 1
+        return len(positions)
@@ -0,0 +1,170 @@
+"""
+التحميل المسبق - Prefetcher
+تجهيز الأغاني القادمة لكل مجموعة قبل الحاجة إليها
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+
+from database import AsyncDatabase
+from audio_cache import AudioCache
+from streaming import PcmPipeline, FRAME_SECONDS
+from config import PREFETCH_COUNT, PREFETCH_PREROLL_MS, STREAM_FROM_SOURCE
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedTrack:
+    """أغنية جاهزة للبث: المصدر مفتوح (ملف أو بث مباشر) وأول الإطارات مفكوكة"""
+
+    def __init__(self, song_id: int, source: str, pipeline: PcmPipeline):
+        self.song_id = song_id
+        self.source = source
+        self.pipeline = pipeline
+
+    @property
+    def is_stream(self) -> bool:
+        return self.source.startswith(('http://', 'https://'))
+
+
+class Prefetcher:
+    """تجهيز الأغاني القادمة لكل مجموعة قيد التشغيل
+
+    أول PREFETCH_COUNT أغنية قادمة تُحمّل على القرص (إذا كانت محذوفة من
+    الذاكرة المؤقتة)، والأغنية التالية مباشرة يبدأ فك ترميزها مسبقاً
+    فيكون الانتقال إليها بدون انتظار القرص أو الشبكة أو بدء FFmpeg.
+
+    مع البث المباشر (stream_from_source) لا تُحمّل الأغاني القادمة: الأغنية
+    التالية فقط تُفتح من رابط مصدرها، والتحميل للملفات التي تعذر بثها.
+    """
+
+    def __init__(self, db: AsyncDatabase, cache: AudioCache,
+                 count: int = PREFETCH_COUNT, preroll_ms: int = PREFETCH_PREROLL_MS,
+                 stream_from_source: bool = STREAM_FROM_SOURCE):
+        self.db = db
+        self.cache = cache
+        self.count = count
+        self.stream_from_source = stream_from_source
+        self.preroll_frames = max(1, int(preroll_ms / 1000 / FRAME_SECONDS))
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._ready: Dict[int, PreparedTrack] = {}
+        self._pinned: Dict[int, Set[str]] = {}  # chat_id -> مفاتيح الملفات المجهزة
+
+    def schedule(self, chat_id: int, current_song_id: int):
+        """بدء تجهيز الأغاني التي تلي الأغنية الحالية (يلغي أي تجهيز سابق)"""
+        task = self._tasks.pop(chat_id, None)
+        if task:
+            task.cancel()
+        if self.count > 0:
+            self._tasks[chat_id] = asyncio.create_task(
+                self._lookahead(chat_id, current_song_id)
+            )
+
+    def take(self, chat_id: int, song_id: int) -> Optional[PreparedTrack]:
+        """الحصول على الأغنية المجهزة إذا كانت هي المطلوبة"""
+        track = self._ready.get(chat_id)
+        if track and track.song_id == song_id:
+            del self._ready[chat_id]
+            return track
+        return None
+
+    async def open(self, song: Dict, offset: float = 0.0) -> Optional[PreparedTrack]:
+        """فتح مصدر الأغنية للبث (من الموضع offset بالثواني)
+        
+        الملف المحلي إذا كان موجوداً، وإلا البث المباشر من المصدر (إذا كان
+        مفعلاً)، وإلا تحميل الملف (ملفات تليجرام تبدأ مع أول أجزائها).
+        None إذا تعذر كل ذلك.
+        """
+        file_path = await self.cache.local_path(song)
+        
+        if not file_path and song.get('file_id'):
+            file_path, downloading = await self.cache.fetch_progressive(song)
+            if downloading:
+                return await self._start(song['id'], file_path, offset, follow=True)
+        
+        if not file_path and self.stream_from_source:
+            stream = await self.cache.stream_url(song)
+            if stream:
+                try:
+                    track = await self._start(song['id'], stream['url'], offset,
+                                              stream['http_headers'])
+                except Exception as e:
+                    logger.debug(f"خطأ في فتح البث المباشر: {e}")
+                    track = None
+                if track:
+                    return track
+                logger.warning(f"تعذر البث المباشر لـ {song['title']}، سيتم تحميل الملف")
+        
+        file_path = file_path or await self.cache.ensure(song)
+        if not file_path:
+            return None
+        return await self._start(song['id'], file_path, offset)
+    
+    async def discard(self, chat_id: int):
+        """إلغاء تجهيز المجموعة (عند الإيقاف)"""
+        task = self._tasks.pop(chat_id, None)
+        if task:
+            task.cancel()
+        self._pinned.pop(chat_id, None)
+        await self._drop_ready(chat_id)
+
+    def is_pinned(self, cache_key: str) -> bool:
+        """هل الملف محجوز لأغنية قادمة (فلا يُحذف من الذاكرة المؤقتة)"""
+        return any(cache_key in keys for keys in self._pinned.values())
+
+    async def _drop_ready(self, chat_id: int):
+        track = self._ready.pop(chat_id, None)
+        if track:
+            await track.pipeline.close()
+
+    async def _lookahead(self, chat_id: int, current_song_id: int):
+        try:
+            autoplay = await self.db.get_autoplay_status(chat_id)
+            songs = await self.db.get_upcoming_songs(
+                chat_id, current_song_id, self.count, wrap=autoplay
+            )
+            self._pinned[chat_id] = {song['cache_key'] for song in songs if song.get('cache_key')}
+
+            for index, song in enumerate(songs):
+                if index == 0:
+                    await self._prepare(chat_id, song)
+                elif not self.stream_from_source:
+                    await self.cache.ensure(song)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"تعذر تجهيز الأغاني القادمة للمجموعة {chat_id}: {e}")
+        finally:
+            if self._tasks.get(chat_id) is asyncio.current_task():
+                del self._tasks[chat_id]
+
+    async def _prepare(self, chat_id: int, song: Dict):
+        """فتح الأغنية التالية وتخزين أول إطاراتها في الذاكرة"""
+        current = self._ready.get(chat_id)
+        if current and current.song_id == song['id']:
+            return
+
+        await self._drop_ready(chat_id)
+
+        track = await self.open(song)
+        if track:
+            self._ready[chat_id] = track
+
+    async def _start(self, song_id: int, source: str, offset: float = 0.0,
+                     headers: Optional[Dict] = None,
+                     follow: bool = False) -> Optional[PreparedTrack]:
+        """بدء فك ترميز المصدر وأول إطاراته (None إذا لم ينتج صوتاً)"""
+        pipeline = PcmPipeline(source, offset, headers=headers, follow=follow)
+        try:
+            await pipeline.start()
+            decoded = await pipeline.preload(self.preroll_frames)
+        except BaseException:
+            await pipeline.close()
+            raise
+
+        if not decoded:
+            await pipeline.close()
+            return None
+        return PreparedTrack(song_id, source, pipeline)
@@ -4,14 +4,31 @@
 """
 
 import asyncio
+import itertools
 import os
-from typing import Dict, Optional
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Set
 from pyrogram import Client
-from pyrogram.raw import functions, types
+from pyrogram.errors import FloodWait
+from pyrogram.raw import functions
 from pyrogram.types import Message
-from database import Database
-import yt_dlp
-from config import DOWNLOAD_FOLDER, AUDIO_QUALITY, MAX_FILE_SIZE
+from database import AsyncDatabase
+from downloader import DownloadManager
+from audio_cache import AudioCache, FileTooLarge, PlaylistUrl, make_cache_key
+from telegram_download import TelegramDownloader, telegram_cache_key
+from scheduler import PlaybackScheduler
+from streaming import PcmPipeline, StreamBackend, create_backend
+from assistant_pool import Assistant, AssistantPool
+from workers import WorkerBackend, WorkerPool
+from prefetch import Prefetcher
+from playlist_view import PlaylistPages
+from stats_writer import StatisticsWriter
+from position_tracker import PositionTracker
+from config import (
+    DOWNLOAD_FOLDER, MAX_FILE_SIZE, STREAM_END_GRACE,
+    MAX_PLAYLIST_SIZE, IMPORT_RESOLVE_WORKERS, RESUME_CONCURRENCY
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,10 +37,46 @@ logger = logging.getLogger(__name__)
 class RadioManager:
     """مدير تشغيل الراديو"""
     
-    def __init__(self, userbot: Client, db: Database):
+    def __init__(self, userbot: Client, db: AsyncDatabase,
+                 downloader: Optional[DownloadManager] = None,
+                 backend: Optional[StreamBackend] = None,
+                 assistants: Sequence[Client] = (),
+                 workers: Optional[WorkerPool] = None):
         self.userbot = userbot
         self.db = db
+        self.workers = workers
+        # كل حساب مساعد بمحرك بث خاص به، والمكالمات تتوزع عليها
+        pool = []
+        for number, client in enumerate([userbot, *assistants], 1):
+            name = f"assistant{number}"
+            if backend and number == 1:
+                stream_backend = backend
+            elif workers:
+                # البث نفسه في عمليات البث، وهنا واجهة ترسل لها الأوامر
+                stream_backend = workers.backend(name, client)
+            else:
+                stream_backend = create_backend(client)
+            assistant = Assistant(name, client, stream_backend)
+            if isinstance(stream_backend, WorkerBackend):
+                # peers الحساب تُحل هنا مرة واحدة وتُرسل لعملية البث مع الانضمام
+                stream_backend.resolve_peer = assistant.resolve_peer
+            pool.append(assistant)
+        self.backend = AssistantPool(pool)
+        self.backend.on_stream_end = self.on_stream_end
+        self.downloader = downloader or DownloadManager()
+        self.cache = AudioCache(db, self.downloader, is_protected=self._is_media_in_use,
+                                telegram=TelegramDownloader(userbot))
+        self.prefetcher = Prefetcher(db, self.cache)
+        self.playlist = PlaylistPages(db)
+        self.stats = StatisticsWriter(db)
+        self.positions = PositionTracker(db)
+        self.scheduler = PlaybackScheduler(self._on_transition_due)
         self.active_calls = {}  # {chat_id: call_info}
+        self.listeners: Dict[int, Set[int]] = {}  # {station_id: {chat_id}}
+        self.station_of: Dict[int, int] = {}  # {chat_id: station_id}
+        self._broadcasts = itertools.count(1)
+        self._resolving = asyncio.Semaphore(IMPORT_RESOLVE_WORKERS)
+        self._tasks: Set[asyncio.Task] = set()  # مهام الخلفية (مرجع يمنع حذفها قبل انتهائها)
         
         # إنشاء مجلد التحميلات
         os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
@@ -35,8 +88,11 @@ class RadioManager:
     async def start_playing(self, chat_id: int) -> Dict:
         """بدء التشغيل"""
         try:
+            if chat_id in self.station_of:
+                return {"success": False, "message": "المجموعة تستمع لمحطة، التحكم من المحطة فقط! (/unlisten لإيقاف الاستماع)"}
+            
             # التحقق من وجود أغاني
-            song = self.db.get_next_song(chat_id)
+            song = await self.db.get_next_song(chat_id)
             if not song:
                 return {
                     "success": False,
@@ -50,15 +106,12 @@ class RadioManager:
             await self.play_song(chat_id, song)
             
             # تحديث حالة قاعدة البيانات
-            self.db.set_playing(chat_id, song['id'], True)
-            
-            # الحصول على عدد الأغاني
-            playlist = self.db.get_playlist(chat_id)
+            await self.db.set_playing(chat_id, song['id'], True)
             
             return {
                 "success": True,
                 "current_song": song['title'],
-                "total_songs": len(playlist)
+                "total_songs": await self.db.get_song_count(chat_id)
             }
         
         except Exception as e:
@@ -71,13 +124,18 @@ class RadioManager:
     async def pause(self, chat_id: int) -> Dict:
         """إيقاف مؤقت"""
         try:
+            if chat_id in self.station_of:
+                return {"success": False, "message": "المجموعة تستمع لمحطة، التحكم من المحطة فقط! (/unlisten لإيقاف الاستماع)"}
+            
             if chat_id not in self.active_calls:
                 return {"success": False, "message": "الراديو متوقف!"}
             
             # إيقاف مؤقت للصوت
             await self.pause_audio(chat_id)
+            self.scheduler.pause(chat_id)
             
-            self.db.set_paused(chat_id, True)
+            await self.db.set_paused(chat_id, True)
+            await self.positions.checkpoint([chat_id])
             
             return {"success": True, "message": "تم الإيقاف المؤقت"}
         
@@ -87,34 +145,87 @@ class RadioManager:
     async def resume(self, chat_id: int) -> Dict:
         """استئناف التشغيل"""
         try:
+            if chat_id in self.station_of:
+                return {"success": False, "message": "المجموعة تستمع لمحطة، التحكم من المحطة فقط! (/unlisten لإيقاف الاستماع)"}
+            
             if chat_id not in self.active_calls:
                 return {"success": False, "message": "الراديو متوقف!"}
             
             # استئناف الصوت
             await self.resume_audio(chat_id)
+            self.scheduler.resume(chat_id)
             
-            self.db.set_paused(chat_id, False)
+            await self.db.set_paused(chat_id, False)
             
             return {"success": True, "message": "تم استئناف التشغيل"}
         
         except Exception as e:
             return {"success": False, "message": f"خطأ: {str(e)}"}
     
+    async def seek(self, chat_id: int, offset: float, relative: bool = False) -> Dict:
+        """الانتقال لموضع في الأغنية الحالية (من نفس المصدر دون إعادة تحميله)
+        
+        relative: offset إزاحة من الموضع الحالي (مثل +30 أو -10).
+        """
+        try:
+            if chat_id in self.station_of:
+                return {"success": False, "message": "المجموعة تستمع لمحطة، التحكم من المحطة فقط! (/unlisten لإيقاف الاستماع)"}
+            
+            song = self.active_calls.get(chat_id, {}).get("current_song")
+            position = self.positions.position(chat_id)
+            if not song or position is None:
+                return {"success": False, "message": "لا توجد أغنية قيد التشغيل!"}
+            
+            if relative:
+                offset += position
+            duration = song.get('duration') or 0
+            offset = max(0.0, offset)
+            if duration and offset >= duration:
+                return {"success": False, "message": "الموضع بعد نهاية الأغنية!"}
+            
+            if self.active_calls[chat_id].get("station"):
+                # المحطة تبدأ من الموضع الجديد لكل مستمعيها
+                await self._start_station(chat_id, offset)
+            else:
+                await self.backend.seek(chat_id, offset)
+            self.positions.seek(chat_id, offset)
+            
+            # موعد الانتقال الاحتياطي يتبع الموضع الجديد
+            if duration:
+                self.scheduler.schedule(chat_id, duration - offset + STREAM_END_GRACE)
+                if self.positions.is_paused(chat_id):
+                    self.scheduler.pause(chat_id)
+            
+            await self.positions.checkpoint([chat_id])
+            
+            return {
+                "success": True,
+                "position": self._format_duration(int(offset)),
+                "duration": self._format_duration(duration)
+            }
+        
+        except Exception as e:
+            return {"success": False, "message": f"خطأ: {str(e)}"}
+    
     async def skip(self, chat_id: int) -> Dict:
         """تخطي الأغنية الحالية"""
         try:
+            if chat_id in self.station_of:
+                return {"success": False, "message": "المجموعة تستمع لمحطة، التحكم من المحطة فقط! (/unlisten لإيقاف الاستماع)"}
+            
             if chat_id not in self.active_calls:
                 return {"success": False, "message": "الراديو متوقف!"}
             
             # الحصول على الأغنية التالية
-            next_song = self.db.get_next_song(chat_id)
+            next_song = await self.db.get_next_song(chat_id)
             
             if not next_song:
                 return {"success": False, "message": "لا توجد أغاني تالية!"}
             
             # تشغيل الأغنية التالية
+            self._finish_song(chat_id, "skip")
             await self.play_song(chat_id, next_song)
-            self.db.set_playing(chat_id, next_song['id'], True)
+            await self.db.set_playing(chat_id, next_song['id'], True)
             
             return {
                 "success": True,
@@ -127,14 +238,26 @@ class RadioManager:
     async def stop(self, chat_id: int) -> Dict:
         """إيقاف التشغيل"""
         try:
+            if chat_id in self.station_of:
+                return await self.unlisten(chat_id)
+            
             if chat_id not in self.active_calls:
                 return {"success": False, "message": "الراديو متوقف بالفعل!"}
             
             # مغادرة المكالمة الصوتية
+            self._finish_song(chat_id, "stop")
+            self.positions.stop(chat_id)
+            self.scheduler.cancel(chat_id)
+            await self.prefetcher.discard(chat_id)
             await self.leave_voice_chat(chat_id)
             
+            # المجموعات المستمعة تغادر وتبقى مشتركة حتى تعود المحطة للتشغيل
+            for listener in self._listening(chat_id):
+                await self.leave_voice_chat(listener)
+                del self.active_calls[listener]
+            
             # تحديث قاعدة البيانات
-            self.db.stop_playback(chat_id)
+            await self.db.stop_playback(chat_id)
             
             # حذف من القائمة النشطة
             if chat_id in self.active_calls:
@@ -152,67 +275,43 @@ class RadioManager:
     async def join_voice_chat(self, chat_id: int):
         """الانضمام للمكالمة الصوتية"""
         try:
-            # استخدام Pyrogram للانضمام للمكالمة
-            peer = await self.userbot.resolve_peer(chat_id)
-            
-            # الانضمام للمكالمة
-            call = await self.userbot.invoke(
-                functions.phone.JoinGroupCall(
-                    call=types.InputGroupCall(
-                        id=0,  # سيتم الحصول عليه تلقائياً
-                        access_hash=0
-                    ),
-                    join_as=peer,
-                    params=types.DataJSON(data='{}'),
-                    muted=False
-                )
-            )
-            
-            self.active_calls[chat_id] = {
-                "call": call,
-                "status": "active"
-            }
-            
-            logger.info(f"انضم للمكالمة الصوتية: {chat_id}")
+            await self.backend.join(chat_id)
         
         except Exception as e:
             logger.error(f"خطأ في الانضمام للمكالمة: {e}")
-            # إنشاء مكالمة صوتية جديدة إذا لم تكن موجودة
+            # إنشاء مكالمة صوتية جديدة إذا لم تكن موجودة ثم إعادة المحاولة
             await self.create_voice_chat(chat_id)
+            await self.backend.join(chat_id)
+        
+        self.active_calls[chat_id] = {"status": "active"}
+        logger.info(f"انضم للمكالمة الصوتية: {chat_id}")
     
     async def create_voice_chat(self, chat_id: int):
-        """إنشاء مكالمة صوتية جديدة"""
+        """إنشاء مكالمة صوتية جديدة (عبر الحساب المساعد الذي سينضم لها)"""
+        assistant = self.backend.assistant_for(chat_id)
         try:
-            peer = await self.userbot.resolve_peer(chat_id)
+            peer = await assistant.resolve_peer(chat_id)
             
-            call = await self.userbot.invoke(
+            await assistant.client.invoke(
                 functions.phone.CreateGroupCall(
                     peer=peer,
-                    random_id=0,
+                    random_id=random.randint(1, 2 ** 31 - 1),
                     title="🎵 راديو تليجرام"
                 )
             )
             
-            # الانضمام للمكالمة المنشأة
-            await self.join_voice_chat(chat_id)
-            
             logger.info(f"تم إنشاء مكالمة صوتية: {chat_id}")
         
         except Exception as e:
+            # قد يكون الـ peer المحفوظ قديماً: يُحل من جديد في المرة القادمة
+            assistant.forget_peer(chat_id)
             logger.error(f"خطأ في إنشاء المكالمة: {e}")
     
     async def leave_voice_chat(self, chat_id: int):
         """مغادرة المكالمة الصوتية"""
         try:
-            if chat_id in self.active_calls:
-                await self.userbot.invoke(
-                    functions.phone.LeaveGroupCall(
-                        call=self.active_calls[chat_id]["call"],
-                        source=0
-                    )
-                )
-                
-                logger.info(f"غادر المكالمة الصوتية: {chat_id}")
+            await self.backend.leave(chat_id)
+            logger.info(f"غادر المكالمة الصوتية: {chat_id}")
         
         except Exception as e:
             logger.error(f"خطأ في مغادرة المكالمة: {e}")
@@ -221,145 +320,447 @@ class RadioManager:
     #                    تشغيل الأغاني
     # ══════════════════════════════════════════════════════════════
     
-    async def play_song(self, chat_id: int, song: Dict):
-        """تشغيل أغنية"""
+    async def play_song(self, chat_id: int, song: Dict, offset: float = 0.0,
+                        played_at: Optional[float] = None) -> bool:
+        """تشغيل أغنية (من الموضع offset بالثواني عند استكمالها)
+        
+        played_at: وقت بدء تشغيل سابق يُستكمل (بعد إعادة تشغيل البوت)، فلا
+        يُسجل تشغيل جديد في الإحصائيات. يعيد هل بدأ البث.
+        """
         try:
-            # الحصول على مسار الملف
-            audio_path = song.get('file_path')
-            
-            if not audio_path or not os.path.exists(audio_path):
-                logger.error(f"ملف الصوت غير موجود: {audio_path}")
-                return
-            
-            # هنا يتم التشغيل الفعلي باستخدام PyTgCalls أو مكتبة مشابهة
-            # ملاحظة: يتطلب تثبيت pytgcalls للتشغيل الفعلي
-            
-            logger.info(f"تشغيل: {song['title']} في {chat_id}")
+            # الأغنية مجهزة مسبقاً، وإلا تُفتح الآن: الملف المحلي، أو البث المباشر
+            # من المصدر، أو تحميل الملف إذا لم يُحمّل بعد أو حُذف من الذاكرة المؤقتة
+            prepared = None if offset else self.prefetcher.take(chat_id, song['id'])
+            prepared = prepared or await self.prefetcher.open(song, offset)
+            
+            if not prepared:
+                logger.error(f"ملف الصوت غير متاح: {song['title']}")
+                # الانتقال للأغنية التالية بدلاً من التوقف عند أغنية تعذر تحميلها
+                if chat_id in self.active_calls:
+                    self.scheduler.schedule(chat_id, STREAM_END_GRACE)
+                return False
+            
+            # بث الأغنية (يستبدل الأغنية الحالية دون قطع المكالمة)، ولمجموعة
+            # لها مستمعون من فك ترميز مشترك معهم
+            station = self._station_key(chat_id) if self.listeners.get(chat_id) else None
+            await self.backend.play(chat_id, prepared.source, pipeline=prepared.pipeline,
+                                    station=station)
+            self.positions.start(chat_id, offset)
+            
+            source = "بث مباشر" if prepared.is_stream else "ملف"
+            logger.info(f"تشغيل: {song['title']} في {chat_id} ({source})")
             
             # تحديث حالة التشغيل
             self.active_calls[chat_id]["current_song"] = song
             self.active_calls[chat_id]["status"] = "playing"
+            self.active_calls[chat_id]["played_at"] = played_at or self.stats.record_play(chat_id, song)
+            self.active_calls[chat_id]["stream"] = prepared.pipeline
+            self.active_calls[chat_id]["station"] = station
+            await self._broadcast(chat_id)
+            
+            # موعد احتياطي للانتقال إذا لم يصل حدث انتهاء البث
+            if song.get('duration'):
+                self.scheduler.schedule(chat_id, song['duration'] - offset + STREAM_END_GRACE)
+            
+            # تجهيز الأغاني القادمة أثناء تشغيل هذه
+            self.prefetcher.schedule(chat_id, song['id'])
+            return True
         
         except Exception as e:
             logger.error(f"خطأ في تشغيل الأغنية: {e}")
+            # المحرك لم يبث الأغنية: الانتقال بعد مهلة بدلاً من بقاء المجموعة صامتة
+            if chat_id in self.active_calls:
+                delay = e.value if isinstance(e, FloodWait) else STREAM_END_GRACE
+                self.scheduler.schedule(chat_id, delay)
+            return False
     
     async def pause_audio(self, chat_id: int):
-        """إيقاف مؤقت للصوت"""
-        # تنفيذ إيقاف مؤقت
+        """إيقاف مؤقت للصوت (ولمستمعي المحطة معها)"""
+        await self.backend.pause(chat_id)
+        for listener in self._listening(chat_id):
+            await self.backend.pause(listener)
+        self.positions.pause(chat_id)
         if chat_id in self.active_calls:
             self.active_calls[chat_id]["status"] = "paused"
     
     async def resume_audio(self, chat_id: int):
-        """استئناف الصوت"""
-        # تنفيذ الاستئناف
+        """استئناف الصوت (ولمستمعي المحطة معها)"""
+        await self.backend.resume(chat_id)
+        for listener in self._listening(chat_id):
+            await self.backend.resume(listener)
+        self.positions.resume(chat_id)
         if chat_id in self.active_calls:
             self.active_calls[chat_id]["status"] = "playing"
     
+    # ══════════════════════════════════════════════════════════════
+    #                    المحطات المشتركة
+    # ══════════════════════════════════════════════════════════════
+    
+    async def listen(self, chat_id: int, station_id: int) -> Dict:
+        """بث ما تشغله مجموعة أخرى (المحطة) في هذه المجموعة
+        
+        كل أغنية في المحطة تُفك مرة واحدة لكل مستمعيها، فتكلفة المعالج
+        بعدد المحطات وليس بعدد المجموعات. التحكم (الإيقاف المؤقت، التخطي،
+        الانتقال) من المحطة فقط، ولا يُستمع إلا لمحطة جعلها مشرفوها عامة.
+        """
+        try:
+            if station_id == chat_id:
+                return {"success": False, "message": "لا يمكن الاستماع لنفس المجموعة!"}
+            if not await self.db.is_chat_active(station_id):
+                return {"success": False, "message": "المحطة غير موجودة أو غير مفعلة!"}
+            if not await self.db.is_public_station(station_id):
+                return {"success": False, "message": "المحطة لا تسمح بالاستماع لها! (يفعّلها مشرفوها بـ /station on)"}
+            if station_id in self.station_of:
+                return {"success": False, "message": "هذه المجموعة تستمع لمحطة أخرى!"}
+            if self.listeners.get(chat_id):
+                return {"success": False, "message": "هذه المجموعة محطة لمجموعات أخرى!"}
+            
+            # إيقاف تشغيل المجموعة الخاص أو استماعها لمحطة أخرى
+            old_station = self.station_of.pop(chat_id, None)
+            if old_station is not None:
+                self._remove_listener(chat_id, old_station)
+            elif chat_id in self.active_calls:
+                await self.stop(chat_id)
+            
+            self.station_of[chat_id] = station_id
+            self.listeners.setdefault(station_id, set()).add(chat_id)
+            await self.db.set_station(chat_id, station_id)
+            
+            song = self.active_calls.get(station_id, {}).get("current_song")
+            if not song:
+                # المحطة متوقفة: المجموعة تنضم للمكالمة عند بدء تشغيلها
+                if chat_id in self.active_calls:
+                    await self.leave_voice_chat(chat_id)
+                    del self.active_calls[chat_id]
+            elif not self.active_calls[station_id].get("station"):
+                # أول مستمع أثناء الأغنية: المحطة تنتقل لفك ترميز مشترك من موضعها
+                await self._start_station(station_id)
+            else:
+                await self._tune(chat_id, station_id)
+            
+            return {
+                "success": True,
+                "current_song": song['title'] if song else None
+            }
+        
+        except Exception as e:
+            return {"success": False, "message": f"خطأ: {str(e)}"}
+    
+    async def unlisten(self, chat_id: int) -> Dict:
+        """إيقاف الاستماع للمحطة ومغادرة المكالمة"""
+        try:
+            station_id = self.station_of.pop(chat_id, None)
+            if station_id is None:
+                return {"success": False, "message": "المجموعة لا تستمع لأي محطة!"}
+            
+            self._remove_listener(chat_id, station_id)
+            await self.db.set_station(chat_id, None)
+            
+            if chat_id in self.active_calls:
+                await self.leave_voice_chat(chat_id)
+                del self.active_calls[chat_id]
+            
+            return {"success": True, "message": "تم إيقاف الاستماع للمحطة"}
+        
+        except Exception as e:
+            return {"success": False, "message": f"خطأ: {str(e)}"}
+    
+    async def set_public_station(self, chat_id: int, public: bool) -> Dict:
+        """السماح بالاستماع لمحطة المجموعة، أو منعه وإيقاف مستمعيها الحاليين"""
+        try:
+            await self.db.set_public_station(chat_id, public)
+            if public:
+                return {"success": True, "message": "أصبحت محطة المجموعة عامة"}
+            
+            listeners = list(self.listeners.get(chat_id, ()))
+            for listener in listeners:
+                await self.unlisten(listener)
+            return {
+                "success": True,
+                "message": f"أصبحت محطة المجموعة خاصة (تم إيقاف {len(listeners)} مستمع)"
+            }
+        
+        except Exception as e:
+            return {"success": False, "message": f"خطأ: {str(e)}"}
+    
+    async def load_stations(self):
+        """استرجاع اشتراكات المحطات المحفوظة (قبل استكمال تشغيل المحطات)"""
+        for row in await self.db.get_station_listeners():
+            self.station_of[row['chat_id']] = row['station_id']
+            self.listeners.setdefault(row['station_id'], set()).add(row['chat_id'])
+    
+    async def _start_station(self, station_id: int, offset: Optional[float] = None):
+        """بث أغنية المحطة من فك ترميز مشترك (من موضعها الحالي أو offset) لها ولمستمعيها"""
+        call = self.active_calls[station_id]
+        current = call["stream"]
+        if offset is None:
+            offset = self.positions.position(station_id) or 0.0
+        
+        call["station"] = self._station_key(station_id)
+        pipeline = PcmPipeline(current.source, offset, current.headers, current.follow)
+        await self.backend.play(station_id, current.source, offset, pipeline, call["station"])
+        if self.positions.is_paused(station_id):
+            await self.backend.pause(station_id)
+        
+        await self._broadcast(station_id, offset)
+    
+    async def _broadcast(self, station_id: int, position: Optional[float] = None):
+        """بث ما تشغله المحطة الآن في كل المجموعات المستمعة لها"""
+        listeners = self.listeners.get(station_id)
+        if listeners and self.active_calls.get(station_id, {}).get("station"):
+            await asyncio.gather(*(
+                self._tune(chat_id, station_id, position) for chat_id in list(listeners)
+            ))
+    
+    async def _tune(self, chat_id: int, station_id: int, position: Optional[float] = None):
+        """بث أغنية المحطة الحالية في مجموعة مستمعة (من نفس فك الترميز)
+        
+        position: موضع المحطة إذا لم يُسجل بعد (بعد الانتقال لموضع جديد).
+        """
+        call = self.active_calls[station_id]
+        current = call["stream"]
+        if position is None:
+            position = self.positions.position(station_id) or 0.0
+        try:
+            if chat_id not in self.active_calls:
+                await self.join_voice_chat(chat_id)
+            
+            # وصف المصدر فقط: يُفتح إذا لم تكن المحطة مفتوحة في عملية بث هذه المجموعة
+            pipeline = PcmPipeline(current.source, position, current.headers, current.follow)
+            await self.backend.play(chat_id, current.source, position, pipeline, call["station"])
+            if self.positions.is_paused(station_id):
+                await self.backend.pause(chat_id)
+            
+            self.active_calls[chat_id]["current_song"] = call["current_song"]
+            self.active_calls[chat_id]["status"] = "listening"
+        
+        except Exception as e:
+            logger.error(f"خطأ في بث المحطة {station_id} في {chat_id}: {e}")
+    
+    def _listening(self, station_id: int) -> List[int]:
+        """المجموعات المستمعة للمحطة والموجودة في المكالمة الآن"""
+        return [chat_id for chat_id in self.listeners.get(station_id, ())
+                if chat_id in self.active_calls]
+    
+    def _remove_listener(self, chat_id: int, station_id: int):
+        listeners = self.listeners.get(station_id)
+        if listeners is not None:
+            listeners.discard(chat_id)
+            if not listeners:
+                del self.listeners[station_id]
+    
+    def _station_key(self, station_id: int) -> str:
+        """مفتاح جديد لكل أغنية (أو موضع) تبثه المحطة"""
+        return f"{station_id}:{next(self._broadcasts)}"
+    
     # ══════════════════════════════════════════════════════════════
     #                    إضافة الأغاني
     # ══════════════════════════════════════════════════════════════
     
     async def add_song_from_url(self, chat_id: int, url: str) -> Dict:
-        """إضافة أغنية من رابط (يوتيوب/ساوند كلاود)"""
+        """إضافة أغنية (أو قائمة تشغيل كاملة) من رابط يوتيوب/ساوند كلاود
+        
+        تُحفظ المعلومات فقط، والصوت يُحمّل عند تجهيز الأغاني القادمة أو قبل
+        التشغيل مباشرة (إلا إذا كان الملف في الذاكرة المؤقتة مسبقاً).
+        """
         try:
-            # إعدادات التحميل
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': f'{DOWNLOAD_FOLDER}/%(title)s.%(ext)s',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': AUDIO_QUALITY,
-                }],
-                'quiet': True,
-                'no_warnings': True,
-            }
+            if await self.db.get_song_count(chat_id) >= MAX_PLAYLIST_SIZE:
+                return {
+                    "success": False,
+                    "message": f"القائمة ممتلئة! الحد الأقصى: {MAX_PLAYLIST_SIZE} أغنية"
+                }
             
-            # تحميل الأغنية
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                
-                title = info.get('title', 'Unknown')
-                duration = info.get('duration', 0)
-                artist = info.get('artist') or info.get('uploader', 'Unknown')
-                
-                # مسار الملف المحمل
-                file_path = ydl.prepare_filename(info)
-                file_path = file_path.rsplit('.', 1)[0] + '.mp3'
-                
-                # التحقق من حجم الملف
-                file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
-                if file_size > MAX_FILE_SIZE:
-                    os.remove(file_path)
-                    return {
-                        "success": False,
-                        "message": f"الملف كبير جداً ({file_size:.1f}MB)! الحد الأقصى: {MAX_FILE_SIZE}MB"
-                    }
-                
-                # حفظ في قاعدة البيانات
-                song_id = self.db.add_song(
-                    chat_id=chat_id,
-                    title=title,
-                    file_path=file_path,
-                    duration=duration,
-                    artist=artist,
-                    source_type='url',
-                    source_url=url
-                )
-                
-                if song_id:
-                    return {
-                        "success": True,
-                        "title": title,
-                        "duration": self._format_duration(duration)
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "message": "فشل حفظ الأغنية في قاعدة البيانات"
-                    }
+            # معلومات الرابط (مع الملف المشترك إذا كان محملاً مسبقاً)
+            info = await self.cache.resolve_url(url)
+            
+            title = info['title']
+            duration = info['duration']
+            artist = info['artist']
+            file_path = info['file_path']
+            
+            # حفظ في قاعدة البيانات
+            song_id = await self.db.add_song(
+                chat_id=chat_id,
+                title=title,
+                file_path=file_path,
+                duration=duration,
+                artist=artist,
+                source_type='url',
+                source_url=url,
+                cache_key=info['cache_key']
+            )
+            
+            if song_id:
+                self.refresh_queue(chat_id)
+                self.wake(chat_id)
+                return {
+                    "success": True,
+                    "title": title,
+                    "duration": self._format_duration(duration)
+                }
+            else:
+                return {
+                    "success": False,
+                    "message": "فشل حفظ الأغنية في قاعدة البيانات"
+                }
+        
+        except PlaylistUrl as e:
+            return await self.import_playlist(chat_id, e.info)
+        
+        except FileTooLarge as e:
+            return {
+                "success": False,
+                "message": f"الملف كبير جداً ({e.size_mb:.1f}MB)! الحد الأقصى: {MAX_FILE_SIZE}MB"
+            }
         
         except Exception as e:
-            logger.error(f"خطأ في تحميل الأغنية: {e}")
+            logger.error(f"خطأ في جلب معلومات الأغنية: {e}")
             return {
                 "success": False,
-                "message": f"فشل التحميل: {str(e)}"
+                "message": f"فشل جلب معلومات الرابط: {str(e)}"
             }
     
+    async def import_playlist(self, chat_id: int, info: Dict) -> Dict:
+        """استيراد قائمة تشغيل من معلوماتها المسطحة
+        
+        كل المقاطع تُضاف كمعلومات فقط في معاملة واحدة، والصوت يُحمّل لاحقاً
+        عند تجهيز الأغاني القادمة أو قبل التشغيل مباشرة. المقاطع التي
+        تنقصها المعلومات (العنوان أو المدة) تُستكمل في الخلفية.
+        """
+        songs = []
+        for entry in info.get('entries') or []:
+            if not entry or not entry.get('id') or not entry.get('url') or not entry.get('ie_key'):
+                continue
+            songs.append({
+                'title': entry.get('title') or "Unknown",
+                'duration': int(entry.get('duration') or 0),
+                'artist': entry.get('channel') or entry.get('uploader') or "Unknown",
+                'source_type': 'url',
+                'source_url': entry['url'],
+                'cache_key': make_cache_key(entry),
+            })
+        
+        if not songs:
+            return {
+                "success": False,
+                "message": "قائمة التشغيل فارغة أو غير مدعومة"
+            }
+        
+        song_ids = await self.db.add_songs_bulk(chat_id, songs, MAX_PLAYLIST_SIZE)
+        if not song_ids:
+            return {
+                "success": False,
+                "message": f"القائمة ممتلئة! الحد الأقصى: {MAX_PLAYLIST_SIZE} أغنية"
+            }
+        
+        self.refresh_queue(chat_id)
+        self.wake(chat_id)
+        
+        incomplete = [
+            (song_id, song['source_url'])
+            for song_id, song in zip(song_ids, songs)
+            if song['title'] == "Unknown" or not song['duration']
+        ]
+        if incomplete:
+            task = asyncio.create_task(self._resolve_metadata(chat_id, incomplete))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        
+        return {
+            "success": True,
+            "playlist": True,
+            "title": info.get('title') or "Unknown",
+            "added": len(song_ids),
+            "skipped": len(info.get('entries') or []) - len(song_ids)
+        }
+    
+    async def _resolve_metadata(self, chat_id: int, songs: List):
+        """استكمال معلومات المقاطع المستوردة بالتوازي (بحد IMPORT_RESOLVE_WORKERS)"""
+        async def resolve(song_id: int, url: str):
+            async with self._resolving:
+                try:
+                    info = await self.downloader.extract(url)
+                except Exception as e:
+                    logger.warning(f"تعذر استكمال معلومات {url}: {e}")
+                    return
+                metadata = {
+                    'title': info.get('title'),
+                    'artist': info.get('artist') or info.get('uploader'),
+                    'duration': int(info['duration']) if info.get('duration') else None,
+                }
+                try:
+                    await self.db.update_song_metadata(chat_id, song_id, **metadata)
+                except Exception as e:
+                    logger.error(f"تعذر حفظ معلومات {url}: {e}")
+                    return
+                
+                # الأغنية قيد التشغيل الآن: تحديث نسختها في المكالمة النشطة
+                current = self.active_calls.get(chat_id, {}).get("current_song")
+                if current and current['id'] == song_id:
+                    current.update({key: value for key, value in metadata.items() if value is not None})
+        
+        try:
+            await asyncio.gather(*(resolve(song_id, url) for song_id, url in songs))
+        finally:
+            self.playlist.invalidate(chat_id)
+    
+    def cancel_downloads(self, chat_id: int) -> int:
+        """إلغاء تحميلات المجموعة الجارية (عدا المشتركة مع مجموعات أخرى)"""
+        return self.cache.cancel_chat(chat_id)
+    
     async def add_song_from_file(self, chat_id: int, audio) -> Dict:
-        """إضافة أغنية من ملف مرفوع"""
+        """إضافة أغنية من ملف مرفوع
+        
+        الحجم يُفحص من معلومات الملف قبل التحميل، ونفس الملف (file_unique_id)
+        يُحمّل مرة واحدة لكل المجموعات. التحميل يبدأ في الخلفية على أجزاء،
+        ويمكن تشغيل الأغنية قبل اكتماله.
+        """
         try:
-            # معلومات الملف
-            title = audio.file_name or audio.title or "Unknown"
-            duration = audio.duration or 0
-            artist = audio.performer or "Unknown"
-            file_id = audio.file_id
-            
-            # تحميل الملف
-            file_path = f"{DOWNLOAD_FOLDER}/{title}"
-            await self.userbot.download_media(audio, file_name=file_path)
+            if await self.db.get_song_count(chat_id) >= MAX_PLAYLIST_SIZE:
+                return {
+                    "success": False,
+                    "message": f"القائمة ممتلئة! الحد الأقصى: {MAX_PLAYLIST_SIZE} أغنية"
+                }
             
-            # التحقق من حجم الملف
-            file_size = os.path.getsize(file_path) / (1024 * 1024)
+            # التحقق من حجم الملف قبل تحميل أي جزء منه
+            file_size = (audio.file_size or 0) / (1024 * 1024)
             if file_size > MAX_FILE_SIZE:
-                os.remove(file_path)
                 return {
                     "success": False,
-                    "message": f"الملف كبير جداً ({file_size:.1f}MB)!"
+                    "message": f"الملف كبير جداً ({file_size:.1f}MB)! الحد الأقصى: {MAX_FILE_SIZE}MB"
                 }
             
-            # حفظ في قاعدة البيانات
-            song_id = self.db.add_song(
+            # معلومات الملف
+            title = audio.file_name or audio.title or "Unknown"
+            duration = audio.duration or 0
+            artist = audio.performer or "Unknown"
+            file_id = audio.file_id
+            cache_key = telegram_cache_key(audio.file_unique_id)
+            
+            # حفظ في قاعدة البيانات (جاهزة فوراً إذا سبق تحميل نفس الملف)
+            song_id = await self.db.add_song(
                 chat_id=chat_id,
                 title=title,
                 file_id=file_id,
-                file_path=file_path,
                 duration=duration,
                 artist=artist,
-                source_type='file'
+                source_type='file',
+                cache_key=cache_key
             )
             
             if song_id:
+                self.cache.prefetch({
+                    'id': song_id,
+                    'chat_id': chat_id,
+                    'title': title,
+                    'artist': artist,
+                    'duration': duration,
+                    'file_id': file_id,
+                    'file_size': audio.file_size,
+                    'cache_key': cache_key,
+                })
+                self.refresh_queue(chat_id)
+                self.wake(chat_id)
                 return {
                     "success": True,
                     "title": title,
@@ -383,73 +784,195 @@ class RadioManager:
     # ══════════════════════════════════════════════════════════════
     
     async def auto_player_loop(self):
-        """حلقة التشغيل التلقائي المستمر"""
+        """نظام التشغيل التلقائي المبني على الأحداث
+        
+        لا يوجد فحص دوري: عند البدء يُجدول تشغيل المجموعات المتوقفة مرة واحدة،
+        وبعدها يعمل الجدول فقط عند انتهاء أغنية أو حدث يغير حالة مجموعة.
+        """
         logger.info("🔄 بدء نظام التشغيل التلقائي...")
         
-        while True:
-            try:
-                # فحص جميع المجموعات النشطة
-                active_chats = self.db.get_all_active_chats()
-                
-                for chat_id in active_chats:
-                    # التحقق من التشغيل التلقائي
-                    if not self.db.get_autoplay_status(chat_id):
-                        continue
-                    
-                    # الحصول على حالة التشغيل
-                    state = self.db.get_playback_state(chat_id)
-                    
-                    # إذا كان متوقفاً ويوجد أغاني، ابدأ التشغيل
-                    if state and not state['is_playing'] and not state['is_paused']:
-                        playlist = self.db.get_playlist(chat_id)
-                        
-                        if playlist:
-                            logger.info(f"🎵 بدء التشغيل التلقائي للمجموعة: {chat_id}")
-                            await self.start_playing(chat_id)
-                    
-                    # إذا انتهت الأغنية، شغل التالية
-                    if chat_id in self.active_calls:
-                        call_info = self.active_calls[chat_id]
-                        
-                        # فحص إذا انتهت الأغنية (يتطلب تنفيذ فعلي)
-                        # هنا يتم فحص حالة التشغيل من pytgcalls
-                        
-                        # إذا انتهت، شغل التالية
-                        # await self.skip(chat_id)
-                
-                # انتظر قبل الفحص التالي
-                await asyncio.sleep(10)
+        # الجدول يعمل أثناء الاستكمال لتنفيذ الانتقالات الاحتياطية للمجموعات المستكملة
+        runner = asyncio.create_task(self.scheduler.run())
+        
+        # المستمعون معروفون قبل استكمال المحطات فيعودون معها
+        await self.load_stations()
+        await self.recover_playback()
+        
+        for chat_id in await self.db.get_autoplay_candidates():
+            self.scheduler.trigger(chat_id)
+        
+        await runner
+    
+    async def recover_playback(self, concurrency: int = RESUME_CONCURRENCY) -> Dict:
+        """استكمال المجموعات التي كانت قيد التشغيل عند توقف البوت
+        
+        المكالمات النشطة في الذاكرة تضيع مع العملية، لكن playback_state يحفظ
+        الأغنية والموضع: كل مجموعة تعود للمكالمة وتُكمل من نفس الموضع.
+        عدة مجموعات تُستكمل في نفس الوقت (بحد concurrency) حتى لا ينتظر
+        آخرها انضمام كل ما قبله.
+        """
+        started = time.monotonic()
+        chats = await self.db.get_resumable_chats()
+        if not chats:
+            return {"chats": 0, "resumed": 0, "failed": 0, "seconds": 0.0}
+        
+        logger.info(f"♻️ استكمال التشغيل في {len(chats)} مجموعة...")
+        limit = asyncio.Semaphore(concurrency)
+        
+        async def rehydrate(chat: Dict) -> bool:
+            async with limit:
+                return await self._rehydrate(chat)
+        
+        results = await asyncio.gather(*(rehydrate(chat) for chat in chats))
+        resumed = sum(results)
+        seconds = time.monotonic() - started
+        
+        logger.info(f"♻️ تم استكمال {resumed}/{len(chats)} مجموعة في {seconds:.2f} ثانية")
+        return {
+            "chats": len(chats),
+            "resumed": resumed,
+            "failed": len(chats) - resumed,
+            "seconds": seconds
+        }
+    
+    async def _rehydrate(self, chat: Dict) -> bool:
+        """إعادة مجموعة واحدة للمكالمة واستكمال أغنيتها من الموضع المحفوظ"""
+        chat_id = chat['chat_id']
+        song, offset, played_at = chat['song'], chat['position'], chat['played_at']
+        try:
+            # الأغنية حُذفت أو انتهت أثناء التوقف: البدء بالتالية من أولها (تشغيل جديد)
+            if not song or (song.get('duration') and offset >= song['duration']):
+                song, offset, played_at = await self.db.get_next_song(chat_id), 0.0, None
+                if not song:
+                    await self.db.stop_playback(chat_id)
+                    return False
+                await self.db.set_playing(chat_id, song['id'], True)
             
-            except Exception as e:
-                logger.error(f"خطأ في حلقة التشغيل التلقائي: {e}")
-                await asyncio.sleep(10)
+            await self.join_voice_chat(chat_id)
+            if not await self.play_song(chat_id, song, offset, played_at):
+                raise RuntimeError(f"تعذر تشغيل {song['title']}")
+            
+            if chat['is_paused']:
+                await self.pause_audio(chat_id)
+                self.scheduler.pause(chat_id)
+                await self.db.set_paused(chat_id, True)
+            return True
+        
+        except Exception as e:
+            logger.error(f"تعذر استكمال التشغيل في {chat_id}: {e}")
+            # تُعامل كمتوقفة فيبدأ فيها التشغيل التلقائي من جديد
+            self.active_calls.pop(chat_id, None)
+            await self.db.stop_playback(chat_id)
+            return False
+    
+    def wake(self, chat_id: int):
+        """تنبيه الجدول لمجموعة متوقفة (إضافة أغنية، تفعيل، تشغيل تلقائي)"""
+        if chat_id not in self.active_calls and chat_id not in self.station_of:
+            self.scheduler.trigger(chat_id)
+    
+    def refresh_queue(self, chat_id: int):
+        """تغيرت القائمة: حذف صفحاتها المنسقة وإعادة تجهيز الأغاني القادمة"""
+        self.playlist.invalidate(chat_id)
+        song = self.active_calls.get(chat_id, {}).get("current_song")
+        if song:
+            self.prefetcher.schedule(chat_id, song['id'])
+    
+    def on_stream_end(self, chat_id: int):
+        """انتهاء بث الأغنية الحالية: الانتقال فوراً دون انتظار الموعد
+        
+        المجموعة المستمعة لا تنتقل بنفسها: المحطة تبث لها أغنيتها التالية.
+        """
+        if chat_id in self.active_calls and chat_id not in self.station_of:
+            self.scheduler.trigger(chat_id)
+    
+    async def _on_transition_due(self, chat_id: int):
+        """تنفيذ الانتقال المستحق لمجموعة"""
+        if chat_id in self.station_of:
+            return
+        
+        autoplay = await self.db.get_autoplay_status(chat_id)
+        
+        # انتهت الأغنية الحالية: شغل التالية
+        if chat_id in self.active_calls:
+            self._finish_song(chat_id, "complete")
+            
+            # بدون التشغيل التلقائي يتوقف الراديو عند نهاية القائمة
+            next_song = await self.db.get_next_song(chat_id, wrap=autoplay)
+            
+            if not next_song:
+                await self.stop(chat_id)
+                return
+            
+            await self.play_song(chat_id, next_song)
+            await self.db.set_playing(chat_id, next_song['id'], True)
+            return
+        
+        # مجموعة متوقفة: ابدأ التشغيل إذا كان التشغيل التلقائي مفعلاً
+        if not autoplay or not await self.db.is_chat_active(chat_id):
+            return
+        
+        state = await self.db.get_playback_state(chat_id)
+        if state and not state['is_playing'] and not state['is_paused']:
+            logger.info(f"🎵 بدء التشغيل التلقائي للمجموعة: {chat_id}")
+            await self.start_playing(chat_id)
     
     # ══════════════════════════════════════════════════════════════
     #                    حالة التشغيل
     # ══════════════════════════════════════════════════════════════
     
     async def get_status(self, chat_id: int) -> Dict:
-        """الحصول على حالة التشغيل"""
-        state = self.db.get_playback_state(chat_id)
+        """الحصول على حالة التشغيل (حالة المحطة للمجموعة المستمعة)"""
+        station_id = self.station_of.get(chat_id)
+        if station_id is not None:
+            return {**await self.get_status(station_id), "station": station_id}
+        
+        state = await self.db.get_playback_state(chat_id)
         
         if not state or not state['is_playing']:
             return {"is_playing": False}
         
-        playlist = self.db.get_playlist(chat_id)
-        
         return {
             "is_playing": True,
             "current_song": state.get('title', 'Unknown'),
             "duration": self._format_duration(state.get('duration', 0)),
-            "elapsed": "00:00",  # يتطلب تنفيذ فعلي
-            "queue_size": len(playlist),
-            "autoplay": self.db.get_autoplay_status(chat_id)
+            "elapsed": self._format_duration(int(self.positions.position(chat_id) or 0)),
+            "queue_size": await self.db.get_song_count(chat_id),
+            "autoplay": await self.db.get_autoplay_status(chat_id)
         }
     
     # ══════════════════════════════════════════════════════════════
     #                    دوال مساعدة
     # ══════════════════════════════════════════════════════════════
     
+    def _finish_song(self, chat_id: int, reason: str):
+        """تسجيل نهاية الأغنية الحالية في الإحصائيات (complete / skip / stop)"""
+        call = self.active_calls.get(chat_id, {})
+        played_at = call.pop("played_at", None)
+        song = call.get("current_song")
+        if not played_at or not song:
+            return
+        
+        if reason == "complete":
+            self.stats.record_complete(chat_id, song, played_at, song.get('duration') or 0)
+        elif reason == "skip":
+            self.stats.record_skip(chat_id, song, played_at, self.positions.position(chat_id) or 0)
+        else:
+            self.stats.record_stop(chat_id, song, played_at, self.positions.position(chat_id) or 0)
+    
+    def current_song_id(self, chat_id: int) -> Optional[int]:
+        """معرف الأغنية قيد التشغيل في المجموعة"""
+        song = self.active_calls.get(chat_id, {}).get("current_song")
+        return song['id'] if song else None
+    
+    def _is_media_in_use(self, cache_key: str) -> bool:
+        """هل الملف قيد التشغيل أو مجهز كأغنية قادمة في أي مجموعة"""
+        if self.prefetcher.is_pinned(cache_key):
+            return True
+        return any(
+            call.get("current_song", {}).get("cache_key") == cache_key
+            for call in self.active_calls.values()
+        )
+    
     def _format_duration(self, seconds: int) -> str:
         """تنسيق المدة الزمنية"""
         if not seconds:
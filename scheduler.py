@@ -0,0 +1,136 @@
+"""
+جدولة التشغيل - Playback Scheduler
+تنفيذ الانتقال بين الأغاني عند موعده بدلاً من الفحص الدوري
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PlaybackScheduler:
+    """كومة (heap) بمواعيد الانتقال القادمة لكل مجموعة
+
+    كل مجموعة لها موعد واحد صالح على الأكثر. عند إعادة الجدولة أو الإلغاء
+    يبقى الموعد القديم في الكومة ويُتجاهل عند وصوله (حذف كسول)، لذا كل
+    العمليات O(log n) والعمل يتناسب مع عدد الانتقالات الفعلية فقط.
+    """
+
+    def __init__(self, on_due: Callable[[int], Awaitable[None]]):
+        self.on_due = on_due
+        self._heap: List[Tuple[float, int, int]] = []  # (deadline, seq, chat_id)
+        self._deadlines: Dict[int, Tuple[float, int]] = {}  # chat_id -> (deadline, seq)
+        self._paused: Dict[int, float] = {}  # chat_id -> الوقت المتبقي
+        self._running: Set[int] = set()
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    # ══════════════════════════════════════════════════════════════
+    #                    إدارة المواعيد
+    # ══════════════════════════════════════════════════════════════
+
+    def schedule(self, chat_id: int, delay: float):
+        """جدولة انتقال المجموعة بعد delay ثانية (يستبدل أي موعد سابق)"""
+        self._paused.pop(chat_id, None)
+        deadline = self._now() + max(0.0, delay)
+        seq = next(self._seq)
+
+        self._deadlines[chat_id] = (deadline, seq)
+        heapq.heappush(self._heap, (deadline, seq, chat_id))
+
+        # إيقاظ الحلقة فقط إذا أصبح هذا أقرب موعد
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+
+    def trigger(self, chat_id: int):
+        """تنفيذ فوري (مثلاً عند انتهاء البث أو إضافة أغنية لمجموعة متوقفة)"""
+        self.schedule(chat_id, 0)
+
+    def cancel(self, chat_id: int):
+        """إلغاء موعد المجموعة"""
+        self._deadlines.pop(chat_id, None)
+        self._paused.pop(chat_id, None)
+
+    def pause(self, chat_id: int):
+        """تجميد الموعد مع حفظ الوقت المتبقي"""
+        entry = self._deadlines.pop(chat_id, None)
+        if entry:
+            self._paused[chat_id] = max(0.0, entry[0] - self._now())
+
+    def resume(self, chat_id: int):
+        """استكمال الموعد المجمد"""
+        remaining = self._paused.pop(chat_id, None)
+        if remaining is not None:
+            self.schedule(chat_id, remaining)
+
+    def remaining(self, chat_id: int) -> Optional[float]:
+        """الوقت المتبقي حتى الانتقال التالي"""
+        if chat_id in self._paused:
+            return self._paused[chat_id]
+        entry = self._deadlines.get(chat_id)
+        if entry:
+            return max(0.0, entry[0] - self._now())
+        return None
+
+    def _compact(self):
+        """إزالة المواعيد الملغاة من الكومة"""
+        self._heap = [
+            (deadline, seq, chat_id)
+            for chat_id, (deadline, seq) in self._deadlines.items()
+        ]
+        heapq.heapify(self._heap)
+
+    # ══════════════════════════════════════════════════════════════
+    #                    حلقة التنفيذ
+    # ══════════════════════════════════════════════════════════════
+
+    async def run(self):
+        """تنفيذ المواعيد عند حلولها، والنوم حتى أقرب موعد"""
+        while True:
+            now = self._now()
+
+            while self._heap and self._heap[0][0] <= now:
+                deadline, seq, chat_id = heapq.heappop(self._heap)
+                if self._deadlines.get(chat_id, (None, None))[1] != seq:
+                    continue  # موعد قديم تم استبداله أو إلغاؤه
+
+                del self._deadlines[chat_id]
+                self._dispatch(chat_id)
+
+            # تجاهل المواعيد الملغاة في رأس الكومة قبل حساب مدة النوم
+            while self._heap and self._deadlines.get(
+                    self._heap[0][2], (None, None))[1] != self._heap[0][1]:
+                heapq.heappop(self._heap)
+
+            timeout = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, chat_id: int):
+        """تنفيذ الانتقال في مهمة مستقلة (مرة واحدة لكل مجموعة في نفس الوقت)"""
+        if chat_id in self._running:
+            return
+
+        self._running.add(chat_id)
+        asyncio.create_task(self._execute(chat_id))
+
+    async def _execute(self, chat_id: int):
+        try:
+            await self.on_due(chat_id)
+        except Exception as e:
+            logger.error(f"خطأ في انتقال التشغيل للمجموعة {chat_id}: {e}")
+        finally:
+            self._running.discard(chat_id)
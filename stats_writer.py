@@ -0,0 +1,100 @@
+"""
+كاتب الإحصائيات - Statistics Writer
+تجميع أحداث التشغيل في الذاكرة وحفظها دفعة واحدة خارج مسار التشغيل
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Tuple
+
+from database import AsyncDatabase
+from config import STATS_FLUSH_INTERVAL, STATS_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class StatisticsWriter:
+    """طابور أحداث التشغيل مع حفظ دوري على دفعات
+
+    تسجيل الحدث إضافة لقائمة في الذاكرة فقط (لا ينتظر القرص)، والحفظ يتم
+    في معاملة واحدة كل STATS_FLUSH_INTERVAL ثانية أو عند تجمع
+    STATS_BATCH_SIZE حدث، أيهما أسبق.
+    """
+
+    def __init__(self, db: AsyncDatabase, flush_interval: float = STATS_FLUSH_INTERVAL,
+                 batch_size: int = STATS_BATCH_SIZE):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._events: List[Tuple] = []
+        self._full = asyncio.Event()
+        self._flushing = asyncio.Lock()
+        self.flushed = 0
+        self.batches = 0
+
+    # ══════════════════════════════════════════════════════════════
+    #                    تسجيل الأحداث
+    # ══════════════════════════════════════════════════════════════
+
+    def record_play(self, chat_id: int, song: Dict) -> float:
+        """بدء تشغيل أغنية، ويعيد وقت البدء لربط حدث النهاية به"""
+        played_at = time.time()
+        self._add(self._event('play', chat_id, song, played_at, 0))
+        return played_at
+
+    def record_complete(self, chat_id: int, song: Dict, played_at: float, listened: float):
+        """انتهت الأغنية كاملة"""
+        self._add(self._event('complete', chat_id, song, played_at, listened))
+
+    def record_skip(self, chat_id: int, song: Dict, played_at: float, listened: float):
+        """تم تخطي الأغنية قبل نهايتها"""
+        self._add(self._event('skip', chat_id, song, played_at, listened))
+
+    def record_stop(self, chat_id: int, song: Dict, played_at: float, listened: float):
+        """توقف الراديو أثناء الأغنية"""
+        self._add(self._event('stop', chat_id, song, played_at, listened))
+
+    @staticmethod
+    def _event(kind: str, chat_id: int, song: Dict, played_at: float, listened: float) -> Tuple:
+        """الحدث يحمل مفتاح الأغنية وعنوانها وفنانها وقت التشغيل، فتبقى الإحصائيات
+        صحيحة حتى لو حُذفت الأغنية قبل الحفظ"""
+        return (kind, chat_id, song['id'], played_at, listened,
+                song.get('cache_key') or song['title'], song['title'],
+                song.get('artist') or 'غير معروف')
+
+    def _add(self, event: Tuple):
+        self._events.append(event)
+        if len(self._events) >= self.batch_size:
+            self._full.set()
+
+    # ══════════════════════════════════════════════════════════════
+    #                    الحفظ
+    # ══════════════════════════════════════════════════════════════
+
+    async def run(self):
+        """حلقة الحفظ الدوري"""
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> int:
+        """حفظ الأحداث المتجمعة الآن، وإرجاع عددها"""
+        async with self._flushing:
+            self._full.clear()
+            if not self._events:
+                return 0
+
+            events, self._events = self._events, []
+            if not await self.db.record_statistics(events):
+                # إعادة الأحداث للمحاولة في الدفعة التالية (بحد أقصى حتى لا تتراكم بلا نهاية)
+                self._events[:0] = events[-self.batch_size * 10:]
+                logger.warning(f"تعذر حفظ {len(events)} حدث تشغيل، ستتم إعادة المحاولة")
+                return 0
+
+            self.flushed += len(events)
+            self.batches += 1
+            return len(events)
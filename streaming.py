@@ -0,0 +1,712 @@
+"""
+محرك البث الصوتي - Audio Streaming Engine
+فك ترميز الأغاني إلى إطارات PCM وإرسالها بالزمن الحقيقي للمكالمة الصوتية
+"""
+
+import asyncio
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from config import (
+    STREAM_BACKEND, STREAM_SINK_FOLDER, STREAM_PREBUFFER_MS, STREAM_FOLLOW_TIMEOUT,
+    STATION_BUFFER_MS
+)
+
+try:
+    from pytgcalls import PyTgCalls, StreamType
+    from pytgcalls.types import Update
+    from pytgcalls.types.input_stream import AudioPiped
+    from pytgcalls.types.input_stream.quality import HighQualityAudio
+except ImportError:
+    PyTgCalls = None
+
+logger = logging.getLogger(__name__)
+
+
+# صيغة الإطارات: PCM موقّع 16 بت، 48kHz، قناتان (ما تتوقعه مكالمات تليجرام)
+SAMPLE_RATE = 48000
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+FRAME_SAMPLES = SAMPLE_RATE // 50  # إطار كل 20ms
+FRAME_BYTES = FRAME_SAMPLES * CHANNELS * SAMPLE_WIDTH
+FRAME_SECONDS = FRAME_SAMPLES / SAMPLE_RATE
+
+PCM_FORMAT_ARGS = ['-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', str(CHANNELS)]
+
+# مصادر الشبكة: إعادة الاتصال عند انقطاع الرابط بدلاً من إنهاء الأغنية
+HTTP_INPUT_ARGS = ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5']
+
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+# ══════════════════════════════════════════════════════════════
+#                    فك الترميز (FFmpeg → PCM)
+# ══════════════════════════════════════════════════════════════
+
+class PcmPipeline:
+    """عملية FFmpeg تحول مصدراً صوتياً إلى إطارات PCM ثابتة الحجم
+
+    المصدر ملف محلي أو رابط بث مباشر (مع ترويسات HTTP التي يطلبها الموقع).
+    follow: الملف ما زال قيد التحميل، فيُقرأ بمتابعة نموه بدلاً من التوقف عند نهايته.
+    """
+
+    def __init__(self, source: str, offset: float = 0.0, headers: Optional[Dict] = None,
+                 follow: bool = False):
+        self.source = source
+        self.offset = offset
+        self.headers = headers
+        self.follow = follow
+        self.samples = 0
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._preloaded: Deque[Optional[bytes]] = deque()
+
+    async def start(self):
+        args = ['ffmpeg', '-nostdin', '-loglevel', 'error']
+        if self.offset:
+            args += ['-ss', f'{self.offset:.3f}']
+        if self.source.startswith(('http://', 'https://')):
+            args += HTTP_INPUT_ARGS
+        if self.headers:
+            args += ['-headers', ''.join(f'{key}: {value}\r\n' for key, value in self.headers.items())]
+        if self.follow:
+            # نهاية الملف تعني نهاية الأغنية فقط إذا لم يكبر خلال المهلة
+            args += ['-follow', '1', '-rw_timeout', str(STREAM_FOLLOW_TIMEOUT * 1000000),
+                     '-i', f'file:{self.source}']
+        else:
+            args += ['-i', self.source]
+        args += [*PCM_FORMAT_ARGS, 'pipe:1']
+
+        self.process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+
+    async def preload(self, frames: int) -> int:
+        """فك ترميز أول الإطارات مسبقاً لتبدأ الأغنية فوراً عند تشغيلها
+
+        يعيد عدد الإطارات المفكوكة (صفر يعني أن المصدر لم ينتج صوتاً).
+        """
+        decoded = 0
+        for _ in range(frames):
+            frame = await self._decode_frame()
+            self._preloaded.append(frame)
+            if frame is None:
+                break
+            decoded += 1
+        return decoded
+
+    async def read_frame(self) -> Optional[bytes]:
+        """قراءة إطار واحد (None عند نهاية المصدر)"""
+        if self._preloaded:
+            frame = self._preloaded.popleft()
+        else:
+            frame = await self._decode_frame()
+
+        if frame is not None:
+            self.samples += FRAME_SAMPLES
+        return frame
+
+    async def _decode_frame(self) -> Optional[bytes]:
+        try:
+            return await self.process.stdout.readexactly(FRAME_BYTES)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            # الإطار الأخير يُكمل بالصمت للحفاظ على حجم ثابت
+            return e.partial + bytes(FRAME_BYTES - len(e.partial))
+
+    @property
+    def position(self) -> float:
+        """موضع آخر إطار مقروء في المصدر (بالثواني، بدقة العينة)"""
+        return self.offset + self.samples / SAMPLE_RATE
+
+    def cpu_seconds(self) -> float:
+        """وقت المعالج الذي استهلكته عملية FFmpeg (لينكس فقط)"""
+        if not self.process:
+            return 0.0
+        try:
+            with open(f'/proc/{self.process.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+        except (OSError, IndexError, ValueError):
+            return 0.0
+
+    async def close(self):
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+            try:
+                # إذا امتلأ المخزن تتوقف القراءة فلا تُرى نهاية الأنبوب ولا تنتهي wait()
+                await self.process.stdout.read()
+            except RuntimeError:
+                pass  # قارئ آخر ينتظر بيانات، فالقراءة مستمرة وسيصله إغلاق الأنبوب
+            await self.process.wait()
+
+
+# ══════════════════════════════════════════════════════════════
+#                    المستقبلات (Sinks)
+# ══════════════════════════════════════════════════════════════
+
+class Sink(ABC):
+    """مستقبل إطارات PCM"""
+
+    async def open(self):
+        pass
+
+    @abstractmethod
+    async def write(self, frame: bytes):
+        ...
+
+    async def close(self):
+        pass
+
+
+class NullSink(Sink):
+    """يتجاهل الإطارات (لقياس الأداء والاختبار)"""
+
+    async def write(self, frame: bytes):
+        pass
+
+
+class FileSink(Sink):
+    """يكتب الإطارات في ملف PCM خام"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    async def open(self):
+        self._file = open(self.path, 'ab')
+
+    async def write(self, frame: bytes):
+        self._file.write(frame)
+
+    async def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class FifoSink(Sink):
+    """يكتب الإطارات في أنبوب مسمى (FIFO) يقرأ منه مستقبل خارجي"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    async def open(self):
+        if not os.path.exists(self.path):
+            os.mkfifo(self.path)
+        # O_RDWR لا ينتظر وجود قارئ، وO_NONBLOCK يمنع إيقاف حلقة الأحداث
+        self._fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+
+    async def write(self, frame: bytes):
+        view = memoryview(frame)
+        while view:
+            try:
+                view = view[os.write(self._fd, view):]
+            except BlockingIOError:
+                await asyncio.sleep(FRAME_SECONDS / 2)
+
+    async def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# ══════════════════════════════════════════════════════════════
+#                    البث لمجموعة واحدة
+# ══════════════════════════════════════════════════════════════
+
+class AudioStream:
+    """بث مجموعة واحدة: يسحب الإطارات من PcmPipeline ويرسلها بالزمن الحقيقي
+
+    المستقبل يبقى مفتوحاً بين الأغاني، فتبديل المصدر لا يقطع البث.
+    الموضع يُحسب من عدد العينات المرسلة فعلاً، فالإيقاف والاستئناف
+    والتقديم دقيقة على مستوى العينة.
+    """
+
+    def __init__(self, chat_id: int, sink: Sink,
+                 on_end: Callable[[int], None], realtime: bool = True):
+        self.chat_id = chat_id
+        self.sink = sink
+        self.on_end = on_end
+        self.realtime = realtime
+        self.pipeline: Optional[PcmPipeline] = None
+        self.frames = 0
+        self.pump_cpu = 0.0
+        self._decoder_cpu = 0.0
+        self._active = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._clock_origin = 0.0
+        self._clock_frames = 0
+        self._paused_lead = 0.0
+
+    async def open(self):
+        await self.sink.open()
+        self._task = asyncio.create_task(self._pump())
+
+    async def play(self, source: str, offset: float = 0.0,
+                   pipeline: Optional[PcmPipeline] = None):
+        """بدء تشغيل مصدر جديد (يستبدل الحالي دون إغلاق المستقبل)
+
+        pipeline: فك ترميز جاهز مسبقاً (من التحميل المسبق) بدلاً من بدء واحد جديد.
+        """
+        if pipeline is None:
+            pipeline = PcmPipeline(source, offset)
+            await pipeline.start()
+        lead = self._lead()
+        await self._replace_pipeline(pipeline)
+        self._reset_clock(lead)
+        self._active.set()
+
+    def pause(self):
+        self._paused_lead = self._lead()
+        self._active.clear()
+
+    def resume(self):
+        if self.pipeline:
+            self._reset_clock(self._paused_lead)
+            self._active.set()
+
+    async def seek(self, offset: float):
+        """إعادة تشغيل المصدر الحالي من موضع محدد"""
+        if not self.pipeline:
+            return
+        was_active = self._active.is_set()
+        pipeline = PcmPipeline(self.pipeline.source, offset, self.pipeline.headers,
+                               self.pipeline.follow)
+        await pipeline.start()
+        await self.play(pipeline.source, offset, pipeline)
+        if not was_active:
+            self.pause()
+
+    @property
+    def paused(self) -> bool:
+        return self.pipeline is not None and not self._active.is_set()
+
+    @property
+    def station(self) -> Optional[str]:
+        """مفتاح المحطة التي يُقرأ منها البث (None لفك ترميز خاص بالمجموعة)"""
+        if isinstance(self.pipeline, StationReader):
+            return self.pipeline.station.key
+        return None
+
+    @property
+    def position(self) -> float:
+        """موضع الصوت المسموع حالياً في الأغنية"""
+        if not self.pipeline:
+            return 0.0
+        return max(self.pipeline.offset, self.pipeline.position - self._lead())
+
+    def _lead(self) -> float:
+        """مدة الإطارات المرسلة مسبقاً للتخزين المؤقت ولم تُسمع بعد"""
+        if not self.realtime:
+            return 0.0
+        if not self._active.is_set():
+            return self._paused_lead
+        sent = (self.frames - self._clock_frames) * FRAME_SECONDS
+        elapsed = time.monotonic() - self._clock_origin
+        return min(max(0.0, sent - elapsed), STREAM_PREBUFFER_MS / 1000)
+
+    def stats(self) -> Dict:
+        """إحصائيات البث: الإطارات، ووقت المعالج لفك الترميز والإرسال"""
+        decoder_cpu = self._decoder_cpu + (self.pipeline.cpu_seconds() if self.pipeline else 0)
+        audio_seconds = self.frames * FRAME_SECONDS
+        return {
+            'frames': self.frames,
+            'position': self.position,
+            'decoder_cpu': decoder_cpu,
+            'pump_cpu': self.pump_cpu,
+            'cpu_per_audio_second': (decoder_cpu + self.pump_cpu) / audio_seconds if audio_seconds else 0.0,
+        }
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+        await self._replace_pipeline(None)
+        await self.sink.close()
+
+    async def _replace_pipeline(self, pipeline: Optional[PcmPipeline]):
+        old, self.pipeline = self.pipeline, pipeline
+        if old:
+            self._decoder_cpu += old.cpu_seconds()
+            await old.close()
+
+    def _reset_clock(self, lead: float = 0.0):
+        """بدء حساب التوقيت من الآن مع احتساب ما في التخزين المؤقت مسبقاً"""
+        self._clock_origin = time.monotonic()
+        self._clock_frames = self.frames - round(lead / FRAME_SECONDS)
+
+    async def _pump(self):
+        prebuffer_frames = int(STREAM_PREBUFFER_MS / 1000 / FRAME_SECONDS)
+
+        while True:
+            await self._active.wait()
+            pipeline = self.pipeline
+
+            started = time.thread_time()
+            frame = await pipeline.read_frame()
+
+            if pipeline is not self.pipeline:
+                continue  # تم تبديل المصدر أثناء القراءة
+
+            if frame is None:
+                await self._replace_pipeline(None)
+                self._active.clear()
+                self.on_end(self.chat_id)
+                continue
+
+            await self.sink.write(frame)
+            self.frames += 1
+            self.pump_cpu += time.thread_time() - started
+
+            if self.realtime:
+                # الإرسال بسرعة التشغيل الفعلية مع تخزين مؤقت بسيط مسبق
+                due = self._clock_origin + (
+                    self.frames - self._clock_frames - prebuffer_frames
+                ) * FRAME_SECONDS
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+
+# ══════════════════════════════════════════════════════════════
+#                    البث المشترك (المحطات)
+# ══════════════════════════════════════════════════════════════
+
+class Station:
+    """أغنية واحدة تُفك مرة واحدة وتُبث لكل المجموعات المستمعة لها
+
+    الإطارات المفكوكة تُحفظ في مخزن دائري، ولكل مجموعة مؤشر قراءة خاص بها
+    (StationReader). لا يوجد بث خاص بالمحطة: أول مستمع يطلب إطاراً لم يُفك
+    بعد يفكه للجميع، فيبقى فك الترميز بسرعة التشغيل الفعلية ويتوقف إذا
+    توقف كل المستمعين. المستمع المتأخر بأكثر من سعة المخزن يقفز لأقدم إطار
+    ما زال فيه.
+    """
+
+    def __init__(self, key: str, pipeline: PcmPipeline, capacity: int):
+        self.key = key
+        self.pipeline = pipeline
+        self.capacity = capacity
+        self.head = 0  # رقم الإطار التالي الذي سيُفك
+        self.ended = False
+        self.readers = 0
+        self.dropped = 0  # إطارات فاتت المستمعين المتأخرين
+        self._frames: List[Optional[bytes]] = [None] * capacity
+        self._decoding: Optional[asyncio.Task] = None
+
+    @property
+    def oldest(self) -> int:
+        """رقم أقدم إطار ما زال في المخزن"""
+        return max(0, self.head - self.capacity)
+
+    def position_at(self, seq: int) -> float:
+        return self.pipeline.offset + seq * FRAME_SECONDS
+
+    async def frame(self, seq: int) -> Tuple[int, Optional[bytes]]:
+        """الإطار رقم seq، أو أقدم إطار متاح إذا خرج من المخزن (None عند نهاية الأغنية)"""
+        while seq >= self.head:
+            if self.ended:
+                return seq, None
+            if self._decoding is None:
+                self._decoding = asyncio.create_task(self._decode())
+            # فك الإطار مشترك: إلغاء انتظار مستمع واحد لا يلغيه للباقين
+            await asyncio.shield(self._decoding)
+
+        seq = max(seq, self.oldest)
+        return seq, self._frames[seq % self.capacity]
+
+    async def _decode(self):
+        try:
+            frame = await self.pipeline.read_frame()
+        except Exception as e:
+            logger.debug(f"خطأ في فك ترميز المحطة {self.key}: {e}")
+            frame = None
+        self._decoding = None
+
+        if frame is None:
+            self.ended = True
+        else:
+            self._frames[self.head % self.capacity] = frame
+            self.head += 1
+
+    async def close(self):
+        self.ended = True
+        await self.pipeline.close()
+
+
+class StationReader:
+    """مؤشر قراءة مجموعة واحدة في محطة، بنفس واجهة PcmPipeline
+
+    يبدأ من آخر إطار مفكوك (ما تبثه المحطة الآن)، فيُعطى لـ AudioStream
+    مكان فك الترميز الخاص بالمجموعة دون أي تغيير في البث.
+    """
+
+    def __init__(self, hub: "StationHub", station: Station, spec: PcmPipeline):
+        self.station = station
+        self.source = spec.source
+        self.headers = spec.headers
+        self.follow = spec.follow
+        self.samples = 0
+        self._hub = hub
+        self._cursor = station.head
+        self.offset = station.position_at(self._cursor)
+        self._closed = False
+
+    async def read_frame(self) -> Optional[bytes]:
+        seq, frame = await self.station.frame(self._cursor)
+        if seq > self._cursor:
+            # المستمع تأخر عن المخزن: الإطارات الفائتة تُحسب من الموضع
+            self.station.dropped += seq - self._cursor
+            self.samples += (seq - self._cursor) * FRAME_SAMPLES
+
+        if frame is not None:
+            self._cursor = seq + 1
+            self.samples += FRAME_SAMPLES
+        return frame
+
+    @property
+    def position(self) -> float:
+        return self.offset + self.samples / SAMPLE_RATE
+
+    def cpu_seconds(self) -> float:
+        return 0.0  # فك الترميز يُحسب على المحطة وليس على كل مستمع
+
+    async def close(self):
+        if not self._closed:
+            self._closed = True
+            await self._hub.detach(self.station)
+
+
+class StationHub:
+    """المحطات المفتوحة في هذه العملية (مشتركة بين محركات بث كل الحسابات)
+
+    كل أغنية تبثها محطة لها مفتاح خاص، فكل المجموعات التي تطلب نفس المفتاح
+    تقرأ من فك ترميز واحد، وتُغلق المحطة عند مغادرة آخر مستمع لها.
+    """
+
+    def __init__(self, buffer_ms: int = STATION_BUFFER_MS):
+        self.capacity = max(1, round(buffer_ms / 1000 / FRAME_SECONDS))
+        self.stations: Dict[str, Station] = {}
+        self._decoder_cpu = 0.0
+        self._dropped = 0
+        self._lock = asyncio.Lock()
+
+    async def tune(self, key: str, pipeline: PcmPipeline) -> StationReader:
+        """مؤشر قراءة من المحطة key عند ما تبثه الآن
+
+        المحطة تُفتح من pipeline إذا لم تكن مفتوحة (ويُشغل إذا لم يبدأ بعد)،
+        وإلا يُغلق pipeline ويسمع المستمع الجديد نفس ما يسمعه الباقون.
+        """
+        async with self._lock:
+            station = self.stations.get(key)
+            if station is None:
+                if pipeline.process is None:
+                    await pipeline.start()
+                station = Station(key, pipeline, self.capacity)
+                self.stations[key] = station
+            else:
+                await pipeline.close()
+            station.readers += 1
+        return StationReader(self, station, pipeline)
+
+    async def detach(self, station: Station):
+        station.readers -= 1
+        if station.readers > 0 or self.stations.get(station.key) is not station:
+            return
+        del self.stations[station.key]
+        self._decoder_cpu += station.pipeline.cpu_seconds()
+        self._dropped += station.dropped
+        await station.close()
+
+    def stats(self) -> Dict:
+        """عدد المحطات والمستمعين، ووقت المعالج لفك ترميز كل المحطات"""
+        return {
+            'stations': len(self.stations),
+            'listeners': sum(station.readers for station in self.stations.values()),
+            'decoder_cpu': self._decoder_cpu + sum(
+                station.pipeline.cpu_seconds() for station in self.stations.values()
+            ),
+            'dropped_frames': self._dropped + sum(
+                station.dropped for station in self.stations.values()
+            ),
+        }
+
+
+# ══════════════════════════════════════════════════════════════
+#                    محركات البث
+# ══════════════════════════════════════════════════════════════
+
+class StreamBackend(ABC):
+    """واجهة محرك البث: بث واحد لكل مجموعة"""
+
+    realtime = True
+
+    def __init__(self):
+        self.streams: Dict[int, AudioStream] = {}
+        self.on_stream_end: Optional[Callable[[int], None]] = None
+        # تُستبدل بمحطات مشتركة بين كل محركات العملية (AssistantPool)
+        self.stations = StationHub()
+
+    async def start(self):
+        """تهيئة المحرك (بعد تشغيل الحساب المساعد)"""
+
+    @abstractmethod
+    def _create_sink(self, chat_id: int) -> Sink:
+        ...
+
+    async def _connect(self, chat_id: int, sink: Sink):
+        """ربط المستقبل بالمكالمة الصوتية"""
+
+    async def _disconnect(self, chat_id: int):
+        """فصل المستقبل عن المكالمة الصوتية"""
+
+    async def join(self, chat_id: int):
+        """الانضمام للمكالمة وتجهيز البث"""
+        if chat_id in self.streams:
+            return
+
+        stream = AudioStream(chat_id, self._create_sink(chat_id), self._ended, self.realtime)
+        await stream.open()
+        try:
+            await self._connect(chat_id, stream.sink)
+        except Exception:
+            await stream.close()
+            raise
+        self.streams[chat_id] = stream
+
+    async def play(self, chat_id: int, source: str, offset: float = 0.0,
+                   pipeline: Optional[PcmPipeline] = None, station: Optional[str] = None):
+        """station: مفتاح أغنية محطة مشتركة، فتُقرأ إطاراتها بدلاً من فك ترميز خاص"""
+        await self.join(chat_id)
+        if station:
+            pipeline = await self.stations.tune(station, pipeline or PcmPipeline(source, offset))
+        await self.streams[chat_id].play(source, offset, pipeline)
+
+    async def pause(self, chat_id: int):
+        if chat_id in self.streams:
+            self.streams[chat_id].pause()
+
+    async def resume(self, chat_id: int):
+        if chat_id in self.streams:
+            self.streams[chat_id].resume()
+
+    async def seek(self, chat_id: int, offset: float):
+        if chat_id in self.streams:
+            await self.streams[chat_id].seek(offset)
+
+    async def leave(self, chat_id: int):
+        stream = self.streams.pop(chat_id, None)
+        if stream:
+            await stream.close()
+            await self._disconnect(chat_id)
+
+    def position(self, chat_id: int) -> Optional[float]:
+        stream = self.streams.get(chat_id)
+        return stream.position if stream else None
+
+    def stats(self, chat_id: int) -> Optional[Dict]:
+        stream = self.streams.get(chat_id)
+        return stream.stats() if stream else None
+
+    def _ended(self, chat_id: int):
+        if self.on_stream_end:
+            self.on_stream_end(chat_id)
+
+
+class NullBackend(StreamBackend):
+    """بث بدون مخرج (للاختبار وقياس استهلاك فك الترميز)"""
+
+    def __init__(self, realtime: bool = True):
+        super().__init__()
+        self.realtime = realtime
+
+    def _create_sink(self, chat_id: int) -> Sink:
+        return NullSink()
+
+
+class FileSinkBackend(StreamBackend):
+    """بث إلى ملفات PCM محلية (ملف لكل مجموعة)"""
+
+    def __init__(self, folder: str = STREAM_SINK_FOLDER, realtime: bool = True):
+        super().__init__()
+        self.folder = folder
+        self.realtime = realtime
+        os.makedirs(folder, exist_ok=True)
+
+    def _create_sink(self, chat_id: int) -> Sink:
+        return FileSink(os.path.join(self.folder, f"{chat_id}.pcm"))
+
+
+class PyTgCallsBackend(StreamBackend):
+    """بث للمكالمات الصوتية عبر py-tgcalls
+
+    الإطارات تُكتب في أنبوب مسمى لكل مجموعة، وpy-tgcalls يقرأ منه PCM خاماً
+    (بدون فك ترميز ثانٍ) ثم يرمزه Opus داخل مكتبة tgcalls.
+    """
+
+    def __init__(self, userbot, folder: str = STREAM_SINK_FOLDER):
+        super().__init__()
+        if PyTgCalls is None:
+            raise RuntimeError("مكتبة py-tgcalls غير مثبتة")
+        self.calls = PyTgCalls(userbot)
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+        @self.calls.on_stream_end()
+        async def _on_stream_end(client, update: Update):
+            # الأنبوب لا يُغلق بين الأغاني، فهذا يعني انقطاع البث
+            logger.warning(f"انقطع البث في المجموعة: {update.chat_id}")
+            await self.leave(update.chat_id)
+            self._ended(update.chat_id)
+
+    async def start(self):
+        await self.calls.start()
+
+    def _create_sink(self, chat_id: int) -> Sink:
+        return FifoSink(os.path.join(self.folder, f"{chat_id}.fifo"))
+
+    async def _connect(self, chat_id: int, sink: Sink):
+        await self.calls.join_group_call(
+            chat_id,
+            AudioPiped(
+                sink.path,
+                HighQualityAudio(),
+                additional_ffmpeg_parameters=' '.join(PCM_FORMAT_ARGS)
+            ),
+            stream_type=StreamType().pulse_stream
+        )
+
+    async def pause(self, chat_id: int):
+        await super().pause(chat_id)
+        if chat_id in self.streams:
+            await self.calls.pause_stream(chat_id)
+
+    async def resume(self, chat_id: int):
+        if chat_id in self.streams:
+            await self.calls.resume_stream(chat_id)
+        await super().resume(chat_id)
+
+    async def _disconnect(self, chat_id: int):
+        try:
+            await self.calls.leave_group_call(chat_id)
+        except Exception as e:
+            logger.debug(f"خطأ في مغادرة المكالمة {chat_id}: {e}")
+
+
+def create_backend(userbot, kind: str = STREAM_BACKEND) -> StreamBackend:
+    """إنشاء محرك البث حسب الإعدادات"""
+    if kind == "null":
+        return NullBackend()
+    if kind == "file":
+        return FileSinkBackend()
+    return PyTgCallsBackend(userbot)
@@ -0,0 +1,117 @@
+"""
+تحميل ملفات تليجرام - Telegram Downloader
+تحميل الملفات الصوتية المرفوعة على أجزاء مع استكمال التحميل المنقطع
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from config import DOWNLOAD_FOLDER, TELEGRAM_DOWNLOAD_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# حجم الجزء في تليجرام (stream_media تحسب الإزاحة بعدد الأجزاء)
+CHUNK_SIZE = 1024 * 1024
+
+
+def telegram_cache_key(file_unique_id: str) -> str:
+    """مفتاح المحتوى لملف تليجرام (ثابت لنفس الملف مهما أعيد إرساله)"""
+    return f"telegram:{file_unique_id}"
+
+
+class TelegramDownloader:
+    """تحميل ملفات تليجرام جزءاً بجزء إلى مسار ثابت لكل ملف
+
+    كل جزء يُكتب على القرص فور وصوله، فيمكن تشغيل الملف أثناء تحميله.
+    عند انقطاع التحميل يُستكمل من آخر جزء كامل بدلاً من البدء من جديد.
+    بعد اكتمال التحميل تُحسب بصمة المحتوى لاكتشاف نفس الملف إذا رُفع من جديد.
+    """
+
+    def __init__(self, client: Client, folder: str = DOWNLOAD_FOLDER,
+                 retries: int = TELEGRAM_DOWNLOAD_RETRIES):
+        self.client = client
+        self.folder = folder
+        self.retries = retries
+
+    def file_path(self, cache_key: str) -> str:
+        """مسار ملف المحتوى (telegram:ID → downloads/telegram-ID)"""
+        return os.path.join(self.folder, cache_key.replace(':', '-', 1))
+
+    async def download(self, song: Dict) -> Dict:
+        """تحميل ملف أغنية مرفوعة كاملاً وإرجاع معلوماته
+
+        يُرفع خطأ إذا لم يكتمل التحميل، أو إذا خالف حجم الملف الحجم المعلن
+        (song['file_size'] عند توفره).
+        """
+        file_path = self.file_path(song['cache_key'])
+
+        attempt = 0
+        while True:
+            try:
+                await self._stream_to_file(song['file_id'], file_path)
+                break
+            except FloodWait as e:
+                # انتظار FloodWait لا يُحسب من محاولات الاستكمال
+                logger.warning(f"انتظار {e.value} ثانية قبل استكمال تحميل {song['title']}")
+                await asyncio.sleep(e.value)
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"انقطع تحميل {song['title']}، استكمال من آخر جزء: {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+                attempt += 1
+
+        # الملف الناقص يبقى على القرص ليُستكمل في المرة القادمة
+        file_size = os.path.getsize(file_path)
+        expected = song.get('file_size')
+        if expected and file_size != expected:
+            raise IOError(f"تحميل ناقص لـ {song['title']}: {file_size} من {expected} بايت")
+
+        return {
+            'title': song['title'],
+            'artist': song.get('artist'),
+            'duration': song.get('duration') or 0,
+            'file_path': file_path,
+            'file_size': file_size,
+            'content_hash': await asyncio.to_thread(self._hash_file, file_path),
+        }
+
+    async def _stream_to_file(self, file_id: str, file_path: str):
+        offset = await asyncio.to_thread(self._resume_offset, file_path)
+        if offset:
+            logger.info(f"استكمال تحميل {file_path} من الجزء {offset}")
+
+        with open(file_path, 'ab') as f:
+            async for chunk in self.client.stream_media(file_id, offset=offset):
+                await asyncio.to_thread(self._write_chunk, f, chunk)
+
+    @staticmethod
+    def _resume_offset(file_path: str) -> int:
+        """عدد الأجزاء الكاملة المحملة مسبقاً (ويُحذف الجزء الناقص الأخير)"""
+        try:
+            size = os.path.getsize(file_path)
+        except FileNotFoundError:
+            return 0
+
+        chunks = size // CHUNK_SIZE
+        if size != chunks * CHUNK_SIZE:
+            os.truncate(file_path, chunks * CHUNK_SIZE)
+        return chunks
+
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _write_chunk(f, chunk: bytes):
+        f.write(chunk)
+        f.flush()
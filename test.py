@@ -78,12 +78,605 @@ try:
     print(f"✅ قائمة التشغيل ({len(playlist)} أغنية)")
     
     # حذف قاعدة البيانات التجريبية
-    os.remove("test.db")
+    db.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists("test.db" + suffix):
+            os.remove("test.db" + suffix)
     print("✅ تنظيف البيانات التجريبية")
     
 except Exception as e:
     print(f"❌ خطأ في قاعدة البيانات: {e}")
 
+print()
+print("🔍 اختبار خطط الاستعلامات (مليون أغنية)...")
+
+try:
+    from database import Database, SCHEMA_MIGRATIONS
+    db = Database("plan_test.db")
+    conn = db.get_connection()
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version == len(SCHEMA_MIGRATIONS):
+        print(f"✅ ترحيل المخطط (الإصدار {version})")
+    else:
+        print(f"❌ ترحيل المخطط: الإصدار {version}")
+
+    # 1000 مجموعة × 1000 أغنية
+    conn.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000)
+        INSERT INTO chats (chat_id, chat_title) SELECT i, 'مجموعة' FROM n
+    """)
+    conn.execute("""
+        INSERT INTO playback_state (chat_id, current_song_id)
+        SELECT chat_id, chat_id * 500 FROM chats
+    """)
+    conn.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000)
+        INSERT INTO songs (chat_id, title, duration, play_count, position)
+        SELECT (i % 1000) + 1, 'أغنية', 180, i % 97, i * 1024 FROM n
+    """)
+    conn.commit()
+    print("✅ إنشاء مليون أغنية")
+
+    # تسجيل الاستعلامات الفعلية التي تنفذها الدوال الأكثر استخداماً
+    queries = []
+    conn.set_trace_callback(queries.append)
+    db.is_chat_active(5)
+    db.get_chat_state(5)
+    db.get_playlist(5)
+    db.get_playlist_page(5, 20, after=20480)
+    db.get_playlist_page(5, 20, before=40960)
+    db.get_next_song(5)
+    db.get_upcoming_songs(5, 2500, 3)
+    db.get_playback_state(5)
+    db.save_positions([(5, 42.5), (6, 10.0)])
+    db.get_autoplay_candidates()
+    db.get_resumable_chats()
+    db.is_public_station(5)
+    db.set_station(6, 5)
+    db.get_station_listeners()
+    db.get_statistics(5)
+    db.get_statistics(None)
+    db.record_statistics([("play", 5, 2500, 1.0, 0, "k", "أغنية", "فنان"),
+                         ("complete", 5, 2500, 1.0, 180, "k", "أغنية", "فنان")])
+    db.remove_song(5, 3)
+    db.move_song(5, 900, 2)
+    db.add_songs_bulk(5, [{'title': 'مستوردة', 'source_url': 'https://youtu.be/x',
+                           'cache_key': 'youtube:x'}], 2000)
+    db.add_cached_media('youtube:x', 'downloads/Youtube-x.mp3', 1024)
+    db.get_cached_media_by_hash('0' * 64)
+    db.alias_cached_media('telegram:x', 'youtube:x')
+    db.get_cached_media('telegram:x')
+    db.shuffle_playlist(5)
+    conn.set_trace_callback(None)
+
+    # أسماء الجداول والأسماء المختصرة المستخدمة في الاستعلامات
+    table_names = {"songs", "s", "statistics", "st", "chats", "c",
+                   "playback_state", "ps", "media_cache"}
+    full_scans = []
+    for sql in queries:
+        if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            continue
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+            detail = row[3]
+            # مسح جدول فعلي (وليس استعلاماً فرعياً) بدون فهرس
+            words = detail.split()
+            if (words[0] == "SCAN" and words[1] in table_names
+                    and "INDEX" not in detail):
+                full_scans.append(f"{detail}: {' '.join(sql.split())[:60]}")
+
+    if full_scans:
+        for scan in full_scans:
+            print(f"❌ مسح كامل للجدول - {scan}")
+    else:
+        print("✅ جميع الاستعلامات تستخدم الفهارس")
+
+    db.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists("plan_test.db" + suffix):
+            os.remove("plan_test.db" + suffix)
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار خطط الاستعلامات: {e}")
+
+print()
+print("🔗 اختبار ربط المحتوى المكرر...")
+
+try:
+    import asyncio
+    import tempfile
+    from database import AsyncDatabase, SONG_READY
+    from audio_cache import AudioCache
+
+    async def check_aliases(folder):
+        db = Database(os.path.join(folder, "alias.db"))
+        conn = db.get_connection()
+        db.add_chat(1, "مجموعة")
+        original = os.path.join(folder, "Youtube-x.mp3")
+        with open(original, "wb") as f:
+            f.write(b"\0" * 1024)
+
+        def ref_count(cache_key):
+            return conn.execute("SELECT ref_count FROM media_cache WHERE cache_key = ?",
+                                (cache_key,)).fetchone()[0]
+
+        db.add_song(chat_id=1, title="رابط", source_type="url", cache_key="youtube:x")
+        db.add_cached_media("youtube:x", original, 1024, content_hash="h")
+        uploads = [db.add_song(chat_id=1, title="ملف", file_id="f", source_type="file",
+                               cache_key="telegram:a") for _ in range(2)]
+        assert ref_count("youtube:x") == 1, "المراجع قبل الربط"
+
+        # أغاني المفتاح البديل تنتقل للملف الأصلي وتُحسب في مراجعه
+        db.alias_cached_media("telegram:a", "youtube:x")
+        for song_id in uploads:
+            row = conn.execute("SELECT cache_key, state, file_path FROM songs WHERE id = ?",
+                               (song_id,)).fetchone()
+            assert tuple(row) == ("youtube:x", SONG_READY, original), tuple(row)
+        assert ref_count("youtube:x") == 3, "المراجع بعد الربط"
+        assert db.get_cached_media("telegram:a")["cache_key"] == "youtube:x", "البحث بالاسم البديل"
+
+        # إضافة جديدة بالمفتاح البديل تشير للملف الأصلي مباشرة
+        db.add_song(chat_id=1, title="ملف", file_id="f", source_type="file", cache_key="telegram:a")
+        assert ref_count("youtube:x") == 4, "المراجع بعد إضافة بالاسم البديل"
+
+        # نسخة جديدة بنفس البصمة: لا تُحذف أثناء تشغيلها، وتُربط بالأصلية بعده
+        duplicate = os.path.join(folder, "telegram-b")
+        with open(duplicate, "wb") as f:
+            f.write(b"\0" * 1024)
+        playing = {"telegram:b"}
+        adb = AsyncDatabase(db)
+        cache = AudioCache(adb, None, is_protected=playing.__contains__)
+        try:
+            result = {"file_path": duplicate, "content_hash": "h"}
+            assert await cache._find_duplicate("telegram:b", result) is None, "ربط ملف قيد التشغيل"
+            assert os.path.exists(duplicate), "حذف ملف قيد التشغيل"
+            playing.clear()
+            assert await cache._find_duplicate("telegram:b", result) == original, "ربط النسخة المكررة"
+            assert not os.path.exists(duplicate), "بقاء النسخة المكررة"
+            assert (await adb.get_cached_media("telegram:b"))["cache_key"] == "youtube:x"
+        finally:
+            adb.close()
+
+    with tempfile.TemporaryDirectory() as folder:
+        asyncio.run(check_aliases(folder))
+    print("✅ ربط المفتاح البديل وعدد المراجع وحماية الملف قيد التشغيل")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار ربط المحتوى: {e!r}")
+
+print()
+print("📍 اختبار حفظ موضع التشغيل...")
+
+try:
+    import asyncio
+    import tempfile
+    from database import AsyncDatabase
+    from position_tracker import PositionTracker
+
+    async def check_positions(folder):
+        db = Database(os.path.join(folder, "positions.db"))
+        for chat_id in (1, 2):
+            db.add_chat(chat_id, "مجموعة")
+            song_id = db.add_song(chat_id=chat_id, title="أغنية", duration=300)
+            db.set_playing(chat_id, song_id, True)
+
+        adb = AsyncDatabase(db)
+        positions = PositionTracker(adb)
+        try:
+            positions.start(1, 30.0)
+            positions.start(2, 5.0)
+            positions.pause(2)
+            paused_at = positions.position(2)
+            await asyncio.sleep(0.2)
+            assert positions.position(1) >= 30.2, "تقدم الموضع أثناء التشغيل"
+            assert positions.position(2) == paused_at, "تجمد الموضع أثناء الإيقاف المؤقت"
+
+            # التقديم يحافظ على الإيقاف المؤقت
+            positions.seek(2, 120.0)
+            assert positions.is_paused(2) and positions.position(2) == 120.0, "التقديم أثناء الإيقاف"
+
+            assert await positions.checkpoint() == 2
+            saved = {chat["chat_id"]: chat["position"] for chat in db.get_resumable_chats()}
+            assert 30.2 <= saved[1] < 31 and saved[2] == 120.0, saved
+
+            # المجموعة المتوقفة لا تُحفظ من جديد حتى يتغير موضعها
+            assert await positions.checkpoint() == 1, "حفظ مجموعة لم يتغير موضعها"
+        finally:
+            adb.close()
+
+    with tempfile.TemporaryDirectory() as folder:
+        asyncio.run(check_positions(folder))
+    print("✅ حفظ الموضع والإيقاف المؤقت والتقديم")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار حفظ موضع التشغيل: {e!r}")
+
+print()
+print("📊 اختبار الإحصائيات بعد حذف الأغنية...")
+
+try:
+    import asyncio
+    import tempfile
+    from database import AsyncDatabase
+    from stats_writer import StatisticsWriter
+
+    async def check_removed_stats(folder):
+        db = Database(os.path.join(folder, "stats.db"))
+        db.add_chat(1, "مجموعة")
+        db.add_song(chat_id=1, title="محذوفة", artist="فنان", duration=180,
+                              cache_key="youtube:x")
+        song = db.get_playlist(1)[0]
+
+        adb = AsyncDatabase(db)
+        writer = StatisticsWriter(adb)
+        try:
+            played_at = writer.record_play(1, song)
+            writer.record_complete(1, song, played_at, 180)
+            db.remove_song(1, 1)  # /remove قبل الحفظ الدوري
+            assert await writer.flush() == 2, "حفظ الأحداث"
+            stats = db.get_statistics(1)
+            assert stats["total_plays"] == 1, stats
+            assert [(s["title"], s["plays"]) for s in stats["top_songs"]] == [("محذوفة", 1)], stats
+            assert [(a["artist"], a["plays"]) for a in stats["top_artists"]] == [("فنان", 1)], stats
+            assert stats["top_songs"][0]["listened"] == stats["total_hours"] * 3600, stats
+        finally:
+            adb.close()
+
+    with tempfile.TemporaryDirectory() as folder:
+        asyncio.run(check_removed_stats(folder))
+    print("✅ الترتيب يطابق الإجماليات حتى لو حُذفت الأغنية قبل الحفظ")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار الإحصائيات: {e!r}")
+
+print()
+print("📝 اختبار استكمال معلومات المقاطع المستوردة...")
+
+try:
+    import asyncio
+    import tempfile
+    from database import AsyncDatabase
+    from radio_manager import RadioManager
+    from streaming import NullBackend
+
+    class StubDownloader:
+        """استخراج معلومات ثابتة (مدة كسرية كما في ساوند كلاود)"""
+
+        async def extract(self, url):
+            return {'title': "أغنية كاملة", 'uploader': "فنان", 'duration': 213.5}
+
+        def shutdown(self):
+            pass
+
+    async def check_resolve(folder):
+        db = Database(os.path.join(folder, "resolve.db"))
+        db.add_chat(1, "مجموعة")
+        song_id = db.add_song(chat_id=1, title="Unknown", duration=0, source_type="url",
+                              source_url="https://soundcloud.com/x", cache_key="soundcloud:x")
+        db.set_playing(1, song_id, True)
+
+        adb = AsyncDatabase(db)
+        radio = RadioManager(None, adb, downloader=StubDownloader(),
+                             backend=NullBackend(realtime=False))
+        try:
+            await radio._resolve_metadata(1, [(song_id, "https://soundcloud.com/x")])
+            status = await radio.get_status(1)
+            assert status["current_song"] == "أغنية كاملة", status
+            assert status["duration"] == "03:33", status
+        finally:
+            adb.close()
+
+    with tempfile.TemporaryDirectory() as folder:
+        asyncio.run(check_resolve(folder))
+    print("✅ المدة الكسرية تُحفظ بالثواني و/status يعمل")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار استكمال المعلومات: {e!r}")
+
+print()
+print("🧹 اختبار حذف الملفات من الذاكرة المؤقتة...")
+
+try:
+    import asyncio
+    import tempfile
+    from database import AsyncDatabase
+    from audio_cache import AudioCache
+
+    async def check_eviction(folder):
+        db = Database(os.path.join(folder, "cache.db"))
+        keys = [f"youtube:{number:03d}" for number in range(120)]
+        for key in keys:
+            file_path = os.path.join(folder, key.replace(":", "-"))
+            with open(file_path, "wb") as f:
+                f.write(b"\0" * 1024)
+            db.add_cached_media(key, file_path, 1024)
+
+        # أقدم 60 ملفاً محمية (أكثر من صفحة مرشحين كاملة) والأحدث هو الجديد
+        protected = set(keys[:60])
+        adb = AsyncDatabase(db)
+        cache = AudioCache(adb, None, max_bytes=100 * 1024, is_protected=protected.__contains__)
+        try:
+            evicted = await cache.enforce_budget(keep=keys[-1])
+            assert evicted == 20, f"عدد الملفات المحذوفة: {evicted}"
+            remaining = {key for key in keys if os.path.exists(os.path.join(folder, key.replace(":", "-")))}
+            assert protected <= remaining and keys[-1] in remaining, "حذف ملف محمي"
+            assert set(keys[60:80]).isdisjoint(remaining), "ترتيب الحذف"
+        finally:
+            adb.close()
+
+    with tempfile.TemporaryDirectory() as folder:
+        asyncio.run(check_eviction(folder))
+    print("✅ الحذف يتجاوز الملفات المحمية إلى ما بعدها")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار حذف الملفات: {e!r}")
+
+print()
+print("♻️ اختبار استكمال التشغيل...")
+
+try:
+    import asyncio
+    import shutil
+    import tempfile
+    from database import AsyncDatabase
+    from radio_manager import RadioManager
+    from streaming import NullBackend
+
+    async def check_resume(folder):
+        audio = os.path.join(folder, "a.wav")
+        with open(audio, "wb") as f:
+            f.write(b"\0" * 1024)
+
+        db = Database(os.path.join(folder, "resume.db"))
+        for chat_id in (1, 2):
+            db.add_chat(chat_id, "مجموعة")
+        playing = db.add_song(chat_id=1, title="تعمل", file_path=audio, duration=180)
+        missing = db.add_song(chat_id=2, title="محذوفة", file_path=os.path.join(folder, "x.mp3"),
+                              duration=180)
+        db.set_playing(1, playing, True)
+        db.set_playing(2, missing, True)
+        db.save_positions([(1, 42.0), (2, 10.0)])
+        db.record_statistics([("play", 1, playing, 1000.0, 0, "تعمل", "تعمل", "غير معروف")])
+
+        adb = AsyncDatabase(db)
+        radio = RadioManager(None, adb, backend=NullBackend(realtime=False))
+        radio.prefetcher.count = 0
+        try:
+            result = await radio.recover_playback()
+            assert (result["resumed"], result["failed"]) == (1, 1), result
+            assert radio.active_calls[1]["played_at"] == 1000.0, "وقت البدء الأصلي"
+            assert not [e for e in radio.stats._events if e[0] == "play"], "تشغيل وهمي في الإحصائيات"
+            assert radio.positions.position(1) >= 42.0, "الموضع المحفوظ"
+            assert 2 not in radio.active_calls, "مجموعة فشل تشغيلها"
+            assert not db.get_playback_state(2)["is_playing"], "حالة المجموعة الفاشلة"
+        finally:
+            for chat_id in list(radio.backend.streams):
+                await radio.backend.leave(chat_id)
+            radio.downloader.shutdown()
+            adb.close()
+
+    if shutil.which("ffmpeg"):
+        with tempfile.TemporaryDirectory() as folder:
+            asyncio.run(check_resume(folder))
+        print("✅ الاستكمال بدون تشغيل وهمي والفشل يوقف المجموعة")
+    else:
+        print("⚠️ FFmpeg غير مثبت: تخطي اختبار استكمال التشغيل")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار استكمال التشغيل: {e!r}")
+
+print()
+print("📥 اختبار تحميل ملفات تليجرام...")
+
+try:
+    import asyncio
+    import tempfile
+    from pyrogram.errors import FloodWait
+    from telegram_download import CHUNK_SIZE, TelegramDownloader
+
+    class StubClient:
+        """عميل يبث ملفاً من الذاكرة، وينفذ الأخطاء المحددة بعد أول جزء"""
+
+        def __init__(self, data, errors):
+            self.data = data
+            self.errors = list(errors)
+
+        async def stream_media(self, file_id, offset=0):
+            position = offset * CHUNK_SIZE
+            while position < len(self.data):
+                yield self.data[position:position + CHUNK_SIZE]
+                position += CHUNK_SIZE
+                if self.errors:
+                    raise self.errors.pop(0)
+
+    async def check_telegram_download():
+        data = os.urandom(CHUNK_SIZE * 2 + 100)
+        with tempfile.TemporaryDirectory() as folder:
+            def song(key, size=len(data)):
+                return {'title': key, 'file_id': key, 'cache_key': f"telegram:{key}",
+                        'file_size': size}
+
+            # FloodWait في آخر محاولة لا يستهلكها والملف يكتمل
+            downloader = TelegramDownloader(
+                StubClient(data, [FloodWait(value=0), FloodWait(value=0)]), folder, retries=0)
+            result = await downloader.download(song("flood"))
+            assert result['file_size'] == len(data), "FloodWait في آخر محاولة"
+            with open(result['file_path'], 'rb') as f:
+                assert f.read() == data, "محتوى الملف بعد الاستكمال"
+
+            # انقطاع بعد نفاد المحاولات: خطأ بدلاً من ملف ناقص
+            downloader = TelegramDownloader(
+                StubClient(data, [ConnectionError(), ConnectionError()]), folder, retries=1)
+            downloader_error = None
+            try:
+                await downloader.download(song("broken"))
+            except ConnectionError as e:
+                downloader_error = e
+            assert downloader_error is not None, "انقطاع بعد نفاد المحاولات"
+
+            # حجم مخالف للحجم المعلن
+            downloader = TelegramDownloader(StubClient(data, []), folder)
+            try:
+                await downloader.download(song("short", len(data) + 1))
+                raise AssertionError("الحجم المخالف لم يُكتشف")
+            except IOError as e:
+                assert "ناقص" in str(e), e
+
+    asyncio.run(check_telegram_download())
+    print("✅ FloodWait لا يستهلك المحاولات والتحميل الناقص يُرفض")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار تحميل ملفات تليجرام: {e!r}")
+
+print()
+print("🔌 اختبار الانضمام عبر عمليات البث...")
+
+try:
+    import asyncio
+    import json
+    from types import SimpleNamespace
+    from assistant_pool import Assistant
+    from streaming import NullBackend
+    from workers import StreamWorker, WorkerPool, encode_message
+
+    class StubStorage:
+        def __init__(self):
+            self.peers = {}
+
+        async def update_peers(self, peers):
+            for peer_id, access_hash, *_ in peers:
+                self.peers[peer_id] = access_hash
+
+    class WorkerClient:
+        """عميل عملية البث: يبدأ بدون peers مثل عميل in_memory جديد"""
+
+        def __init__(self):
+            self.storage = StubStorage()
+
+        async def resolve_peer(self, chat_id):
+            if chat_id not in self.storage.peers:
+                raise KeyError(f"PEER_ID_INVALID {chat_id}")
+            return SimpleNamespace(access_hash=self.storage.peers[chat_id])
+
+    class ControlClient:
+        """عميل الحساب في عملية الأوامر (يعرف access_hash المجموعة)"""
+
+        def __init__(self):
+            self.resolved = 0
+
+        async def resolve_peer(self, chat_id):
+            self.resolved += 1
+            return SimpleNamespace(access_hash=777)
+
+    class CallsBackend(NullBackend):
+        """py-tgcalls وهمي: join_group_call يحل peer المجموعة عبر عميل الحساب"""
+
+        def __init__(self, client):
+            super().__init__(realtime=False)
+            self.client = client
+            self.peers = {}
+
+        async def _connect(self, chat_id, sink):
+            self.peers[chat_id] = await self.client.resolve_peer(chat_id)
+
+    async def check_worker_join():
+        chat_id = -1001234567890
+        worker = StreamWorker(0, "unused.sock")
+        worker.clients["assistant1"] = WorkerClient()
+        calls = worker.backends["assistant1"] = CallsBackend(worker.clients["assistant1"])
+
+        pool = WorkerPool(1, kind="pytgcalls", socket_path="unused.sock")
+        backend = pool.backend("assistant1")
+        control = ControlClient()
+        backend.resolve_peer = Assistant("assistant1", control, backend).resolve_peer
+
+        async def request(chat_id, assistant, op, **args):
+            # الأمر كما يصل لعملية البث بعد ترميزه JSON
+            message = json.loads(encode_message({
+                'id': 1, 'op': op, 'assistant': assistant, 'chat_id': chat_id, 'args': args
+            }))
+            return await worker._execute(message)
+        pool.request = request
+
+        await backend.join(chat_id)
+        assert calls.peers[chat_id].access_hash == 777, "access_hash في عملية البث"
+        await backend.leave(chat_id)
+        await backend.join(chat_id)
+        assert control.resolved == 1, "حل peer المجموعة مرة واحدة"
+        await backend.leave(chat_id)
+
+    asyncio.run(check_worker_join())
+    print("✅ peer المجموعة يصل لعميل عملية البث قبل الانضمام")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار الانضمام عبر عمليات البث: {e!r}")
+
+print()
+print("🎙️ اختبار الحسابات المساعدة...")
+
+try:
+    import asyncio
+    from types import SimpleNamespace
+    from pyrogram.errors import FloodWait
+    from assistant_pool import Assistant, AssistantPool
+    from streaming import NullBackend
+
+    class FloodBackend(NullBackend):
+        """محرك يرد بـ FloodWait على كل انضمام"""
+
+        async def _connect(self, chat_id, sink):
+            raise FloodWait(value=30)
+
+    def stub_client():
+        """عميل بدون اتصال فعلي: حالة الاتصال فقط"""
+        return SimpleNamespace(is_connected=True,
+                               session=SimpleNamespace(is_started=asyncio.Event()))
+
+    async def check_assistants():
+        # حساب واحد: انقطاع قصير لا ينقل المجموعات ولا يستبعد الحساب
+        client = stub_client()
+        client.session.is_started.set()
+        pool = AssistantPool([Assistant("a1", client, NullBackend(realtime=False))])
+        for chat_id in (1, 2):
+            await pool.join(chat_id)
+        client.session.is_started.clear()
+        await pool._disconnected(pool.primary)(client)
+        client.session.is_started.set()
+        await pool._check_disconnect(pool.primary, grace=0)
+        assert sorted(pool.streams) == [1, 2] and pool.primary.available, "انقطاع قصير"
+
+        # انقطاع مستمر على آخر حساب: لا يُستبعد
+        client.session.is_started.clear()
+        await pool._check_disconnect(pool.primary, grace=0)
+        assert sorted(pool.streams) == [1, 2] and pool.primary.available, "آخر حساب"
+        await pool.join(3)
+
+        # انقطاع مستمر مع حساب آخر: المجموعات تنتقل إليه
+        second = stub_client()
+        second.session.is_started.set()
+        pool = AssistantPool([Assistant("a1", client, NullBackend(realtime=False)),
+                              Assistant("a2", second, NullBackend(realtime=False))])
+        for chat_id in range(1, 11):
+            await pool.join(chat_id)
+        await pool._check_disconnect(pool.assistants[0], grace=0)
+        assert not pool.assistants[0].available, "استبعاد الحساب المنقطع"
+        assert len(pool.assistants[1].backend.streams) == 10, "نقل المجموعات"
+
+        # FloodWait على آخر حساب: يُرفع الخطأ والحساب يبقى متاحاً
+        pool = AssistantPool([Assistant("a1", None, FloodBackend(realtime=False))])
+        try:
+            await pool.join(1)
+            raise AssertionError("FloodWait لم يُرفع")
+        except FloodWait:
+            pass
+        assert pool.primary.available and pool.primary.calls == 0, "FloodWait على آخر حساب"
+
+    asyncio.run(check_assistants())
+    print("✅ الانقطاع القصير وآخر حساب متاح وFloodWait")
+
+except Exception as e:
+    print(f"❌ خطأ في اختبار الحسابات المساعدة: {e!r}")
+
 print()
 print("=" * 60)
 print("           ✅ انتهى الاختبار")
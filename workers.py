@@ -0,0 +1,531 @@
+"""
+عمليات البث - Streaming Workers
+تشغيل البث الصوتي في عمليات منفصلة عن عملية أوامر البوت
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from streaming import PcmPipeline, StationHub, StreamBackend, create_backend
+from config import (
+    API_ID, API_HASH, STREAM_BACKEND,
+    WORKER_PROCESSES, WORKER_SOCKET, WORKER_START_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# الأوامر التي تنفذها عملية البث على محركها
+WORKER_OPERATIONS = {'join', 'play', 'pause', 'resume', 'seek', 'leave'}
+
+
+def encode_message(message: Dict) -> bytes:
+    """رسالة واحدة في سطر JSON"""
+    return json.dumps(message, ensure_ascii=False).encode() + b'\n'
+
+
+# ══════════════════════════════════════════════════════════════
+#                    عملية الأوامر
+# ══════════════════════════════════════════════════════════════
+
+class RemoteStream:
+    """صورة بث المجموعة في عملية الأوامر
+
+    الموضع يُحسب محلياً من وقت بدء الأغنية فلا تُسأل عملية البث عنه.
+    pipeline وصف للمصدر فقط (لا يُشغل FFmpeg في هذه العملية).
+    """
+
+    def __init__(self):
+        self.pipeline: Optional[PcmPipeline] = None
+        self.station: Optional[str] = None
+        self._started = time.monotonic()
+        self._paused_at: Optional[float] = None
+
+    def start(self, pipeline: PcmPipeline, station: Optional[str] = None):
+        self.pipeline = pipeline
+        self.station = station
+        self._started = time.monotonic()
+        if self._paused_at is not None:
+            self._paused_at = self._started
+
+    def pause(self):
+        if self._paused_at is None:
+            self._paused_at = time.monotonic()
+
+    def resume(self):
+        if self._paused_at is not None:
+            self._started += time.monotonic() - self._paused_at
+            self._paused_at = None
+
+    @property
+    def paused(self) -> bool:
+        return self.pipeline is not None and self._paused_at is not None
+
+    @property
+    def position(self) -> float:
+        if not self.pipeline:
+            return 0.0
+        now = self._paused_at if self._paused_at is not None else time.monotonic()
+        return self.pipeline.offset + now - self._started
+
+
+class Worker:
+    """عملية بث واحدة من جهة عملية الأوامر"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.ready = asyncio.Event()
+        self.chats: Set[int] = set()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.restarts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.writer is not None
+
+
+class WorkerPool:
+    """تشغيل البث في WORKER_PROCESSES عملية منفصلة
+
+    عملية الأوامر (البوت وقاعدة البيانات والجدولة) ترسل أوامر البث عبر
+    مقبس يونكس، وكل مجموعة تُبث من عملية واحدة (الأقل حملاً عند انضمامها).
+    فك الترميز والإرسال بالزمن الحقيقي لا ينافسان أوامر البوت على نفس المعالج.
+    عملية البث التي تتوقف يُعاد تشغيلها، ومجموعاتها تنتقل لأغنيتها التالية.
+    """
+
+    def __init__(self, count: int = WORKER_PROCESSES, kind: str = STREAM_BACKEND,
+                 socket_path: str = WORKER_SOCKET):
+        self.count = count
+        self.kind = kind
+        self.socket_path = socket_path
+        self.workers: List[Worker] = []
+        self.requests = 0
+        self._assistants: Dict[str, Optional[str]] = {}  # الاسم -> Session String
+        self._backends: Dict[str, "WorkerBackend"] = {}
+        self._owners: Dict[int, Worker] = {}
+        self._ids = itertools.count(1)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._closing = False
+
+    def backend(self, name: str, client: Optional[Client] = None) -> "WorkerBackend":
+        """محرك بث حساب مساعد يعمل داخل عمليات البث"""
+        self._assistants[name] = getattr(client, 'session_string', None)
+        self._backends[name] = WorkerBackend(self, name)
+        return self._backends[name]
+
+    async def start(self):
+        """تشغيل عمليات البث وانتظار جاهزيتها (مرة واحدة لكل الحسابات)"""
+        if self._server:
+            return
+
+        os.makedirs(os.path.dirname(self.socket_path) or '.', exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._accept, self.socket_path)
+
+        self.workers = [Worker(index) for index in range(self.count)]
+        for worker in self.workers:
+            await self._spawn(worker)
+        await asyncio.wait_for(
+            asyncio.gather(*(worker.ready.wait() for worker in self.workers)),
+            WORKER_START_TIMEOUT
+        )
+        logger.info(f"✅ {self.count} عملية بث جاهزة")
+
+    async def close(self):
+        self._closing = True
+        for worker in self.workers:
+            if worker.writer:
+                worker.writer.close()
+            if worker.process and worker.process.returncode is None:
+                worker.process.terminate()
+                await worker.process.wait()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def stats(self) -> List[Dict]:
+        """عدد المجموعات وحالة كل عملية بث"""
+        return [
+            {
+                'worker': worker.index,
+                'pid': worker.process.pid if worker.process else None,
+                'chats': len(worker.chats),
+                'alive': worker.alive,
+                'restarts': worker.restarts,
+            }
+            for worker in self.workers
+        ]
+
+    # ══════════════════════════════════════════════════════════════
+    #                    الأوامر
+    # ══════════════════════════════════════════════════════════════
+
+    async def request(self, chat_id: int, assistant: str, op: str, **args):
+        """تنفيذ أمر بث على عملية المجموعة وانتظار نتيجته"""
+        worker = self._owner(chat_id)
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[request_id] = future
+        self.requests += 1
+
+        worker.writer.write(encode_message({
+            'id': request_id, 'op': op, 'assistant': assistant,
+            'chat_id': chat_id, 'args': args
+        }))
+        await worker.writer.drain()
+        return await future
+
+    def worker_of(self, chat_id: int) -> Optional[int]:
+        worker = self._owners.get(chat_id)
+        return worker.index if worker else None
+
+    def release(self, chat_id: int):
+        worker = self._owners.pop(chat_id, None)
+        if worker:
+            worker.chats.discard(chat_id)
+
+    def _owner(self, chat_id: int) -> Worker:
+        worker = self._owners.get(chat_id)
+        if worker and worker.alive:
+            return worker
+
+        alive = [worker for worker in self.workers if worker.alive]
+        if not alive:
+            raise ConnectionError("لا توجد عملية بث متاحة")
+        worker = min(alive, key=lambda worker: len(worker.chats))
+        self._owners[chat_id] = worker
+        worker.chats.add(chat_id)
+        return worker
+
+    # ══════════════════════════════════════════════════════════════
+    #                    الاتصال بعمليات البث
+    # ══════════════════════════════════════════════════════════════
+
+    async def _spawn(self, worker: Worker):
+        worker.process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'workers', str(worker.index), self.socket_path,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        hello = json.loads(await reader.readline())
+        worker = self.workers[hello['worker']]
+
+        # الإعدادات تُرسل عبر المقبس (وليس سطر الأوامر) حتى لا تظهر الجلسات في قائمة العمليات
+        writer.write(encode_message({'kind': self.kind, 'assistants': self._assistants}))
+        await writer.drain()
+        if not await reader.readline():
+            return
+
+        worker.writer = writer
+        worker.ready.set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._dispatch(worker, json.loads(line))
+        finally:
+            await self._lost(worker)
+
+    def _dispatch(self, worker: Worker, message: Dict):
+        if 'event' in message:
+            self._backends[message['assistant']].on_event(message)
+            return
+
+        future = worker.pending.pop(message['id'], None)
+        if not future or future.done():
+            return
+
+        if message.get('error') == 'FloodWait':
+            future.set_exception(FloodWait(value=message['value']))
+        elif 'error' in message:
+            future.set_exception(RuntimeError(f"{message['error']}: {message['message']}"))
+        else:
+            future.set_result(message.get('result'))
+
+    async def _lost(self, worker: Worker):
+        """توقفت عملية بث: مجموعاتها تنتقل للتالية، والعملية يُعاد تشغيلها"""
+        worker.writer = None
+        worker.ready.clear()
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("توقفت عملية البث"))
+        worker.pending.clear()
+
+        chat_ids = list(worker.chats)
+        for chat_id in chat_ids:
+            self.release(chat_id)
+        dropped = {backend: backend.drop(chat_ids) for backend in self._backends.values()}
+
+        if self._closing:
+            return
+        logger.error(f"توقفت عملية البث {worker.index} ({len(chat_ids)} مجموعة)، إعادة تشغيلها...")
+        if worker.process:
+            await worker.process.wait()
+        worker.restarts += 1
+        await self._spawn(worker)
+
+        # الانتقال للأغنية التالية بعد جاهزية العملية الجديدة (وإلا لا عملية تستقبلها)
+        try:
+            await asyncio.wait_for(worker.ready.wait(), WORKER_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"عملية البث {worker.index} لم تجهز بعد إعادة تشغيلها")
+        for backend, chat_ids in dropped.items():
+            backend.ended(chat_ids)
+
+
+class WorkerBackend:
+    """محرك بث حساب مساعد يعمل داخل عمليات البث (بنفس واجهة StreamBackend)
+
+    كل أمر يُرسل لعملية المجموعة، والفك المسبق للأغنية التالية لا يعبر
+    بين العمليات: عملية البث تبدأ فك الترميز من نفس المصدر والموضع.
+    المحطات المشتركة تُفتح داخل كل عملية بث فيها مستمعون لها.
+    عميل الحساب في عملية البث يبدأ بدون peers محفوظة، فيُرسل مع الانضمام
+    access_hash المجموعة من ذاكرة الحساب هنا (resolve_peer).
+    """
+
+    def __init__(self, workers: WorkerPool, assistant: str):
+        self.workers = workers
+        self.assistant = assistant
+        self.streams: Dict[int, RemoteStream] = {}
+        self.on_stream_end = None
+        self.resolve_peer: Optional[Callable[[int], Awaitable[Any]]] = None
+
+    async def start(self):
+        await self.workers.start()
+
+    async def join(self, chat_id: int):
+        if chat_id in self.streams:
+            return
+        try:
+            args = {}
+            if self.resolve_peer and self.workers.kind == "pytgcalls":
+                peer = await self.resolve_peer(chat_id)
+                # المجموعات الخارقة والقنوات فقط تحتاج access_hash
+                args['access_hash'] = getattr(peer, 'access_hash', None)
+            await self._request(chat_id, 'join', **args)
+        except Exception:
+            self.workers.release(chat_id)
+            raise
+        self.streams[chat_id] = RemoteStream()
+
+    async def play(self, chat_id: int, source: str, offset: float = 0.0,
+                   pipeline: Optional[PcmPipeline] = None, station: Optional[str] = None):
+        if pipeline:
+            await pipeline.close()
+        else:
+            pipeline = PcmPipeline(source, offset)
+
+        await self.join(chat_id)
+        started_at = await self._request(chat_id, 'play', source=pipeline.source,
+                                         offset=pipeline.offset, headers=pipeline.headers,
+                                         follow=pipeline.follow, station=station)
+        if started_at is not None:
+            # مستمع محطة مفتوحة يبدأ من موضعها الحالي في عملية البث
+            pipeline = PcmPipeline(pipeline.source, started_at, pipeline.headers, pipeline.follow)
+        self.streams[chat_id].start(pipeline, station)
+
+    async def pause(self, chat_id: int):
+        if chat_id in self.streams:
+            await self._request(chat_id, 'pause')
+            self.streams[chat_id].pause()
+
+    async def resume(self, chat_id: int):
+        if chat_id in self.streams:
+            await self._request(chat_id, 'resume')
+            self.streams[chat_id].resume()
+
+    async def seek(self, chat_id: int, offset: float):
+        stream = self.streams.get(chat_id)
+        if stream and stream.pipeline:
+            await self._request(chat_id, 'seek', offset=offset)
+            current = stream.pipeline
+            stream.start(PcmPipeline(current.source, offset, current.headers, current.follow))
+
+    async def leave(self, chat_id: int):
+        if self.streams.pop(chat_id, None) is None:
+            return
+        try:
+            await self._request(chat_id, 'leave')
+        except ConnectionError:
+            pass  # عملية البث توقفت وغادرت المكالمة معها
+        finally:
+            self.workers.release(chat_id)
+
+    def position(self, chat_id: int) -> Optional[float]:
+        stream = self.streams.get(chat_id)
+        return stream.position if stream else None
+
+    def stats(self, chat_id: int) -> Optional[Dict]:
+        stream = self.streams.get(chat_id)
+        if not stream:
+            return None
+        return {'position': stream.position, 'worker': self.workers.worker_of(chat_id)}
+
+    def drop(self, chat_ids: List[int]) -> List[int]:
+        """مجموعات توقفت عملية بثها: حذف صورة بثها وإرجاع ما كان منها على هذا الحساب"""
+        return [chat_id for chat_id in chat_ids if self.streams.pop(chat_id, None) is not None]
+
+    def ended(self, chat_ids: List[int]):
+        """انتهاء الأغنية الحالية للمجموعات (بعد جاهزية عملية بث تستقبلها)"""
+        if self.on_stream_end:
+            for chat_id in chat_ids:
+                self.on_stream_end(chat_id)
+
+    def on_event(self, message: Dict):
+        chat_id = message['chat_id']
+        if message['event'] == 'stream_end' and chat_id in self.streams:
+            # المحرك غادر المكالمة بنفسه (انقطاع البث)
+            if not message['joined']:
+                self.streams.pop(chat_id)
+                self.workers.release(chat_id)
+            if self.on_stream_end:
+                self.on_stream_end(chat_id)
+
+    async def _request(self, chat_id: int, op: str, **args):
+        return await self.workers.request(chat_id, self.assistant, op, **args)
+
+
+# ══════════════════════════════════════════════════════════════
+#                    عملية البث
+# ══════════════════════════════════════════════════════════════
+
+class StreamWorker:
+    """عملية بث: محرك بث لكل حساب مساعد، وتنفذ الأوامر الواردة من عملية الأوامر"""
+
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self.backends: Dict[str, StreamBackend] = {}
+        self.clients: Dict[str, Client] = {}
+        self.stations = StationHub()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def run(self):
+        reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        self._send({'worker': self.index})
+        config = json.loads(await reader.readline())
+
+        for name, session_string in config['assistants'].items():
+            await self._start_backend(name, session_string, config['kind'])
+        self._send({'ready': True})
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._handle(json.loads(line)))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            # عملية الأوامر توقفت: مغادرة كل المكالمات
+            for backend in self.backends.values():
+                for chat_id in list(backend.streams):
+                    await backend.leave(chat_id)
+            for client in self.clients.values():
+                await client.stop()
+
+    async def _start_backend(self, name: str, session_string: Optional[str], kind: str):
+        client = None
+        if kind == "pytgcalls":
+            client = Client(
+                f"radio_worker{self.index}_{name}",
+                api_id=API_ID,
+                api_hash=API_HASH,
+                session_string=session_string,
+                in_memory=True
+            )
+            await client.start()
+            self.clients[name] = client
+
+        backend = create_backend(client, kind)
+        backend.on_stream_end = self._stream_ended(name, backend)
+        backend.stations = self.stations
+        await backend.start()
+        self.backends[name] = backend
+
+    async def _handle(self, message: Dict):
+        reply = {'id': message['id']}
+        try:
+            result = await self._execute(message)
+            if result is not None:
+                reply['result'] = result
+        except FloodWait as e:
+            reply.update(error='FloodWait', value=e.value)
+        except Exception as e:
+            reply.update(error=type(e).__name__, message=str(e))
+        self._send(reply)
+
+    async def _execute(self, message: Dict):
+        op, chat_id, args = message['op'], message['chat_id'], message['args']
+        if op not in WORKER_OPERATIONS:
+            raise ValueError(f"أمر غير معروف: {op}")
+        backend = self.backends[message['assistant']]
+
+        if op == 'join' and args.get('access_hash') is not None:
+            await self._seed_peer(message['assistant'], chat_id, args['access_hash'])
+
+        if op == 'play':
+            pipeline = PcmPipeline(args['source'], args['offset'], args['headers'], args['follow'])
+            station = args['station']
+            if not station:
+                await pipeline.start()
+            await backend.play(chat_id, args['source'], args['offset'], pipeline, station)
+            if station:
+                # موضع بداية المستمع في المحطة (لصورة البث في عملية الأوامر)
+                return backend.streams[chat_id].pipeline.offset
+        elif op == 'seek':
+            await backend.seek(chat_id, args['offset'])
+        else:
+            await getattr(backend, op)(chat_id)
+
+    async def _seed_peer(self, name: str, chat_id: int, access_hash: int):
+        """حفظ peer المجموعة في ذاكرة عميل الحساب (في الذاكرة فقط) قبل الانضمام
+
+        بدونها يحاول py-tgcalls حل معرف المجموعة الخارقة ويفشل لغياب access_hash.
+        """
+        client = self.clients.get(name)
+        if client:
+            await client.storage.update_peers([(chat_id, access_hash, "supergroup", None, None)])
+
+    def _stream_ended(self, name: str, backend: StreamBackend):
+        def ended(chat_id: int):
+            self._send({
+                'event': 'stream_end', 'assistant': name, 'chat_id': chat_id,
+                'joined': chat_id in backend.streams
+            })
+        return ended
+
+    def _send(self, message: Dict):
+        self._writer.write(encode_message(message))
+
+
+def run_worker(index: int, socket_path: str):
+    """نقطة بدء عملية البث"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker{index} - %(name)s - %(levelname)s - %(message)s'
+    )
+    try:
+        asyncio.run(StreamWorker(index, socket_path).run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run_worker(int(sys.argv[1]), sys.argv[2])